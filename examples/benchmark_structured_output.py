@@ -0,0 +1,93 @@
+"""
+Benchmark the per-step cost of structured output: building the runnable and parsing a response.
+
+Compares calling llm.with_structured_output(AgentOutput) every step with the cached
+StructuredOutput the agent uses. No API calls are made; the response is a recorded tool call.
+
+	python examples/benchmark_structured_output.py
+	python examples/benchmark_structured_output.py --model anthropic --runs 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from mlx_use.agent.structured_output import StructuredOutput
+from mlx_use.agent.views import AgentOutput
+from mlx_use.controller.service import Controller
+
+TOOL_ARGS = {
+	'current_state': {
+		'evaluation_previous_goal': 'Success - the Save dialog is open',
+		'memory': 'Typed the note title, the dialog asks where to save it',
+		'next_goal': 'Confirm the dialog',
+	},
+	'action': [
+		{'input_text': {'index': 12, 'text': 'Groceries', 'submit': False}},
+		{'click_element': {'index': 14, 'action': 'AXPress'}},
+	],
+}
+
+
+def _llm(family: str) -> Any:
+	if family == 'anthropic':
+		from langchain_anthropic import ChatAnthropic
+
+		return ChatAnthropic(model='claude-3-5-sonnet-20241022', api_key='benchmark'), None
+	from langchain_openai import ChatOpenAI
+
+	return ChatOpenAI(model='gpt-4o', api_key='benchmark'), 'function_calling'
+
+
+def _time(fn: Callable[[], Any], runs: int) -> List[float]:
+	times = []
+	for _ in range(runs):
+		start = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - start)
+	return times
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--model', choices=['openai', 'anthropic'], default='openai')
+	parser.add_argument('--runs', type=int, default=200)
+	args = parser.parse_args()
+
+	llm, method = _llm(args.model)
+	output_model = AgentOutput.type_with_custom_actions(Controller().registry.create_action_model())
+	kwargs = {'method': method} if method is not None else {}
+	response = AIMessage(content='', tool_calls=[{'name': output_model.__name__, 'args': TOOL_ARGS, 'id': 'call_1'}])
+
+	# Before: a new runnable every step, parsed by its own PydanticToolsParser
+	def per_step() -> Any:
+		runnable = llm.with_structured_output(output_model, include_raw=True, **kwargs)
+		return runnable.steps[-1].invoke({'raw': response})['parsed']
+
+	cached = StructuredOutput(llm, output_model, method)
+
+	# After: the runnable built once, its output validated with the TypeAdapter
+	def cached_step() -> Any:
+		return cached.parse(cached.runnable.steps[-1].invoke({'raw': response}))
+
+	assert per_step() == cached_step(), 'both paths must parse to the same output'
+	before = _time(per_step, args.runs)
+	after = _time(cached_step, args.runs)
+	build = _time(lambda: llm.with_structured_output(output_model, include_raw=True, **kwargs), args.runs)
+
+	print(f'{args.model}: {len(output_model.model_json_schema()["$defs"])} schema definitions, {args.runs} runs')
+	print(f'build runnable:     mean {statistics.mean(build) * 1000:.2f} ms (once per agent when cached)')
+	print(f'per step, uncached: mean {statistics.mean(before) * 1000:.2f} ms, min {min(before) * 1000:.2f} ms')
+	print(f'per step, cached:   mean {statistics.mean(after) * 1000:.2f} ms, min {min(after) * 1000:.2f} ms')
+	print(f'saved per step:     {(statistics.mean(before) - statistics.mean(after)) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+	main()
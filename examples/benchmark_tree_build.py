@@ -0,0 +1,276 @@
+"""
+Benchmark MacUITreeBuilder.build_tree -> get_clickable_elements_string on a recorded tree.
+
+Runs anywhere (no macOS needed) through the in-memory accessibility backend:
+
+	python examples/benchmark_tree_build.py --nodes 5000 --latency 0.0001
+	python examples/benchmark_tree_build.py --tree mail.json --latency 0.0002
+	python examples/benchmark_tree_build.py --incremental  # one value change per step
+	python examples/benchmark_tree_build.py --delta  # size of "changes since last step" state messages
+	python examples/benchmark_tree_build.py --nodes 50000 --memory  # memory retained by the built tree, vs dataclass nodes
+	python examples/benchmark_tree_build.py --prune  # skip elements outside the window
+	python examples/benchmark_tree_build.py --table 2000 --table-rows 50  # windowed rows of a large table
+	python examples/benchmark_tree_build.py --max-state-tokens 4000  # token-budgeted element list
+	python examples/benchmark_tree_build.py --encoding compact  # abbreviated element lines
+	python examples/benchmark_tree_build.py --compare-encodings mail.json notes.json  # verbose vs compact tokens per tree
+
+Record a tree on a Mac with:
+
+	python examples/benchmark_tree_build.py --record <pid> --tree mail.json
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from types import FunctionType
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlx_use.mac import tree as tree_module
+from mlx_use.mac.diff import TreeSnapshot, diff_snapshots
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
+from mlx_use.mac.recorded import InMemoryBackend, RecordedElement, record_application, save_recording, synthetic_application
+from mlx_use.mac.serializer import StateSerializer
+from mlx_use.mac.tree import MacUITreeBuilder
+
+
+def _first_leaf(element: RecordedElement) -> RecordedElement:
+	while element.children:
+		element = element.children[0]
+	return element
+
+
+async def benchmark(
+	backend: InMemoryBackend,
+	pid: int,
+	runs: int,
+	batch_attributes: bool,
+	incremental: bool,
+	delta: bool,
+	prune: bool,
+	table_rows: Optional[int] = None,
+	max_state_tokens: Optional[int] = None,
+	encoding: PromptEncoding = 'verbose',
+) -> None:
+	builder = MacUITreeBuilder(
+		backend=backend,
+		batch_attributes=batch_attributes,
+		incremental=incremental,
+		prune_offscreen=prune,
+		table_rows=table_rows,
+	)
+	build_times, serialize_times = [], []
+	diff_times, delta_sizes = [], []
+	state = ''
+	snapshot = None
+	changed = _first_leaf(backend.applications[pid])
+	for run in range(runs):
+		if (incremental or delta) and run:
+			# Simulate an action that changes a single widget between steps
+			changed.attributes['AXValue'] = f'value {run}'
+			backend.post_notification(changed, 'AXValueChanged')
+		backend.reset_stats()
+		start = time.perf_counter()
+		root = await builder.build_tree(pid)
+		build_times.append(time.perf_counter() - start)
+		if root is None:
+			print('❌ build_tree returned None')
+			return
+		start = time.perf_counter()
+		serializer = StateSerializer(max_state_tokens, encoding=encoding)
+		state = serializer.serialize(root, focus=builder.focused_node)
+		serialize_times.append(time.perf_counter() - start)
+		if delta:
+			start = time.perf_counter()
+			previous, snapshot = snapshot, TreeSnapshot.from_tree(root, encoding)
+			if previous is not None:
+				delta_sizes.append(len(diff_snapshots(previous, snapshot).to_string()))
+			diff_times.append(time.perf_counter() - start)
+
+	print(f'AX calls per build: {backend.total_calls} ({dict(backend.calls)})')
+	stats = builder.stats
+	print(f'round trips: {stats.round_trips} for {stats.nodes} nodes ({stats.round_trips_saved} saved by batching)')
+	if prune:
+		print(f'pruned:      {stats.pruned} offscreen elements')
+	print(f'build_tree:  mean {statistics.mean(build_times) * 1000:.1f} ms, min {min(build_times) * 1000:.1f} ms')
+	print(f'serialize:   mean {statistics.mean(serialize_times) * 1000:.1f} ms, min {min(serialize_times) * 1000:.1f} ms')
+	print(f'state size:  {len(state)} chars, {state.count(chr(10)) + 1 if state else 0} lines, ~{serializer.tokens} tokens')
+	if serializer.omitted:
+		print(f'budget:      {serializer.omitted} elements omitted to fit {max_state_tokens} tokens')
+	if delta_sizes:
+		mean_size = statistics.mean(delta_sizes)
+		print(
+			f'delta state: mean {mean_size:.0f} chars vs {len(state)} chars for the full state '
+			f'({mean_size / len(state):.3%} of its size)'
+		)
+		print(f'snapshot+diff: mean {statistics.mean(diff_times) * 1000:.1f} ms')
+
+
+async def compare_encodings(backends: List[tuple]) -> None:
+	"""Tokens of the full element list of each tree in the verbose and the compact encoding"""
+	totals = {'verbose': 0, 'compact': 0}
+	for name, backend in backends:
+		root = await MacUITreeBuilder(backend=backend).build_tree(next(iter(backend.applications)))
+		if root is None:
+			print(f'❌ {name}: build_tree returned None')
+			continue
+		tokens = {}
+		for encoding in totals:
+			serializer = StateSerializer(encoding=encoding)
+			serializer.serialize(root)
+			tokens[encoding] = serializer.tokens
+			totals[encoding] += serializer.tokens
+		saved = 1 - tokens['compact'] / max(tokens['verbose'], 1)
+		print(
+			f'{name}: {len(serializer.nodes)} lines, verbose ~{tokens["verbose"]} tokens, '
+			f'compact ~{tokens["compact"]} ({saved:.1%} fewer)'
+		)
+	if len(backends) > 1:
+		saved = 1 - totals['compact'] / max(totals['verbose'], 1)
+		print(f'total: verbose ~{totals["verbose"]} tokens, compact ~{totals["compact"]} ({saved:.1%} fewer)')
+
+
+@dataclass
+class DataclassNode:
+	"""Baseline: the dataclass MacElementNode had a __dict__ per node and a strong parent link, so trees sat in cycles"""
+
+	role: str
+	identifier: str
+	attributes: Dict[str, Any]
+	is_visible: bool
+	app_pid: int
+	children: List['DataclassNode'] = field(default_factory=list)
+	parent: Optional['DataclassNode'] = None
+	is_interactive: bool = False
+	highlight_index: Optional[int] = None
+
+	def __post_init__(self) -> None:
+		self._element = None
+		self._accessibility_path = None
+		self._prompt_cache = None
+		self._detail_cache = None
+
+
+# The builder calls the node's methods, which work the same on a __dict__
+for _name, _value in vars(MacElementNode).items():
+	if isinstance(_value, (FunctionType, property)) and not _name.startswith('__') and _name != 'parent':
+		setattr(DataclassNode, _name, _value)
+
+
+async def _measure_build(backend: InMemoryBackend, pid: int) -> tuple:
+	"""(best build seconds, nodes, bytes held by the tree, bytes still held after releasing it without gc.collect())"""
+	builder = MacUITreeBuilder(backend=backend)
+	# Warm up the worker thread and caches so they aren't counted
+	await builder.build_tree(pid)
+	builder.cleanup()
+	times = []
+	for _ in range(3):
+		gc.collect()
+		start = time.perf_counter()
+		await builder.build_tree(pid)
+		times.append(time.perf_counter() - start)
+		builder.cleanup()
+	gc.collect()
+	await builder.executor.wait_idle()
+
+	tracemalloc.start()
+	baseline = tracemalloc.get_traced_memory()[0]
+	root = await builder.build_tree(pid)
+	retained = tracemalloc.get_traced_memory()[0] - baseline
+	nodes = builder.stats.nodes
+
+	# cleanup() doesn't run gc.collect(), so anything still counted here is unreachable garbage in cycles.
+	# Wait for the worker to drop its last work item first, or the tree may still be referenced from there.
+	builder.cleanup()
+	del root
+	await builder.executor.wait_idle()
+	leaked = tracemalloc.get_traced_memory()[0] - baseline
+	tracemalloc.stop()
+	await builder.close()
+	return min(times), nodes, retained, leaked
+
+
+async def measure_memory(backend: InMemoryBackend, pid: int) -> None:
+	"""Memory held by one built tree, and what is left once the builder lets go of it, for both node types"""
+	for name, node_class in (('dataclass nodes', DataclassNode), ('slotted nodes', MacElementNode)):
+		with mock.patch.object(tree_module, 'MacElementNode', node_class):
+			elapsed, nodes, retained, leaked = await _measure_build(backend, pid)
+		print(f'{name}:')
+		print(f'  build_tree:  {elapsed * 1000:.0f} ms for {nodes} nodes (best of 3)')
+		print(f'  tree memory: {retained / 1024 / 1024:.1f} MiB, {retained / max(nodes, 1):.0f} bytes per node')
+		print(f'  after release without gc.collect(): {leaked / 1024 / 1024:.1f} MiB still held')
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--tree', help='recorded tree JSON (generated synthetically if omitted)')
+	parser.add_argument('--nodes', type=int, default=5000, help='synthetic tree size')
+	parser.add_argument('--latency', type=float, default=0.0, help='injected seconds per AX call')
+	parser.add_argument('--runs', type=int, default=5)
+	parser.add_argument('--no-batch', action='store_true', help='read one attribute per AX call')
+	parser.add_argument('--incremental', action='store_true', help='patch the tree from notifications between runs')
+	parser.add_argument('--delta', action='store_true', help='measure delta state messages between runs')
+	parser.add_argument('--prune', action='store_true', help='skip elements scrolled out of view or clipped')
+	parser.add_argument('--table', type=int, default=0, metavar='ROWS', help='add a synthetic table with this many rows')
+	parser.add_argument('--table-rows', type=int, help='read tables as windows of this many compact rows')
+	parser.add_argument('--max-state-tokens', type=int, help='token budget for the serialized element list')
+	parser.add_argument('--encoding', choices=['verbose', 'compact'], default='verbose', help='element line encoding')
+	parser.add_argument(
+		'--compare-encodings', nargs='*', metavar='TREE', help='compare verbose and compact tokens of recorded trees and exit'
+	)
+	parser.add_argument('--memory', action='store_true', help='measure memory held by the built tree')
+	parser.add_argument('--record', type=int, metavar='PID', help='record a live app to --tree and exit')
+	args = parser.parse_args()
+
+	if args.record:
+		if not args.tree:
+			parser.error('--record needs --tree')
+		save_recording(record_application(args.record), args.tree)
+		print(f'✅ Recorded pid {args.record} to {args.tree}')
+		return
+
+	if args.compare_encodings is not None:
+		if args.compare_encodings:
+			backends = [(path, InMemoryBackend.from_file(path)) for path in args.compare_encodings]
+		else:
+			synthetic = synthetic_application(n_nodes=args.nodes, table_rows=args.table)
+			backends = [(f'synthetic {args.nodes} nodes', InMemoryBackend.from_dict(synthetic))]
+		asyncio.run(compare_encodings(backends))
+		return
+
+	if args.tree:
+		backend = InMemoryBackend.from_file(args.tree, latency=args.latency)
+	else:
+		synthetic = synthetic_application(n_nodes=args.nodes, table_rows=args.table)
+		backend = InMemoryBackend.from_dict(synthetic, latency=args.latency)
+	pid = next(iter(backend.applications))
+	if args.memory:
+		asyncio.run(measure_memory(backend, pid))
+		return
+	asyncio.run(
+		benchmark(
+			backend,
+			pid,
+			args.runs,
+			batch_attributes=not args.no_batch,
+			incremental=args.incremental,
+			delta=args.delta,
+			prune=args.prune,
+			table_rows=args.table_rows,
+			max_state_tokens=args.max_state_tokens,
+			encoding=args.encoding,
+		)
+	)
+
+
+if __name__ == '__main__':
+	main()
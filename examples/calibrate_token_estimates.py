@@ -0,0 +1,258 @@
+"""
+Fit the token estimator's ratios (ESTIMATOR_RATIOS in mlx_use/agent/message_manager/tokens.py) to a model
+family's real token counts on a fixed corpus of system prompts, UI states, delta states and tool calls.
+
+	python examples/calibrate_token_estimates.py --write-corpus  # regenerate tests/data/token_corpus.json
+	python examples/calibrate_token_estimates.py --source anthropic --model claude-3-5-sonnet-20241022  # ANTHROPIC_API_KEY
+	python examples/calibrate_token_estimates.py --source gemini --model gemini-1.5-flash  # GOOGLE_API_KEY
+	python examples/calibrate_token_estimates.py --source anthropic-legacy --tokenizer anthropic/tokenizer.json
+
+'anthropic' and 'gemini' count with the providers' count_tokens APIs. 'anthropic-legacy' counts locally with
+the tokenizer.json shipped in anthropic SDK releases before 0.39 (needs the `tokenizers` package); it is the
+tokenizer of Claude 2, so prefer the API for current models.
+
+The counts, the fitted ratios and their error on the corpus are written to tests/data/token_calibration.json,
+which tests/test_tokens.py checks; copy the printed ratios into ESTIMATOR_RATIOS. Regenerating the corpus
+invalidates the recorded counts, so refit every calibrated family afterwards.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlx_use.agent.message_manager import tokens
+from mlx_use.agent.message_manager.tokens import TokenCounter
+from mlx_use.agent.prompts import SystemPrompt
+from mlx_use.controller.service import Controller
+from mlx_use.mac.diff import TreeSnapshot, diff_snapshots
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data')
+CORPUS_PATH = os.path.join(DATA, 'token_corpus.json')
+CALIBRATION_PATH = os.path.join(DATA, 'token_calibration.json')
+
+# Samples with fewer real tokens than this are single element lines, reported apart from whole messages
+DOCUMENT_TOKENS = 100
+
+FAMILIES = {'anthropic': 'anthropic', 'anthropic-legacy': 'anthropic', 'gemini': 'gemini'}
+
+# (seed, nodes, table rows in the app, builder table_rows, windows, dialog, menu bar)
+STATES = [
+	(1, 150, 0, None, 'main', False, False),
+	(2, 300, 0, None, 'main', False, False),
+	(3, 200, 60, 20, 'all', True, True),
+	(4, 400, 120, 30, 'main', False, False),
+	(5, 250, 0, None, 'all', True, False),
+	(6, 150, 200, 50, 'all', False, True),
+]
+
+TEXTS = [
+	'Open Calculator and compute 1234 * 5678, then tell me the result.',
+	'In Notes, create a new note titled "Groceries" with the items milk, eggs and bread, one per line.',
+	'Reply to the latest email from sender 3 in Mail with "Thanks, I\'ll take a look tomorrow."',
+	'Clicked element 12 with AXPress successfully',
+	'Input "Quarterly report – draft (v2)" into element 7',
+	'Failed to click element 31: AXError -25205 (kAXErrorCannotComplete)',
+	'- goal: open the compose window | memory: Mail is open, inbox shows 40 messages | actions: click_element(4)',
+]
+
+ACTIONS = [
+	[{'open_app': {'app_name': 'Calculator'}}],
+	[{'click_element': {'index': i, 'action': 'AXPress'}} for i in (5, 17, 9, 23)],
+	[{'input_text': {'index': 7, 'text': 'Quarterly report – draft (v2)', 'submit': True}}],
+	[{'run_apple_script': {'script': 'tell application "Notes" to make new note with properties {name:"Groceries"}'}}],
+	[{'page_table': {'index': 5, 'direction': 'next', 'start_row': None}}],
+	[{'done': {'text': 'The result of 1234 * 5678 is 7006652.'}}],
+]
+
+
+async def _tree_samples(config: tuple) -> Tuple[List[str], List[str]]:
+	"""Full states in both encodings, and delta states after a few value changes"""
+	seed, nodes, app_rows, table_rows, windows, dialog, menu_bar = config
+	app = synthetic_application(pid=1000, n_nodes=nodes, seed=seed, table_rows=app_rows, dialog=dialog, menu_bar=menu_bar)
+	backend = InMemoryBackend.from_dict(app)
+	builder = MacUITreeBuilder(backend=backend, table_rows=table_rows, windows=windows, include_menu_bar=menu_bar)
+	root = await builder.build_tree(1000)
+	states = [root.get_clickable_elements_string(encoding) for encoding in ('verbose', 'compact')]
+	before = {encoding: TreeSnapshot.from_tree(root, encoding) for encoding in ('verbose', 'compact')}
+
+	elements, stack = [], [backend.applications[1000]]
+	while stack:
+		element = stack.pop()
+		elements.append(element)
+		stack.extend(reversed(element.children))
+	fields = [element for element in elements if 'AXValue' in element.attributes]
+	for i, element in enumerate(fields[:: max(1, len(fields) // 6)][:6]):
+		element.attributes['AXValue'] = f'edited value {i}'
+	root = await builder.build_tree(1000)
+	await builder.close()
+	deltas = [diff_snapshots(before[e], TreeSnapshot.from_tree(root, e)).to_string() for e in ('verbose', 'compact')]
+	return states, deltas
+
+
+async def build_corpus() -> List[Dict[str, str]]:
+	descriptions = Controller().registry.get_prompt_description()
+	samples = []
+	for encoding in ('verbose', 'compact'):
+		for features in (False, True):
+			prompt = SystemPrompt(
+				descriptions,
+				current_date=datetime(2025, 1, 1),
+				prompt_encoding=encoding,
+				include_time=False,
+				window_headers=features,
+				table_windows=features,
+				truncated_states=features,
+			)
+			samples.append({'kind': 'system_prompt', 'text': prompt.get_system_message().content})
+	lines = []
+	for config in STATES:
+		states, deltas = await _tree_samples(config)
+		samples += [{'kind': 'state', 'text': state} for state in states]
+		samples += [{'kind': 'delta_state', 'text': delta} for delta in deltas if delta]
+		lines += [line for state in states for line in state.splitlines()]
+	# Element lines are also counted one by one when a state has a token budget
+	distinct = list(dict.fromkeys(lines))
+	samples += [{'kind': 'element_line', 'text': line} for line in distinct[:: max(1, len(distinct) // 120)]]
+	samples += [{'kind': 'text', 'text': text} for text in TEXTS]
+	for actions in ACTIONS:
+		call = {'current_state': {'evaluation_previous_goal': 'Success', 'memory': '', 'next_goal': ''}, 'action': actions}
+		samples.append({'kind': 'tool_call', 'text': 'AgentOutput' + json.dumps(call, separators=(',', ':'), ensure_ascii=False)})
+	return [{'id': f'{i:03d}-{sample["kind"]}', **sample} for i, sample in enumerate(samples)]
+
+
+def anthropic_counter(model: str) -> Callable[[str], int]:
+	from anthropic import Anthropic
+
+	client = Anthropic()
+
+	def count(text: str) -> int:
+		return client.messages.count_tokens(model=model, messages=[{'role': 'user', 'content': text}]).input_tokens
+
+	# The count includes the message framing; take it off with a one-token message
+	overhead = count('a') - 1
+	return lambda text: count(text) - overhead
+
+
+def gemini_counter(model: str) -> Callable[[str], int]:
+	import google.generativeai as genai
+
+	genai.configure(api_key=os.environ.get('GOOGLE_API_KEY') or os.environ.get('GEMINI_API_KEY'))
+	generative_model = genai.GenerativeModel(model)
+	return lambda text: generative_model.count_tokens(text).total_tokens
+
+
+def legacy_counter(path: str) -> Callable[[str], int]:
+	from tokenizers import Tokenizer
+
+	tokenizer = Tokenizer.from_file(path)
+	return lambda text: len(tokenizer.encode(text).ids)
+
+
+def _features(text: str) -> Tuple[int, int]:
+	"""(word characters, punctuation characters), as TokenCounter.estimate splits them"""
+	punctuation = len(tokens._PUNCTUATION.findall(text))
+	return len(text) - punctuation - len(tokens._WHITESPACE.findall(text)), punctuation
+
+
+def fit_ratios(texts: List[str], counts: List[int]) -> Tuple[float, float]:
+	"""Ratios minimizing the squared relative error of word_chars / cpt + punctuation / ppt"""
+	# Least squares of a * word_chars / count + b * punctuation / count = 1, with a = 1 / cpt and b = 1 / ppt
+	xs, ys = zip(*((w / count, p / count) for (w, p), count in zip(map(_features, texts), counts)))
+	xx, xy, yy = sum(x * x for x in xs), sum(x * y for x, y in zip(xs, ys)), sum(y * y for y in ys)
+	x1, y1 = sum(xs), sum(ys)
+	det = xx * yy - xy * xy
+	a, b = (x1 * yy - y1 * xy) / det, (y1 * xx - x1 * xy) / det
+	return round(1 / a, 2), round(1 / b, 2)
+
+
+def relative_errors(family: str, ratios: Tuple[float, float], texts: List[str], counts: List[int]) -> List[float]:
+	saved = tokens.ESTIMATOR_RATIOS.get(family)
+	tokens.ESTIMATOR_RATIOS[family] = ratios
+	try:
+		counter = TokenCounter(family)
+		return [abs(counter.estimate(text) - count) / count for text, count in zip(texts, counts)]
+	finally:
+		tokens.ESTIMATOR_RATIOS[family] = saved
+
+
+def summarize(errors: List[float], counts: List[int]) -> Dict[str, float]:
+	documents = [error for error, count in zip(errors, counts) if count >= DOCUMENT_TOKENS]
+	lines = [error for error, count in zip(errors, counts) if count < DOCUMENT_TOKENS]
+	return {
+		'max_relative_error': round(max(documents), 4),
+		'mean_relative_error': round(statistics.mean(documents), 4),
+		'max_line_relative_error': round(max(lines), 4),
+		'mean_line_relative_error': round(statistics.mean(lines), 4),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--write-corpus', action='store_true', help='regenerate the corpus and exit')
+	parser.add_argument('--source', choices=sorted(FAMILIES), help='where the real token counts come from')
+	parser.add_argument('--model', help='model to count for (API sources)')
+	parser.add_argument('--tokenizer', help='tokenizer.json (anthropic-legacy)')
+	args = parser.parse_args()
+
+	if args.write_corpus:
+		corpus = asyncio.run(build_corpus())
+		os.makedirs(DATA, exist_ok=True)
+		with open(CORPUS_PATH, 'w') as f:
+			json.dump(corpus, f, indent=1, ensure_ascii=False)
+			f.write('\n')
+		print(f'✅ Wrote {len(corpus)} samples to {CORPUS_PATH}')
+		return
+	if not args.source:
+		parser.error('--source or --write-corpus is required')
+	if args.source == 'anthropic-legacy':
+		if not args.tokenizer:
+			parser.error('anthropic-legacy needs --tokenizer')
+		count = legacy_counter(args.tokenizer)
+		source = 'anthropic-legacy: tokenizer.json of the anthropic SDK before 0.39 (Claude 2)'
+	elif not args.model:
+		parser.error(f'{args.source} needs --model')
+	elif args.source == 'anthropic':
+		count, source = anthropic_counter(args.model), f'anthropic: messages.count_tokens, {args.model}'
+	else:
+		count, source = gemini_counter(args.model), f'gemini: count_tokens, {args.model}'
+
+	with open(CORPUS_PATH) as f:
+		corpus = json.load(f)
+	texts = [sample['text'] for sample in corpus]
+	counts = [count(text) for text in texts]
+	family = FAMILIES[args.source]
+	ratios = fit_ratios(texts, counts)
+	errors = summarize(relative_errors(family, ratios, texts, counts), counts)
+	before = summarize(relative_errors(family, tokens.ESTIMATOR_RATIOS[family], texts, counts), counts)
+
+	calibration = {}
+	if os.path.exists(CALIBRATION_PATH):
+		with open(CALIBRATION_PATH) as f:
+			calibration = json.load(f)
+	calibration[family] = {
+		'source': source,
+		'ratios': list(ratios),
+		**errors,
+		'counts': {sample['id']: n for sample, n in zip(corpus, counts)},
+	}
+	with open(CALIBRATION_PATH, 'w') as f:
+		json.dump(calibration, f, indent=1, sort_keys=True)
+		f.write('\n')
+
+	print(f'{family}: {sum(counts)} tokens in {len(corpus)} samples ({source})')
+	print(f'current ratios {tokens.ESTIMATOR_RATIOS[family]}: {before}')
+	print(f'fitted ratios  {ratios}: {errors}')
+	print(f'✅ Wrote {CALIBRATION_PATH}')
+
+
+if __name__ == '__main__':
+	main()
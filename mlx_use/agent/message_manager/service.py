@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import json
 import logging
 from datetime import datetime
-from typing import List, Optional, Type
+from typing import List, Optional, Sequence, Type
 
 from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models import BaseChatModel
@@ -10,17 +11,28 @@ from langchain_core.messages import (
 	AIMessage,
 	BaseMessage,
 	HumanMessage,
+	SystemMessage,
 	ToolMessage,
 )
-from langchain_openai import ChatOpenAI
 
-from mlx_use.agent.message_manager.views import MessageHistory, MessageMetadata
+from mlx_use.agent.message_manager.tokens import TokenCounter
+from mlx_use.agent.message_manager.views import ManagedMessage, MessageHistory, MessageMetadata
 from mlx_use.agent.prompts import AgentMessagePrompt, SystemPrompt
 from mlx_use.agent.views import ActionResult, AgentOutput, AgentStepInfo
 from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
 
 logger = logging.getLogger(__name__)
 
+# Every request starts with the system prompt, the task and the example tool call pair
+PREFIX_MESSAGES = 4
+SUMMARY_HEADER = 'Summary of earlier steps (their messages were removed to save tokens):\n'
+SUMMARY_INSTRUCTIONS = (
+	'You maintain the memory of a macOS automation agent. Merge the new steps into the previous summary. '
+	'Keep what was done, what worked or failed and any values the agent found or will need; drop UI details. '
+	'Answer with the updated summary only, as short bullet points.'
+)
+
 
 class MessageManager:
 	def __init__(
@@ -35,6 +47,15 @@ class MessageManager:
 		include_attributes: list[str] = [],
 		max_error_length: int = 400,
 		max_actions_per_step: int = 10,
+		prompt_encoding: PromptEncoding = 'verbose',
+		summary_llm: Optional[BaseChatModel] = None,
+		keep_recent_steps: int = 3,
+		max_summary_tokens: int = 1000,
+		compaction_target: float = 0.75,
+		prompt_caching: bool = False,
+		window_headers: bool = False,
+		table_windows: bool = False,
+		truncated_states: bool = False,
 	):
 		self.llm = llm
 		self.system_prompt_class = system_prompt_class
@@ -43,15 +64,49 @@ class MessageManager:
 		self.task = task
 		self.action_descriptions = action_descriptions
 		self.ESTIMATED_TOKENS_PER_CHARACTER = estimated_tokens_per_character
+		self.token_counter = TokenCounter.for_llm(llm, estimated_tokens_per_character)
+		logger.debug(
+			f'Counting tokens for {self.token_counter.family} model {self.token_counter.model!r} '
+			f'{"with its tokenizer" if self.token_counter.exact else "by estimate"}'
+		)
 		self.IMG_TOKENS = image_tokens
 		self.include_attributes = include_attributes
 		self.max_error_length = max_error_length
+		self.prompt_encoding = prompt_encoding
+		# State messages left in history as the base for delta states
+		self._kept_state_messages: List[ManagedMessage] = []
+		# Compaction: older steps are folded into a summary (written by summary_llm if given) until
+		# history is at compaction_target of the budget; the last keep_recent_steps stay as they are
+		self.summary_llm = summary_llm
+		self.keep_recent_steps = keep_recent_steps
+		self.max_summary_tokens = max_summary_tokens
+		self.compaction_target = compaction_target
+		self._summary: Optional[ManagedMessage] = None
+		# Keep the prefix (system prompt, task, example call) identical across steps and runs, and mark
+		# cache breakpoints for Anthropic models; OpenAI caches stable prefixes on its own
+		self.prompt_caching = prompt_caching
 
 		# Use the updated SystemPrompt with our explicit JSON instructions.
+		# Custom system prompt classes predating these options only get them when they're not the default
+		prompt_kwargs = {}
+		if prompt_encoding != 'verbose':
+			prompt_kwargs['prompt_encoding'] = prompt_encoding
+		if prompt_caching:
+			# The time of day goes into each state message instead
+			prompt_kwargs['include_time'] = False
+		# Rules for optional state features are only sent when the builder and serializer produce them
+		for name, enabled in (
+			('window_headers', window_headers),
+			('table_windows', table_windows),
+			('truncated_states', truncated_states),
+		):
+			if enabled:
+				prompt_kwargs[name] = True
 		system_message = self.system_prompt_class(
 			self.action_descriptions,
 			current_date=datetime.now(),
 			max_actions_per_step=max_actions_per_step,
+			**prompt_kwargs,
 		).get_system_message()
 
 		self._add_message_with_tokens(system_message)
@@ -97,18 +152,28 @@ class MessageManager:
 		state: str,
 		result: Optional[List[ActionResult]] = None,
 		step_info: Optional[AgentStepInfo] = None,
+		state_is_delta: bool = False,
 	) -> None:
 		"""Add browser state as human message"""
+		for message in self.state_messages(state, result, step_info, state_is_delta):
+			self._add_message_with_tokens(message)
 
+	def state_messages(
+		self,
+		state: str,
+		result: Optional[List[ActionResult]] = None,
+		step_info: Optional[AgentStepInfo] = None,
+		state_is_delta: bool = False,
+	) -> List[BaseMessage]:
+		"""The messages add_state_message adds: action results kept in memory, then the state"""
+		messages: List[BaseMessage] = []
 		if result:
 			for r in result:
 				if r.include_in_memory:
 					if r.extracted_content:
-						msg = HumanMessage(content='Action result: ' + str(r.extracted_content))
-						self._add_message_with_tokens(msg)
+						messages.append(HumanMessage(content='Action result: ' + str(r.extracted_content)))
 					if r.error:
-						msg = HumanMessage(content='Action error: ' + str(r.error)[-self.max_error_length:])
-						self._add_message_with_tokens(msg)
+						messages.append(HumanMessage(content='Action error: ' + str(r.error)[-self.max_error_length:]))
 					result = None
 
 		state_message = AgentMessagePrompt(
@@ -117,13 +182,109 @@ class MessageManager:
 			include_attributes=self.include_attributes,
 			max_error_length=self.max_error_length,
 			step_info=step_info,
+			state_is_delta=state_is_delta,
+			encoding=self.prompt_encoding,
+			current_time=datetime.now() if self.prompt_caching else None,
 		).get_user_message()
-		self._add_message_with_tokens(state_message)
+		messages.append(state_message)
+		return messages
 
 	def _remove_last_state_message(self) -> None:
 		if len(self.history.messages) > 2 and isinstance(self.history.messages[-1].message, HumanMessage):
 			self.history.remove_message()
 
+	def keep_last_state_message(self, drop_previous: bool = False) -> None:
+		"""Keep the last state message in history so later delta states can refer back to it"""
+		if drop_previous:
+			self._drop_kept_state_messages()
+		if isinstance(self.history.messages[-1].message, HumanMessage):
+			self._kept_state_messages.append(self.history.messages[-1])
+
+	def _drop_kept_state_messages(self) -> None:
+		for managed in self._kept_state_messages:
+			self._remove_managed(managed)
+		self._kept_state_messages = []
+
+	def _remove_managed(self, managed: ManagedMessage) -> None:
+		for i, m in enumerate(self.history.messages):
+			if m is managed:
+				self.history.remove_message(i)
+				break
+
+	async def compact(self, pending: Sequence[BaseMessage] = ()) -> bool:
+		"""
+		Make room for the `pending` messages when history would go over max_input_tokens with them.
+
+		Old state messages go first, then the oldest steps are folded into a rolling summary
+		until history is at compaction_target of the budget, so this runs once every few steps
+		rather than every step. The system prompt, task and the last keep_recent_steps model
+		outputs with their tool messages are kept. Returns whether the state messages kept as the
+		base for delta states were dropped; the next state must then be sent in full.
+		"""
+		budget = self.max_input_tokens - sum(self._count_tokens(message) for message in pending)
+		if self.history.total_tokens <= budget:
+			return False
+		before = self.history.total_tokens
+		dropped_base = bool(self._kept_state_messages)
+		self._drop_kept_state_messages()
+		target = int(budget * self.compaction_target)
+		if self.history.total_tokens > target:
+			await self._fold_old_steps(self.history.total_tokens - target)
+		logger.info(f'Compacted message history from {before} to {self.history.total_tokens} tokens')
+		return dropped_base
+
+	async def _fold_old_steps(self, excess_tokens: int) -> None:
+		"""Replace the oldest steps holding at least `excess_tokens` (or all but the recent ones) with the summary"""
+		messages = self.history.messages
+		start = PREFIX_MESSAGES + (1 if self._summary is not None else 0)
+		# A step ends with the tool message that follows the model's output
+		step_ends = [i for i in range(start, len(messages)) if isinstance(messages[i].message, ToolMessage)]
+		foldable = step_ends[: len(step_ends) - self.keep_recent_steps] if self.keep_recent_steps else step_ends
+		if not foldable:
+			return
+
+		end, folded_tokens = start, 0
+		for step_end in foldable:
+			folded_tokens += sum(m.metadata.input_tokens for m in messages[end : step_end + 1])
+			end = step_end + 1
+			if folded_tokens >= excess_tokens:
+				break
+		folded = [m.message for m in messages[start:end]]
+		for _ in range(end - start):
+			self.history.remove_message(start)
+
+		previous = self._summary.message.content[len(SUMMARY_HEADER) :] if self._summary is not None else ''
+		summary = await self._summarize(str(previous), folded)
+		if self._summary is not None:
+			self._remove_managed(self._summary)
+		message = HumanMessage(content=SUMMARY_HEADER + summary)
+		metadata = MessageMetadata(input_tokens=self._count_tokens(message))
+		self._summary = self.history.insert_message(PREFIX_MESSAGES, message, metadata)
+
+	async def _summarize(self, previous: str, messages: List[BaseMessage]) -> str:
+		steps = _describe_steps(messages)
+		if self.summary_llm is not None:
+			try:
+				response = await self.summary_llm.ainvoke(
+					[
+						SystemMessage(content=SUMMARY_INSTRUCTIONS),
+						HumanMessage(content=f'Previous summary:\n{previous or "(none)"}\n\nNew steps:\n{steps}'),
+					]
+				)
+				if str(response.content).strip():
+					return self._trim_summary(str(response.content).strip())
+			except Exception as e:
+				logger.warning(f'Could not summarize earlier steps, keeping a plain record of them instead: {e}')
+		return self._trim_summary(f'{previous}\n{steps}'.strip())
+
+	def _trim_summary(self, summary: str) -> str:
+		"""Drop the oldest lines of a summary over max_summary_tokens"""
+		tokens = self.token_counter.count(summary)
+		if tokens <= self.max_summary_tokens:
+			return summary
+		summary = summary[-int(len(summary) * self.max_summary_tokens / tokens) :]
+		return summary.split('\n', 1)[-1]
+
 	def add_model_output(self, model_output: AgentOutput) -> None:
 		tool_calls = [
 			{
@@ -149,6 +310,8 @@ class MessageManager:
 
 	def get_messages(self) -> List[BaseMessage]:
 		msg = [m.message for m in self.history.messages]
+		if self.prompt_caching and self.token_counter.family == 'anthropic':
+			msg = self._with_cache_breakpoints(msg)
 		total_input_tokens = 0
 		logger.debug(f'Messages in history: {len(self.history.messages)}:')
 		for m in self.history.messages:
@@ -157,36 +320,26 @@ class MessageManager:
 		logger.debug(f'Total input tokens: {total_input_tokens}')
 		return msg
 
+	@staticmethod
+	def _with_cache_breakpoints(messages: List[BaseMessage]) -> List[BaseMessage]:
+		"""
+		Copies of the messages with Anthropic cache breakpoints on the system prompt, the end of the
+		fixed prefix and the last tool message before the current state, so each request reads the
+		previous request's history from the cache.
+		"""
+		breakpoints = {0, PREFIX_MESSAGES - 1}
+		last_tool = max((i for i, m in enumerate(messages) if isinstance(m, ToolMessage)), default=None)
+		if last_tool is not None:
+			breakpoints.add(last_tool)
+		return [_cache_breakpoint(m) if i in breakpoints else m for i, m in enumerate(messages)]
+
 	def _add_message_with_tokens(self, message: BaseMessage) -> None:
 		token_count = self._count_tokens(message)
 		metadata = MessageMetadata(input_tokens=token_count)
 		self.history.add_message(message, metadata)
 
 	def _count_tokens(self, message: BaseMessage) -> int:
-		tokens = 0
-		if isinstance(message.content, list):
-			for item in message.content:
-				if 'image_url' in item:
-					tokens += self.IMG_TOKENS
-				elif isinstance(item, dict) and 'text' in item:
-					tokens += self._count_text_tokens(item['text'])
-		else:
-			msg = message.content
-			if hasattr(message, 'tool_calls'):
-				msg += str(message.tool_calls)  # type: ignore
-			tokens += self._count_text_tokens(msg)
-		return tokens
-
-	def _count_text_tokens(self, text: str) -> int:
-		if isinstance(self.llm, ChatOpenAI):
-			try:
-				self.llm.disabled_params = {'parallel_tool_calls': None}
-				tokens = self.llm.get_num_tokens(text)
-			except Exception:
-				tokens = len(text) // self.ESTIMATED_TOKENS_PER_CHARACTER
-		else:
-			tokens = len(text) // self.ESTIMATED_TOKENS_PER_CHARACTER
-		return tokens
+		return self.token_counter.count_message(message, self.IMG_TOKENS)
 
 	def cut_messages(self):
 		diff = self.history.total_tokens - self.max_input_tokens
@@ -233,3 +386,41 @@ class MessageManager:
 		logger.debug(
 			f'Added message with {last_msg.metadata.input_tokens} tokens - total tokens now: {self.history.total_tokens}/{self.max_input_tokens} - total messages: {len(self.history.messages)}'
 		)
+
+
+def _cache_breakpoint(message: BaseMessage) -> BaseMessage:
+	"""Copy of a message whose (last) content block carries an Anthropic cache_control marker"""
+	cache_control = {'type': 'ephemeral'}
+	if isinstance(message, ToolMessage):
+		block = {
+			'type': 'tool_result',
+			'tool_use_id': message.tool_call_id,
+			'content': message.content,
+			'cache_control': cache_control,
+		}
+		return message.model_copy(update={'content': [block]})
+	if isinstance(message.content, str):
+		if not message.content.strip():
+			return message
+		return message.model_copy(update={'content': [{'type': 'text', 'text': message.content, 'cache_control': cache_control}]})
+	blocks = [dict(block) if isinstance(block, dict) else {'type': 'text', 'text': block} for block in message.content]
+	if blocks:
+		blocks[-1]['cache_control'] = cache_control
+	return message.model_copy(update={'content': blocks})
+
+
+def _describe_steps(messages: List[BaseMessage]) -> str:
+	"""One line per model output and action result of compacted steps; state messages are left out"""
+	lines = []
+	for message in messages:
+		if isinstance(message, AIMessage):
+			for tool_call in message.tool_calls:
+				brain = tool_call['args'].get('current_state', {})
+				actions = ', '.join(
+					json.dumps(action, separators=(',', ':'))[:200] for action in tool_call['args'].get('action', [])
+				)
+				lines.append(f'- goal: {brain.get("next_goal", "")} | memory: {brain.get("memory", "")} | actions: {actions}')
+		elif isinstance(message, HumanMessage) and isinstance(message.content, str):
+			if message.content.startswith(('Action result:', 'Action error:')):
+				lines.append(f'  {message.content[:300]}')
+	return '\n'.join(lines)
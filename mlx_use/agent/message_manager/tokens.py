@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+# (characters per token in words, punctuation characters per token) for models whose tokenizer
+# can't run locally. 'anthropic' is fitted by examples/calibrate_token_estimates.py to the counts in
+# tests/data/token_calibration.json (Claude's tokenizer as shipped with the anthropic SDK before 0.39;
+# refit against messages.count_tokens for current models); the file records the error on the corpus,
+# which is largest on compact states (underestimated by up to 30%). 'gemini' and 'openai' are still
+# rules of thumb until fitted the same way; exact counts come from tiktoken for OpenAI models.
+ESTIMATOR_RATIOS = {
+	'anthropic': (2.99, 3.39),
+	'gemini': (3.8, 1.3),
+	'openai': (4.0, 1.5),
+}
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s')
+
+
+def model_family(llm: BaseChatModel) -> str:
+	"""'openai', 'anthropic', 'gemini' or 'unknown', from the chat model's class and model name"""
+	name = f'{llm.__class__.__name__} {getattr(llm, "model_name", None) or getattr(llm, "model", "")}'.lower()
+	if 'anthropic' in name or 'claude' in name:
+		return 'anthropic'
+	if 'google' in name or 'gemini' in name:
+		return 'gemini'
+	if 'openai' in name or 'gpt' in name:
+		return 'openai'
+	return 'unknown'
+
+
+def model_name(llm: BaseChatModel) -> str:
+	return str(getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or '')
+
+
+@lru_cache(maxsize=None)
+def _openai_encoding(model: str) -> Any:
+	"""tiktoken encoding of an OpenAI model, loaded once per model; None if tiktoken can't provide it"""
+	try:
+		import tiktoken
+	except ImportError:
+		return None
+	try:
+		return tiktoken.encoding_for_model(model)
+	except KeyError:
+		pass
+	except Exception as e:
+		logger.debug(f'Could not load the tokenizer of {model}, estimating token counts instead: {e}')
+		return None
+	try:
+		return tiktoken.get_encoding('o200k_base' if model.startswith(('gpt-4o', 'o1', 'o3', 'gpt-4.1')) else 'cl100k_base')
+	except Exception as e:
+		logger.debug(f'Could not load a tokenizer for {model}, estimating token counts instead: {e}')
+		return None
+
+
+class TokenCounter:
+	"""
+	Token counts of message text for one chat model.
+
+	OpenAI models are counted with their tiktoken encoding; other models (and OpenAI ones when
+	the encoding can't be loaded, e.g. offline) use a rough per-family estimate. Counts are kept in an
+	LRU cache keyed by a hash of the text, so repeated texts (system prompt, resent states) are
+	counted once.
+	"""
+
+	def __init__(self, family: str, model: str = '', chars_per_token: float = 3, cache_size: int = 1024):
+		self.family = family
+		self.model = model
+		# Fallback for unknown families
+		self.chars_per_token = chars_per_token
+		self.cache_size = cache_size
+		self._cache: OrderedDict[bytes, int] = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	@classmethod
+	def for_llm(cls, llm: BaseChatModel, chars_per_token: float = 3) -> 'TokenCounter':
+		return cls(model_family(llm), model_name(llm), chars_per_token)
+
+	@property
+	def exact(self) -> bool:
+		"""Whether counts come from the model's tokenizer rather than an estimate"""
+		return self.family == 'openai' and _openai_encoding(self.model) is not None
+
+	def count(self, text: str) -> int:
+		"""Tokens in `text`"""
+		if not text:
+			return 0
+		key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+		tokens = self._cache.get(key)
+		if tokens is not None:
+			self.hits += 1
+			self._cache.move_to_end(key)
+			return tokens
+		self.misses += 1
+		tokens = self._count(text)
+		self._cache[key] = tokens
+		if len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return tokens
+
+	def _count(self, text: str) -> int:
+		if self.family == 'openai':
+			encoding = _openai_encoding(self.model)
+			if encoding is not None:
+				return len(encoding.encode(text, disallowed_special=()))
+		return self.estimate(text)
+
+	def estimate(self, text: str) -> int:
+		"""Estimated tokens without running a tokenizer; cheap enough for every line of a UI state"""
+		ratios = ESTIMATOR_RATIOS.get(self.family)
+		if ratios is None:
+			return math.ceil(len(text) / self.chars_per_token)
+		chars_per_token, punctuation_per_token = ratios
+		punctuation = len(_PUNCTUATION.findall(text))
+		# Whitespace mostly merges into the following word's token
+		word_chars = len(text) - punctuation - len(_WHITESPACE.findall(text))
+		return math.ceil(word_chars / chars_per_token + punctuation / punctuation_per_token)
+
+	def count_message(self, message: BaseMessage, image_tokens: int = 800) -> int:
+		"""Tokens of a message's text, images and tool calls"""
+		tokens = 0
+		if isinstance(message.content, list):
+			for item in message.content:
+				if 'image_url' in item:
+					tokens += image_tokens
+				elif isinstance(item, dict) and 'text' in item:
+					tokens += self.count(item['text'])
+		else:
+			tokens += self.count(message.content)
+		for tool_call in getattr(message, 'tool_calls', None) or []:
+			# The model sees the name and JSON arguments, not the Python repr of the call
+			tokens += self.count(tool_call['name'] + json.dumps(tool_call['args'], separators=(',', ':'), ensure_ascii=False))
+		return tokens
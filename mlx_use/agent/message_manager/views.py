@@ -30,6 +30,13 @@ class MessageHistory(BaseModel):
 		self.messages.append(ManagedMessage(message=message, metadata=metadata))
 		self.total_tokens += metadata.input_tokens
 
+	def insert_message(self, index: int, message: BaseMessage, metadata: MessageMetadata) -> ManagedMessage:
+		"""Insert a message with metadata at a position"""
+		managed = ManagedMessage(message=message, metadata=metadata)
+		self.messages.insert(index, managed)
+		self.total_tokens += metadata.input_tokens
+		return managed
+
 	def remove_message(self, index: int = -1) -> None:
 		"""Remove last message from history"""
 		if self.messages:
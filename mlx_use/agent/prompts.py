@@ -2,9 +2,20 @@ from datetime import datetime
 from typing import List, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
 from mlx_use.agent.views import ActionResult, AgentStepInfo
+from mlx_use.mac.encoding import PromptEncoding, compact_legend
 
 class SystemPrompt:
-    def __init__(self, action_description: str, current_date: datetime, max_actions_per_step: int = 10):
+    def __init__(
+        self,
+        action_description: str,
+        current_date: datetime,
+        max_actions_per_step: int = 10,
+        prompt_encoding: PromptEncoding = 'verbose',
+        include_time: bool = True,
+        window_headers: bool = False,
+        table_windows: bool = False,
+        truncated_states: bool = False,
+    ):
         """
         Initialize SystemPrompt with action description, current date and max actions allowed per step.
         
@@ -12,10 +23,21 @@ class SystemPrompt:
             action_description (str): Description of available actions
             current_date (datetime): Current system date/time
             max_actions_per_step (int): Maximum number of actions allowed per step
+            prompt_encoding (PromptEncoding): How UI elements are written in state messages ('verbose' or 'compact')
+            include_time (bool): Whether to state the time of day as well as the date; without it the prompt
+                stays the same all day, so providers can cache it
+            window_headers (bool): Whether states list several windows, each under a header (builder windows='all')
+            table_windows (bool): Whether large tables are shown as windows of rows (builder table_rows)
+            truncated_states (bool): Whether states can end with an omitted-elements marker (max_state_tokens)
         """
         self.default_action_description = action_description
         self.current_date = current_date
         self.max_actions_per_step = max_actions_per_step
+        self.prompt_encoding = prompt_encoding
+        self.include_time = include_time
+        self.window_headers = window_headers
+        self.table_windows = table_windows
+        self.truncated_states = truncated_states
 
     def important_rules(self) -> str:
         """Returns a string containing important rules for the system."""
@@ -58,9 +80,19 @@ class SystemPrompt:
    - Interactive elements: "[index][:]<type> [interactive]" (e.g., "1[:]<AXButton>").
    - Context elements: "_[:]<type> [context]" (e.g., "_[:]<AXStaticText value='20'>").
    - Use context elements to verify outcomes (e.g., check results after actions).
-   - Use attributes (description, title, value) to identify elements accurately.
+"""
+        if self.window_headers:
+            text += '   - Handle a focused or modal dialog or sheet before interacting with the window behind it.\n'
+        text += """   - Use attributes (description, title, value) to identify elements accurately.
    - When providing an element index to click, use the actions list attribute to choose which action to use.
-
+   - An element keeps its index across steps; new elements get new indices, so indices are not always sequential.
+"""
+        if self.table_windows:
+            text += (
+                '   - Large tables and lists are shown as \'[table]\' with rows="11-60 of 500" and one line per row '
+                "with its cells separated by ' | '; use page_table on the table's index to see other rows.\n"
+            )
+        text += """
 5. TASK COMPLETION:
    - Use the "done" action when the task is complete.
    - Don't hallucinate actions.
@@ -90,25 +122,57 @@ class SystemPrompt:
         - Text-to-speech: {"run_apple_script": {"script": "say \"Task complete\""}}
         - Rename a file in Finder: {"run_apple_script": {"script": "tell application \"Finder\" to set name of item 1 of desktop to \"NewName\""}}
 """
+        if self.prompt_encoding == 'compact':
+            text = text.replace(
+                '''   - Interactive elements: "[index][:]<type> [interactive]" (e.g., "1[:]<AXButton>").
+   - Context elements: "_[:]<type> [context]" (e.g., "_[:]<AXStaticText value='20'>").''',
+                '''   - Interactive elements: "<index>:<role>" (e.g., '1:btn "Save"').
+   - Context elements: "_:<role> ... ctx" (e.g., '_:text v="20" ctx').''',
+            )
+            text = text.replace("shown as '[table]' with rows=\"11-60 of 500\"", "shown as 'table' with rows=11-60/500")
+            text = text.replace('(check `enabled="True"` in attributes)', '(disabled elements are flagged `off`)')
         text += f'   - max_actions_per_step: {self.max_actions_per_step}'
         return text
 
     def input_format(self) -> str:
         """Returns a string describing the expected input format."""
-        return """
-INPUT STRUCTURE:
-1. Current App: Active macOS application (or "None" if none open)
-2. UI Elements: List in the format:
+        if self.prompt_encoding == 'compact':
+            elements = f"""2. UI Elements, in a compact encoding:
+{compact_legend(tables=self.table_windows)}
+"""
+            note = "NOTE: Actions take the AX names (e.g., 'AXPress' for 'Press')."
+        else:
+            elements = """2. UI Elements: List in the format:
    - Interactive: '[index][:]<type> [interactive]' (e.g., '1[:]<AXButton enabled="True" actions="AXPress">').
    - Context: '_[:]<type> [context]' (e.g., '_[:]<AXStaticText value="20">').
-3. Action Results: Feedback from the previous step's actions (e.g., "Clicked element 2 successfully").
+"""
+            if self.table_windows:
+                elements += (
+                    '   - Table rows: \'_[:]<AXRow row="12" value="cell | cell"> [row]\' under a \'[table]\' line, '
+                    'or with an index when the row can be clicked.\n'
+                )
+            note = 'NOTE: The UI tree includes detailed accessibility attributes use them to choose the correct element.'
+        if self.window_headers:
+            elements += (
+                '   - Window headers: \'=== Dialog "Save changes?" (focused, modal) ===\' starts the elements of each window, '
+                'sheet, menu bar or app when several are shown.\n'
+            )
+        if self.truncated_states:
+            elements += (
+                "   - Very large states end with '... N more elements omitted'; elements near the focus and your last action "
+                'are kept, so scroll, page a table or work closer to the element you need to see the rest.\n'
+            )
+        return f"""
+INPUT STRUCTURE:
+1. Current App: Active macOS application (or "None" if none open)
+{elements}3. Action Results: Feedback from the previous step's actions (e.g., "Clicked element 2 successfully").
 
-NOTE: The UI tree includes detailed accessibility attributes use them to choose the correct element.
+{note}
 """
 
     def get_system_message(self) -> SystemMessage:
         """Creates and returns a SystemMessage with formatted content."""
-        time_str = self.current_date.strftime('%Y-%m-%d %H:%M')
+        time_str = self.current_date.strftime('%Y-%m-%d %H:%M' if self.include_time else '%Y-%m-%d')
 
         AGENT_PROMPT = f"""
         You are a macOS automation agent that interacts with applications via their UI elements using the Accessibility API. Your role is to:
@@ -116,7 +180,7 @@ NOTE: The UI tree includes detailed accessibility attributes use them to choose
 2. Plan a sequence of actions to accomplish the given task.
 3. Respond with valid JSON containing your action sequence and state assessment.
 
-Current date and time: {time_str}
+Current date{' and time' if self.include_time else ''}: {time_str}
 
 {self.input_format()}
 
@@ -138,6 +202,9 @@ class AgentMessagePrompt:
         include_attributes: list[str] = [],
         max_error_length: int = 400,
         step_info: Optional[AgentStepInfo] = None,
+        state_is_delta: bool = False,
+        encoding: PromptEncoding = 'verbose',
+        current_time: Optional[datetime] = None,
     ):
         """
         Initialize AgentMessagePrompt with state and optional parameters.
@@ -148,19 +215,35 @@ class AgentMessagePrompt:
             include_attributes (list[str]): List of attributes to include
             max_error_length (int): Maximum length for error messages
             step_info (Optional[AgentStepInfo]): Information about current step
+            state_is_delta (bool): Whether state only lists the changes since the previous state message
+            encoding (PromptEncoding): Encoding of the element lines in state
+            current_time (Optional[datetime]): Time of day to state, when the system prompt only has the date
         """
         self.state = state
         self.result = result
         self.max_error_length = max_error_length
         self.include_attributes = include_attributes
         self.step_info = step_info
+        self.state_is_delta = state_is_delta
+        self.encoding = encoding
+        self.current_time = current_time
 
     def get_user_message(self) -> HumanMessage:
         """Creates and returns a HumanMessage with formatted content."""
         step_info_str = f"Step {self.step_info.step_number + 1}/{self.step_info.max_steps}\n" if self.step_info else ""
+        if self.current_time:
+            step_info_str += f"Current time: {self.current_time.strftime('%H:%M')}\n"
+        encoding_str = ' (compact encoding)' if self.encoding == 'compact' else ''
         
-        state_description = f"""{step_info_str}
-CURRENT APPLICATION STATE:
+        if self.state_is_delta:
+            legend = "'+' added, '-' removed, '~' changed; unlisted elements are unchanged"
+            state_description = f"""{step_info_str}
+APPLICATION STATE CHANGES SINCE THE PREVIOUS STATE MESSAGE{encoding_str} ({legend}):
+{self.state}
+"""
+        else:
+            state_description = f"""{step_info_str}
+CURRENT APPLICATION STATE{encoding_str}:
 {self.state}
 """
 
@@ -8,10 +8,11 @@ import logging
 import os
 import platform
 import textwrap
+import time
 import uuid
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Type, TypeVar
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, List, Optional, Set, Tuple, Type, TypeVar
 
 from dotenv import load_dotenv
 from langchain_core.language_models.chat_models import BaseChatModel
@@ -26,6 +27,7 @@ from pydantic import BaseModel, ValidationError
 
 from mlx_use.agent.message_manager.service import MessageManager
 from mlx_use.agent.prompts import AgentMessagePrompt, SystemPrompt
+from mlx_use.agent.structured_output import StructuredOutput
 from mlx_use.agent.views import (
 	ActionResult,
 	AgentError,
@@ -33,9 +35,17 @@ from mlx_use.agent.views import (
 	AgentHistoryList,
 	AgentOutput,
 	AgentStepInfo,
+	StateMessageMetrics,
+	StepTimings,
 )
 from mlx_use.controller.registry.views import ActionModel
 from mlx_use.controller.service import Controller
+from mlx_use.mac.diff import TreeSnapshot, diff_snapshots
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
+from mlx_use.mac.serializer import StateSerializer
+from mlx_use.mac.settle import UISettleDetector
+from mlx_use.mac.snapshots import SnapshotStore
 from mlx_use.mac.tree import MacUITreeBuilder
 from mlx_use.telemetry.service import ProductTelemetry
 from mlx_use.telemetry.views import (
@@ -50,6 +60,16 @@ logger = logging.getLogger(__name__)
 
 T = TypeVar('T', bound=BaseModel)
 
+TRUNCATED_STATE_NOTE = '\n... UI tree truncated: not all elements were read within the traversal budget'
+
+
+def _usage_metrics(usage: Optional[dict]) -> dict:
+	"""Input and cache-read token counts from a response's usage_metadata, when the provider reports them"""
+	if not usage:
+		return {}
+	details = usage.get('input_token_details') or {}
+	return {'input_tokens': usage.get('input_tokens'), 'cached_input_tokens': details.get('cache_read')}
+
 
 class Agent:
 	def __init__(
@@ -85,6 +105,15 @@ class Agent:
 		register_new_step_callback: Callable[['str', 'AgentOutput', int], None] | None = None,
 		register_done_callback: Callable[['AgentHistoryList'], None] | None = None,
 		tool_calling_method: Optional[str] = 'auto',
+		state_delta: bool = False,
+		full_state_interval: int = 10,
+		mac_tree_builder: Optional[MacUITreeBuilder] = None,
+		max_state_tokens: Optional[int] = None,
+		prompt_encoding: PromptEncoding = 'verbose',
+		summary_llm: Optional[BaseChatModel] = None,
+		prompt_caching: bool = False,
+		max_settle_wait: float = 1.0,
+		stream_actions: bool = False,
 	):
 		self.agent_id = str(uuid.uuid4())  # unique identifier for the agent
 
@@ -98,7 +127,31 @@ class Agent:
 		self.max_error_length = max_error_length
 		self.generate_gif = generate_gif
 
-		self.mac_tree_builder = MacUITreeBuilder()
+		# Pass a configured builder for e.g. MacUITreeBuilder(windows='all', include_menu_bar=True)
+		self.mac_tree_builder = mac_tree_builder or MacUITreeBuilder()
+		# A builder the agent created is closed (and its worker thread stopped) when a run ends
+		self._owns_tree_builder = mac_tree_builder is None
+		# Waits for the app to stop changing before each step reads its UI, up to max_settle_wait seconds
+		self.settle_detector = UISettleDetector(self.mac_tree_builder, max_wait=max_settle_wait)
+		# Send only the UI changes since the last state the model saw, with a full state every full_state_interval steps
+		self.state_delta = state_delta
+		self.full_state_interval = full_state_interval
+		self._sent_snapshot: Optional[TreeSnapshot] = None
+		self._sent_snapshot_pid: Optional[int] = None
+		self._steps_since_full_state = 0
+		# Token budget for the element list; elements nearest the focus and the last action are kept first.
+		# None lists every element
+		self.max_state_tokens = max_state_tokens
+		# Highlight index of the element the last executed action targeted
+		self._last_action_index: Optional[int] = None
+		# usage_metadata of the last model response, for cache hit metrics
+		self._last_usage: Optional[dict] = None
+		# Stream the model's tool call and start each action as soon as the model has written it
+		self.stream_actions = stream_actions
+		# Results of actions a streamed response started before it turned out invalid
+		self._streamed_results: list[ActionResult] = []
+		# 'compact' abbreviates roles and leaves out default actions and enabled="True" in element lines
+		self.prompt_encoding = prompt_encoding
 		# Controller setup
 		self.controller = controller
 		self.max_actions_per_step = max_actions_per_step
@@ -116,6 +169,8 @@ class Agent:
 		self._set_model_names()
 
 		self.tool_calling_method = self.set_tool_calling_method(tool_calling_method)
+		# (id(llm), output model, method) -> runnable and output adapter, so they're built once
+		self._structured_outputs: Dict[tuple, StructuredOutput] = {}
 
 		self.message_manager = MessageManager(
 			llm=self.llm,
@@ -126,6 +181,14 @@ class Agent:
 			include_attributes=self.include_attributes,
 			max_error_length=self.max_error_length,
 			max_actions_per_step=self.max_actions_per_step,
+			prompt_encoding=self.prompt_encoding,
+			# Cheaper model that folds old steps into a summary when history outgrows max_input_tokens
+			summary_llm=summary_llm,
+			# Byte-stable prompt prefix with Anthropic cache breakpoints
+			prompt_caching=prompt_caching,
+			window_headers=self.mac_tree_builder.windows == 'all',
+			table_windows=bool(self.mac_tree_builder.table_rows),
+			truncated_states=self.max_state_tokens is not None,
 		)
 
 		# Step callback
@@ -133,7 +196,9 @@ class Agent:
 		self.register_done_callback = register_done_callback
 
 		# Tracking variables
-		self.history: AgentHistoryList = AgentHistoryList(history=[])
+		# States of history items, with UI subtrees shared across steps
+		self.snapshot_store = SnapshotStore()
+		self.history: AgentHistoryList = AgentHistoryList(history=[], snapshots=self.snapshot_store)
 		self.n_steps = 1
 		self.consecutive_failures = 0
 		self.max_failures = max_failures
@@ -145,6 +210,10 @@ class Agent:
 
 		self._paused = False
 		self._stopped = False
+		# Tree read for the next step, started as soon as this step's actions returned
+		self._next_state: Optional[asyncio.Task] = None
+		# Conversation files, telemetry and callbacks that finish while the next step runs
+		self._background_tasks: Set[asyncio.Task] = set()
 
 	def _set_version_and_source(self) -> None:
 		version = '0.0.1'
@@ -191,21 +260,46 @@ class Agent:
 
 	@time_execution_async("--step")
 	async def step(self, step_info: Optional[AgentStepInfo] = None) -> None:
-		await asyncio.sleep(1)
 		"""Execute one step of the task"""
 		logger.info(f"\n📍 Step {self.n_steps}")
 		state = None
 		model_output = None
 		result: list[ActionResult] = []
+		snapshot = None
+		state_id = None
+		state_metrics = None
+		timings = StepTimings()
+		streamed_actions: Optional[asyncio.Task] = None
+		self._streamed_results = []
 
 		try:
 			if not self.get_last_pid():
 				state = "Starting new task - no app is currently open. Please use open_app action to begin."
 
-			root = await self.mac_tree_builder.build_tree(self.get_last_pid())
+			wait_start = time.perf_counter()
+			root = await self._take_state(self.get_last_pid(), timings)
+			timings.state_wait_seconds = time.perf_counter() - wait_start
 			if root:
-				state = root.get_clickable_elements_string()
-				# print the ui tree 
+				serialize_start = time.perf_counter()
+				serializer = StateSerializer(
+					self.max_state_tokens,
+					# Counted per element line, so the estimate rather than the tokenizer
+					count_tokens=self.message_manager.token_counter.estimate,
+					encoding=self.prompt_encoding,
+				)
+				state = serializer.serialize(
+					root,
+					focus=self.mac_tree_builder.focused_node,
+					anchor=self.mac_tree_builder._element_cache.get(self._last_action_index),
+				)
+				if serializer.omitted:
+					logger.info(f'UI state over {self.max_state_tokens} tokens, left out {serializer.omitted} elements')
+				if root.attributes.get('truncated'):
+					state += TRUNCATED_STATE_NOTE
+				# Stored now: the tree is patched in place by later builds
+				state_id = self.snapshot_store.add(state, root, serializer.nodes, self.prompt_encoding)
+				timings.serialize_seconds = time.perf_counter() - serialize_start
+				# print the ui tree
 				logger.debug(f"\n\nstep {self.n_steps} \nState: {state}\n\n")
 				
 				# consider adding the full ui tree details, much more tokens!
@@ -214,24 +308,80 @@ class Agent:
 				# 	"\n\nFull UI Tree Details:\n" + root.get_detailed_string()
 				# )
 
-			self.message_manager.add_state_message(state, self._last_result, step_info)
+			message_state, is_delta = state, False
+			if root and self.state_delta:
+				# Deltas are relative to what the model was shown, not to elements the budget left out
+				snapshot = TreeSnapshot.from_nodes(serializer.nodes, self.prompt_encoding)
+				delta = self._delta_state(root, state, snapshot)
+				if delta is not None:
+					message_state, is_delta = delta, True
+
+			pending = self.message_manager.state_messages(message_state, self._last_result, step_info, is_delta)
+			if await self.message_manager.compact(pending) and is_delta:
+				# The state messages the delta refers to were compacted away
+				message_state, is_delta = state, False
+				await self.message_manager.compact(self.message_manager.state_messages(state, self._last_result, step_info))
+			self.message_manager.add_state_message(message_state, self._last_result, step_info, state_is_delta=is_delta)
 			input_messages = self.message_manager.get_messages()
 
 			try:
-				model_output = await self.get_next_action(input_messages)
+				llm_start = time.perf_counter()
+				if self.stream_actions and self._structured_output().can_stream:
+					model_output, streamed_actions = await self.get_next_action_streaming(input_messages)
+				else:
+					model_output = await self.get_next_action(input_messages)
+				timings.llm_seconds = time.perf_counter() - llm_start
+				if state:
+					state_metrics = StateMessageMetrics(
+						full_state_tokens=self.message_manager.token_counter.count(state),
+						sent_state_tokens=self.message_manager.token_counter.count(message_state),
+						is_delta=is_delta,
+						llm_seconds=timings.llm_seconds,
+						**_usage_metrics(self._last_usage),
+					)
+					logger.debug(
+						f'State message: {state_metrics.sent_state_tokens}/{state_metrics.full_state_tokens} tokens '
+						f'({"delta" if is_delta else "full"}), LLM answered in {state_metrics.llm_seconds:.2f}s'
+					)
+					if state_metrics.cached_input_tokens:
+						logger.debug(
+							f'Prompt cache: {state_metrics.cached_input_tokens}/{state_metrics.input_tokens} '
+							'input tokens read from cache'
+						)
 
 				if self.register_new_step_callback:
 					self.register_new_step_callback(state, model_output, self.n_steps)
 
-				self._save_conversation(input_messages, model_output)
-				self.message_manager._remove_last_state_message()
+				if self.save_conversation_path:
+					self._in_background(asyncio.to_thread(self._save_conversation, input_messages, model_output, self.n_steps))
+				if snapshot is not None:
+					# The model has now seen this state; later deltas are relative to it
+					self.message_manager.keep_last_state_message(drop_previous=not is_delta)
+					self._sent_snapshot = snapshot
+					self._sent_snapshot_pid = root.app_pid
+					self._steps_since_full_state = self._steps_since_full_state + 1 if is_delta else 1
+				else:
+					self.message_manager._remove_last_state_message()
 				self.message_manager.add_model_output(model_output)
 			except Exception as e:
 				self.message_manager._remove_last_state_message()
+				if streamed_actions is not None:
+					self._streamed_results = await streamed_actions
 				raise e
 
-			result: list[ActionResult] = await self.controller.multi_act(model_output.action, self.mac_tree_builder)
+			act_start = time.perf_counter()
+			if streamed_actions is not None:
+				# Started while the response streamed in; this waits for the actions still running
+				result: list[ActionResult] = await streamed_actions
+			else:
+				result: list[ActionResult] = await self.controller.multi_act(model_output.action, self.mac_tree_builder)
+			timings.act_seconds = time.perf_counter() - act_start
 			self._last_result = result
+			if not (result and result[-1].is_done):
+				# Read the next state on the accessibility thread while this step finishes
+				self._next_state = asyncio.create_task(self._read_state(self.get_last_pid()))
+			indices = [action.get_index() for action in model_output.action[: len(result)]]
+			self._last_action_index = next((index for index in reversed(indices) if index is not None), None)
 
 			if len(result) > 0 and result[-1].is_done:
 				logger.info(f"📄 Result: {result[-1].extracted_content}")
@@ -239,25 +389,96 @@ class Agent:
 			self.consecutive_failures = 0
 
 		except Exception as e:
-			result = await self._handle_step_error(e)
+			# Actions a streamed response started before failing did run; the model needs their results
+			result = self._streamed_results + await self._handle_step_error(e)
 			self._last_result = result
 
 		finally:
 			actions = [a.model_dump(exclude_unset=True) for a in model_output.action] if model_output else []
-			self.telemetry.capture(
-				AgentStepTelemetryEvent(
-					agent_id=self.agent_id,
-					step=self.n_steps,
-					actions=actions,
-					consecutive_failures=self.consecutive_failures,
-					step_error=[r.error for r in result if r.error] if result else ["No result"],
-				)
+			event = AgentStepTelemetryEvent(
+				agent_id=self.agent_id,
+				step=self.n_steps,
+				actions=actions,
+				consecutive_failures=self.consecutive_failures,
+				step_error=[r.error for r in result if r.error] if result else ["No result"],
+			)
+			self._in_background(asyncio.to_thread(self.telemetry.capture, event))
+			logger.debug(
+				f'Step timings: settle {timings.settle_seconds:.2f}s, build {timings.build_seconds:.2f}s '
+				f'(waited {timings.state_wait_seconds:.2f}s, {timings.saved_seconds:.2f}s saved), '
+				f'serialize {timings.serialize_seconds:.2f}s, LLM {timings.llm_seconds:.2f}s, actions {timings.act_seconds:.2f}s'
 			)
 			if not result:
 				return
 
 			if state:
-				self._make_history_item(model_output, state, result)
+				# Stays in the step: run() checks the history for a done action right after it returns
+				self._make_history_item(model_output, state, result, state_metrics, state_id, timings)
+
+	async def _read_state(self, pid: Optional[int]) -> Tuple[Optional[int], Optional[MacElementNode], StepTimings]:
+		"""Wait for the UI to settle and build its tree"""
+		timings = StepTimings()
+		settle = await self.settle_detector.wait(pid)
+		timings.settle_seconds = settle.seconds
+		if settle.polls:
+			timed_out = '' if settle.settled else ', timed out'
+			logger.debug(f'UI settled in {settle.seconds:.2f}s ({settle.method}, {settle.polls} polls{timed_out})')
+		build_start = time.perf_counter()
+		root = await self.mac_tree_builder.build_tree(pid)
+		timings.build_seconds = time.perf_counter() - build_start
+		return pid, root, timings
+
+	async def _take_state(self, pid: Optional[int], timings: StepTimings) -> Optional[MacElementNode]:
+		"""The tree read ahead for this step if there is one for pid, otherwise a fresh read"""
+		pending, self._next_state = self._next_state, None
+		prefetched = False
+		if pending is not None:
+			try:
+				read_pid, root, read_timings = await pending
+				prefetched = read_pid == pid
+			except Exception as e:
+				logger.debug(f'Reading the next state ahead failed: {e}')
+		if not prefetched:
+			read_pid, root, read_timings = await self._read_state(pid)
+		timings.settle_seconds = read_timings.settle_seconds
+		timings.build_seconds = read_timings.build_seconds
+		timings.prefetched = prefetched
+		return root
+
+	def _in_background(self, coro: Coroutine) -> None:
+		"""Run bookkeeping that the next step doesn't depend on as a task, logging its errors"""
+		task = asyncio.create_task(coro)
+		self._background_tasks.add(task)
+		task.add_done_callback(self._background_done)
+
+	def _background_done(self, task: asyncio.Task) -> None:
+		self._background_tasks.discard(task)
+		if not task.cancelled() and task.exception() is not None:
+			logger.error(f'Background step work failed: {task.exception()}')
+
+	async def _drain(self) -> None:
+		"""Wait for background work and drop a tree read ahead for a step that won't run"""
+		pending, self._next_state = self._next_state, None
+		if pending is not None:
+			await asyncio.gather(pending, return_exceptions=True)
+		if self._background_tasks:
+			await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+	def _delta_state(self, root: MacElementNode, state: str, snapshot: TreeSnapshot) -> Optional[str]:
+		"""Changes since the last state the model saw, or None when the full state should be sent"""
+		if (
+			self._sent_snapshot is None
+			or self._sent_snapshot_pid != root.app_pid
+			or self._steps_since_full_state >= self.full_state_interval
+		):
+			return None
+		delta = diff_snapshots(self._sent_snapshot, snapshot).to_string()
+		if root.attributes.get('truncated'):
+			delta += TRUNCATED_STATE_NOTE
+		# Large changes (e.g. a new screen) read better as a fresh full state
+		if len(delta) * 2 >= len(state):
+			return None
+		return delta
 
 	async def _handle_step_error(self, error: Exception) -> list[ActionResult]:
 		"""Handle all types of errors that can occur during a step"""
@@ -292,31 +513,55 @@ class Agent:
 		model_output: AgentOutput | None,
 		state: str,
 		result: list[ActionResult],
+		state_metrics: Optional[StateMessageMetrics] = None,
+		state_id: Optional[str] = None,
+		timings: Optional[StepTimings] = None,
 	) -> None:
-		"""Create and store history item"""
-		logger.debug("Adding history item: state=%s, model_output=%s, result=%s",
-					 state, model_output.json() if model_output else None, [r.model_dump() for r in result])
+		"""Create and store history item; its state goes to the snapshot store"""
+		if logger.isEnabledFor(logging.DEBUG):
+			# Dumping the output and results costs more than the rest of this method
+			logger.debug(
+				'Adding history item: state=%s, model_output=%s, result=%s',
+				state,
+				model_output.json() if model_output else None,
+				[r.model_dump() for r in result],
+			)
 
 		interacted_element = None
 		len_result = len(result)
 
 		interacted_elements = [None]
 
-		history_item = AgentHistory(model_output=model_output, result=result, state=state)
+		if state_id is None:
+			state_id = self.snapshot_store.add(state)
+		history_item = AgentHistory(
+			model_output=model_output,
+			result=result,
+			state_id=state_id,
+			snapshots=self.snapshot_store,
+			state_metrics=state_metrics,
+			timings=timings,
+		)
 
 		self.history.history.append(history_item)
 
+	def _structured_output(self) -> StructuredOutput:
+		"""Structured-output runnable for the current LLM, output model and method, built on first use"""
+		key = (id(self.llm), self.AgentOutput, self.tool_calling_method)
+		structured_output = self._structured_outputs.get(key)
+		if structured_output is None:
+			structured_output = StructuredOutput(self.llm, self.AgentOutput, self.tool_calling_method)
+			self._structured_outputs = {key: structured_output}
+		return structured_output
+
 	@time_execution_async('--get_next_action')
 	async def get_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
 		"""Get next action from LLM based on current state"""
-		if self.tool_calling_method is None:
-			structured_llm = self.llm.with_structured_output(self.AgentOutput, include_raw=True)
-		else:
-			structured_llm = self.llm.with_structured_output(self.AgentOutput, include_raw=True, method=self.tool_calling_method)
-
-		response: dict[str, Any] = await structured_llm.ainvoke(input_messages)  # type: ignore
+		structured_output = self._structured_output()
+		response: dict[str, Any] = await structured_output.ainvoke(input_messages)
+		self._last_usage = getattr(response.get('raw'), 'usage_metadata', None)
 
-		parsed: AgentOutput | None = response['parsed']
+		parsed: AgentOutput | None = structured_output.parse(response)
 		if parsed is None:
 			raise ValueError('Could not parse response.')
 
@@ -327,6 +572,47 @@ class Agent:
 
 		return parsed
 
+	@time_execution_async('--get_next_action_streaming')
+	async def get_next_action_streaming(self, input_messages: list[BaseMessage]) -> Tuple[AgentOutput, asyncio.Task]:
+		"""
+		Stream the next action from the LLM, executing each action as soon as it is complete. Returns
+		the whole output and the task running the actions; if the response turns out invalid, the
+		error is raised once the actions already started have finished, with their results in
+		_streamed_results.
+		"""
+		queue: asyncio.Queue[Optional[ActionModel]] = asyncio.Queue()
+
+		async def streamed() -> AsyncIterator[ActionModel]:
+			while (action := await queue.get()) is not None:
+				yield action
+
+		dispatched = 0
+
+		def dispatch(item: Any) -> None:
+			nonlocal dispatched
+			if dispatched < self.max_actions_per_step:
+				# Raises ValidationError for an invalid action, ending the stream
+				queue.put_nowait(self.ActionModel.model_validate(item))
+				dispatched += 1
+
+		actions = asyncio.create_task(self.controller.multi_act_stream(streamed(), self.mac_tree_builder))
+		try:
+			parsed, self._last_usage = await self._structured_output().astream(input_messages, dispatch)
+		except Exception:
+			queue.put_nowait(None)
+			self._streamed_results = await actions
+			raise
+		except BaseException:
+			actions.cancel()
+			raise
+		queue.put_nowait(None)
+
+		parsed.action = parsed.action[: self.max_actions_per_step]
+		self._log_response(parsed)
+		self.n_steps += 1
+
+		return parsed, actions
+
 	def _log_response(self, response: AgentOutput) -> None:
 		"""Log the model's response"""
 		if 'Success' in response.current_state.evaluation_previous_goal:
@@ -342,16 +628,18 @@ class Agent:
 		for i, action in enumerate(response.action):
 			logger.info(f'🛠️  Action {i + 1}/{len(response.action)}: {action.model_dump_json(exclude_unset=True)}')
 
-	def _save_conversation(self, input_messages: list[BaseMessage], response: Any) -> None:
+	def _save_conversation(self, input_messages: list[BaseMessage], response: Any, step: Optional[int] = None) -> None:
 		"""Save conversation history to file if path is specified"""
 		if not self.save_conversation_path:
 			return
+		if step is None:
+			step = self.n_steps
 
 		# create folders if not exists
 		os.makedirs(os.path.dirname(self.save_conversation_path), exist_ok=True)
 
 		with open(
-			self.save_conversation_path + f'_{self.n_steps}.txt',
+			self.save_conversation_path + f'_{step}.txt',
 			'w',
 			encoding=self.save_conversation_path_encoding,
 		) as f:
@@ -431,6 +719,9 @@ class Agent:
 
 			return self.history
 		finally:
+			await self._drain()
+			if self._owns_tree_builder:
+				await self.mac_tree_builder.close()
 			self.telemetry.capture(
 				AgentEndTelemetryEvent(
 					agent_id=self.agent_id,
@@ -454,6 +745,11 @@ class Agent:
 			logger.info('Agent stopped')
 			return False
 
+		if self._paused:
+			# The UI may change while paused, so a tree read ahead would be stale
+			pending, self._next_state = self._next_state, None
+			if pending is not None:
+				await asyncio.gather(pending, return_exceptions=True)
 		while self._paused:
 			await asyncio.sleep(0.2)  # Small delay to prevent CPU spinning
 			if self._stopped:  # Allow stopping while paused
@@ -461,11 +757,11 @@ class Agent:
 
 		return True
 
-	def save_history(self, file_path: Optional[str | Path] = None) -> None:
-		"""Save the history to a file"""
+	def save_history(self, file_path: Optional[str | Path] = None, compact: bool = False) -> None:
+		"""Save the history to a file; `compact` stores each distinct UI subtree once instead of every state's text"""
 		if not file_path:
 			file_path = 'AgentHistory.json'
-		self.history.save_to_file(file_path)
+		self.history.save_to_file(file_path, compact=compact)
 
 	def _convert_initial_actions(self, actions: List[Dict[str, Dict[str, Any]]]) -> List[ActionModel]:
 		"""Convert dictionary-based actions to ActionModel instances"""
@@ -0,0 +1,172 @@
+"""
+Structured-output runnables built once per (LLM, output model, tool calling method).
+
+`llm.with_structured_output(Model)` converts the model to a tool schema, binds it and builds an
+output parser every time it is called. `StructuredOutput` does that once, with the tool schema
+converted up front; the output is validated with a `TypeAdapter` that is also built once.
+
+For tool-calling models it can also stream the tool call, handing each item of an array
+argument (the agent's actions) to a callback as soon as the item's JSON is complete.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, Type, TypeVar
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, TypeAdapter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T', bound=BaseModel)
+
+# Chat models whose structured output with a tool schema dict is the first tool call's arguments
+# (JsonOutputKeyToolsParser), for the tool calling methods they use it with
+DICT_SCHEMA_METHODS: Dict[str, set] = {
+	'ChatOpenAI': {'function_calling', 'json_mode'},
+	'AzureChatOpenAI': {'function_calling', 'json_mode'},
+	'ChatAnthropic': {None},
+}
+
+
+class StructuredOutput(Generic[T]):
+	"""A chat model's structured-output runnable for one output model, and how to read its responses"""
+
+	def __init__(self, llm: BaseChatModel, output_model: Type[T], method: Optional[str] = None):
+		self.output_model = output_model
+		self.method = method
+		self.adapter: TypeAdapter[T] = TypeAdapter(output_model)
+		self.tool_schema: Dict[str, Any] = convert_to_openai_tool(output_model)
+		# Other chat models or methods get the model class, and parse into it themselves
+		schema: Any = self.tool_schema if method in DICT_SCHEMA_METHODS.get(llm.__class__.__name__, ()) else output_model
+		kwargs = {'method': method} if method is not None else {}
+		self.runnable: Runnable = llm.with_structured_output(schema, include_raw=True, **kwargs)
+
+		# The same tool binding without the parser, for streaming the tool call's arguments
+		self.tool_llm: Optional[Runnable] = None
+		if schema is self.tool_schema and method != 'json_mode':
+			tool_name = self.tool_schema['function']['name']
+			if llm.__class__.__name__ == 'ChatAnthropic':
+				self.tool_llm = llm.bind_tools([self.tool_schema], tool_choice=tool_name)
+			else:
+				self.tool_llm = llm.bind_tools(
+					[self.tool_schema], tool_choice=tool_name, parallel_tool_calls=False, stream_usage=True
+				)
+
+	@property
+	def can_stream(self) -> bool:
+		return self.tool_llm is not None
+
+	async def ainvoke(self, messages: Any) -> Dict[str, Any]:
+		return await self.runnable.ainvoke(messages)
+
+	def parse(self, response: Dict[str, Any]) -> Optional[T]:
+		"""
+		The output model from a response of `runnable`; None if it has none. Raises ValidationError
+		if the model's arguments don't fit the output model.
+		"""
+		parsed = response.get('parsed')
+		if isinstance(parsed, self.output_model):
+			return parsed
+		if isinstance(parsed, dict):
+			return self.adapter.validate_python(parsed)
+
+		# The parser failed: validate the raw tool call arguments or JSON content directly
+		raw = response.get('raw')
+		tool_calls = getattr(raw, 'tool_calls', None)
+		if tool_calls:
+			return self.adapter.validate_python(tool_calls[0]['args'])
+		content = getattr(raw, 'content', None)
+		if isinstance(content, str) and content.lstrip().startswith('{'):
+			return self.adapter.validate_json(content)
+		if response.get('parsing_error') is not None:
+			logger.debug(f'Could not parse structured output: {response["parsing_error"]}')
+		return None
+
+	async def astream(
+		self, messages: Any, on_item: Callable[[Any], None], key: str = 'action'
+	) -> Tuple[T, Optional[Dict[str, Any]]]:
+		"""
+		Stream the tool call, calling `on_item` with each completed item of its `key` array while
+		the rest streams in. Returns the validated output and the response's usage metadata.
+		"""
+		if self.tool_llm is None:
+			raise ValueError(f'{self.output_model.__name__} output can only be streamed from a tool call')
+		items = JsonArrayStream(key)
+		response = None
+		tool_call_index = None
+		async for chunk in self.tool_llm.astream(messages):
+			response = chunk if response is None else response + chunk
+			for tool_call_chunk in chunk.tool_call_chunks:
+				if tool_call_index is None:
+					tool_call_index = tool_call_chunk.get('index')
+				if tool_call_chunk.get('index') != tool_call_index or not tool_call_chunk.get('args'):
+					continue
+				for item in items.feed(tool_call_chunk['args']):
+					on_item(item)
+		if not items.text.strip():
+			raise ValueError('Could not parse response.')
+		return self.adapter.validate_json(items.text), getattr(response, 'usage_metadata', None)
+
+
+class JsonArrayStream:
+	"""
+	Incremental scanner over a JSON object that arrives in pieces. `feed` returns the items of the
+	object's `key` array (objects or arrays) that were completed by the piece, parsed.
+	"""
+
+	def __init__(self, key: str):
+		self.key = key
+		self.text = ''
+		# '{' and '[' of the containers the scan is in
+		self._stack: List[str] = []
+		self._in_string = False
+		self._escape = False
+		self._string_start = 0
+		# The next string in the top-level object is a member name
+		self._expect_key = False
+		self._member: Optional[str] = None
+		self._in_array = False
+		self._item_start: Optional[int] = None
+
+	def feed(self, piece: str) -> List[Any]:
+		start = len(self.text)
+		self.text += piece
+		text, stack = self.text, self._stack
+		items = []
+		for i in range(start, len(text)):
+			char = text[i]
+			if self._in_string:
+				if self._escape:
+					self._escape = False
+				elif char == '\\':
+					self._escape = True
+				elif char == '"':
+					self._in_string = False
+					if self._expect_key and len(stack) == 1:
+						self._member = json.loads(text[self._string_start : i + 1])
+						self._expect_key = False
+			elif char == '"':
+				self._in_string = True
+				self._string_start = i
+			elif char == '{' or char == '[':
+				stack.append(char)
+				if len(stack) == 1:
+					self._expect_key = char == '{'
+				elif len(stack) == 2 and char == '[' and stack[0] == '{' and self._member == self.key:
+					self._in_array = True
+				elif len(stack) == 3 and self._in_array:
+					self._item_start = i
+			elif char == '}' or char == ']':
+				if len(stack) == 3 and self._item_start is not None:
+					items.append(json.loads(text[self._item_start : i + 1]))
+					self._item_start = None
+				elif len(stack) == 2:
+					self._in_array = False
+				if stack:
+					stack.pop()
+			elif char == ',' and len(stack) == 1:
+				self._expect_key = True
+		return items
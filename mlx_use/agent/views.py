@@ -7,9 +7,11 @@ from pathlib import Path
 from typing import Any, Dict, Optional, Type
 
 from openai import RateLimitError
-from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, ValidationError, create_model, model_validator
 
 from mlx_use.controller.registry.views import ActionModel
+from mlx_use.mac.diff import TreeDiff
+from mlx_use.mac.snapshots import SnapshotStore
 
 
 @dataclass
@@ -58,15 +60,85 @@ class AgentOutput(BaseModel):
 		)
 
 
+class StateMessageMetrics(BaseModel):
+	"""Size of the state sent to the model in one step, how long the model took to answer and its prompt cache use"""
+
+	full_state_tokens: int
+	sent_state_tokens: int
+	is_delta: bool
+	llm_seconds: float
+	# Prompt tokens the provider billed and how many of them were read from its prompt cache
+	input_tokens: Optional[int] = None
+	cached_input_tokens: Optional[int] = None
+
+	@property
+	def saved_tokens(self) -> int:
+		return self.full_state_tokens - self.sent_state_tokens
+
+
+class StepTimings(BaseModel):
+	"""Wall-clock seconds of each stage of one step"""
+
+	# Waiting for the UI to stop changing and reading its tree; with prefetched=True these ran
+	# while the previous step finished its bookkeeping
+	settle_seconds: float = 0.0
+	build_seconds: float = 0.0
+	prefetched: bool = False
+	# How long the step actually waited for its tree
+	state_wait_seconds: float = 0.0
+	serialize_seconds: float = 0.0
+	llm_seconds: float = 0.0
+	act_seconds: float = 0.0
+
+	@property
+	def saved_seconds(self) -> float:
+		"""Time the pipeline took off the step by reading the tree ahead"""
+		if not self.prefetched:
+			return 0.0
+		return max(self.settle_seconds + self.build_seconds - self.state_wait_seconds, 0.0)
+
+
 class AgentHistory(BaseModel):
 	"""History item for agent actions"""
 
 	model_output: AgentOutput | None
 	result: list[ActionResult]
-	state: str
+	state_id: Optional[str] = None
+	state_metrics: Optional[StateMessageMetrics] = None
+	timings: Optional[StepTimings] = None
 
 	model_config = ConfigDict(arbitrary_types_allowed=True, protected_namespaces=())
 
+	# State passed as text; None when it is kept in the snapshot store under state_id
+	_state: Optional[str] = PrivateAttr(default=None)
+	_snapshots: Optional[SnapshotStore] = PrivateAttr(default=None)
+
+	@model_validator(mode='wrap')
+	@classmethod
+	def _take_state(cls, data: Any, handler: Any) -> 'AgentHistory':
+		"""Accept `state` (and `snapshots`, the store holding state_id) as constructor arguments"""
+		state = snapshots = None
+		if isinstance(data, dict) and ('state' in data or 'snapshots' in data):
+			data = dict(data)
+			state, snapshots = data.pop('state', None), data.pop('snapshots', None)
+		item = handler(data)
+		if state is not None:
+			item._state = state
+		if snapshots is not None:
+			item._snapshots = snapshots
+		return item
+
+	@property
+	def state(self) -> str:
+		"""The step's UI state, read from the snapshot store when it is kept there"""
+		if self._state is None and self.state_id is not None and self._snapshots is not None and self.state_id in self._snapshots:
+			return self._snapshots.get(self.state_id)
+		return self._state or ''
+
+	@state.setter
+	def state(self, value: str) -> None:
+		self._state = value
+
 	def model_dump(self, **kwargs) -> Dict[str, Any]:
 		"""Custom serialization handling circular references"""
 
@@ -83,6 +155,9 @@ class AgentHistory(BaseModel):
 			'model_output': model_output_dump,
 			'result': [r.model_dump(exclude_none=True) for r in self.result],
 			'state': self.state,
+			'state_id': self.state_id,
+			'state_metrics': self.state_metrics.model_dump() if self.state_metrics else None,
+			'timings': self.timings.model_dump() if self.timings else None,
 		}
 
 
@@ -90,6 +165,18 @@ class AgentHistoryList(BaseModel):
 	"""List of agent history items"""
 
 	history: list[AgentHistory]
+	# States of items that reference a snapshot id
+	snapshots: Optional[SnapshotStore] = None
+
+	model_config = ConfigDict(arbitrary_types_allowed=True)
+
+	@model_validator(mode='after')
+	def _attach_snapshots(self) -> 'AgentHistoryList':
+		if self.snapshots is not None:
+			for item in self.history:
+				if item._snapshots is None:
+					item._snapshots = self.snapshots
+		return self
 
 	def __str__(self) -> str:
 		"""Representation of the AgentHistoryList object"""
@@ -99,21 +186,29 @@ class AgentHistoryList(BaseModel):
 		"""Representation of the AgentHistoryList object"""
 		return self.__str__()
 
-	def save_to_file(self, filepath: str | Path) -> None:
+	def save_to_file(self, filepath: str | Path, compact: bool = False) -> None:
 		"""Save history to JSON file with proper serialization"""
 		try:
 			Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-			data = self.model_dump()
+			data = self.model_dump(compact=compact)
 			with open(filepath, 'w', encoding='utf-8') as f:
 				json.dump(data, f, indent=2)
 		except Exception as e:
 			raise e
 
-	def model_dump(self, **kwargs) -> Dict[str, Any]:
-		"""Custom serialization that properly uses AgentHistory's model_dump"""
-		return {
-			'history': [h.model_dump(**kwargs) for h in self.history],
-		}
+	def model_dump(self, compact: bool = False, **kwargs) -> Dict[str, Any]:
+		"""
+		Custom serialization that properly uses AgentHistory's model_dump. With `compact`, states
+		kept in the snapshot store are left out of the items and the store is dumped once instead.
+		"""
+		history = [h.model_dump(**kwargs) for h in self.history]
+		data: Dict[str, Any] = {'history': history}
+		if compact and self.snapshots is not None:
+			for item in history:
+				if item['state_id'] in self.snapshots:
+					del item['state']
+			data['snapshots'] = self.snapshots.to_dict()
+		return data
 
 	@classmethod
 	def load_from_file(cls, filepath: str | Path, output_model: Type[AgentOutput]) -> 'AgentHistoryList':
@@ -127,8 +222,16 @@ class AgentHistoryList(BaseModel):
 					h['model_output'] = output_model.model_validate(h['model_output'])
 				else:
 					h['model_output'] = None
-		history = cls.model_validate(data)
-		return history
+		if data.get('snapshots') is not None:
+			data['snapshots'] = SnapshotStore.from_dict(data['snapshots'])
+		return cls.model_validate(data)
+
+	def diff_states(self, old_step: int, new_step: int) -> Optional[TreeDiff]:
+		"""Changes between the UI states of two steps, or None unless both are snapshots"""
+		old_id, new_id = self.history[old_step].state_id, self.history[new_step].state_id
+		if self.snapshots is None or old_id is None or new_id is None:
+			return None
+		return self.snapshots.diff(old_id, new_id)
 
 	def last_action(self) -> None | dict:
 		"""Last action in history"""
@@ -188,6 +291,10 @@ class AgentHistoryList(BaseModel):
 					outputs.append(output)
 		return outputs
 
+	def state_metrics(self) -> list[StateMessageMetrics]:
+		"""Get the state message metrics of every step that recorded them"""
+		return [h.state_metrics for h in self.history if h.state_metrics]
+
 	def action_results(self) -> list[ActionResult]:
 		"""Get all results from history"""
 		results = []
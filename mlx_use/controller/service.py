@@ -1,10 +1,10 @@
 import asyncio
 import json
 import logging
-from typing import Literal
+from functools import partial
+from typing import AsyncIterator, Literal, Optional
 import subprocess
 
-import Cocoa
 from playwright.async_api import Page
 
 from mlx_use.agent.views import ActionModel, ActionResult
@@ -16,9 +16,12 @@ from mlx_use.controller.views import (
 	OpenAppAction,
 	RightClickElementAction,
 	AppleScriptAction,
-	ScrollElementAction
+	ScrollElementAction,
+	PageTableAction
 )
 from mlx_use.mac.actions import click, type_into, right_click, scroll
+from mlx_use.mac.process import AppRegistry
+from mlx_use.mac.settle import poll_until
 from mlx_use.mac.tree import MacUITreeBuilder
 from mlx_use.utils import time_execution_async, time_execution_sync
 
@@ -58,7 +61,14 @@ class Controller:
 						msg = f'❌ Cannot input text: Element is disabled: {element_to_input_text}'
 						return ActionResult(extracted_content=msg, error=msg)
 						
-					input_successful = type_into(element_to_input_text, text, submit)
+					input_successful = await mac_tree_builder.executor.run(
+						type_into,
+						element_to_input_text,
+						text,
+						submit,
+						mac_tree_builder.backend,
+						timeout=mac_tree_builder.call_timeout,
+					)
 					if input_successful:
 						return ActionResult(extracted_content=f'Successfully input text into element with index {index}')
 					else:
@@ -88,7 +98,9 @@ class Controller:
 						logging.error(msg)
 						return ActionResult(extracted_content=msg, error=msg)
 						
-					click_successful = click(element_to_click, action)
+					click_successful = await mac_tree_builder.executor.run(
+						click, element_to_click, action, mac_tree_builder.backend, timeout=mac_tree_builder.call_timeout
+					)
 					if click_successful:
 						logger.debug(f'Successfully clicked element with index {index}')
 						return ActionResult(
@@ -123,7 +135,9 @@ class Controller:
 						msg = f'❌ Cannot right click: Element is disabled: {element_to_right_click}'
 						return ActionResult(extracted_content=msg, error=msg)
 						
-					right_click_successful = right_click(element_to_right_click)
+					right_click_successful = await mac_tree_builder.executor.run(
+						right_click, element_to_right_click, mac_tree_builder.backend, timeout=mac_tree_builder.call_timeout
+					)
 					if right_click_successful:
 						return ActionResult(extracted_content=f'Successfully right clicked element with index {index}')
 					else:
@@ -152,7 +166,9 @@ class Controller:
 						msg = f'❌ Cannot scroll: Element is disabled: {element_to_scroll}'
 						return ActionResult(extracted_content=msg, error=msg)
 						
-					scroll_successful = scroll(element_to_scroll, direction)
+					scroll_successful = await mac_tree_builder.executor.run(
+						scroll, element_to_scroll, direction, mac_tree_builder.backend, timeout=mac_tree_builder.call_timeout
+					)
 					if scroll_successful:
 						return ActionResult(extracted_content=f'Successfully scrolled element with index {index} {direction}')
 					else:
@@ -166,11 +182,47 @@ class Controller:
 				logging.error(msg)
 				return ActionResult(extracted_content=msg, error=msg)
 
+		@self.registry.action(
+			'Show the next or previous rows of a table, outline or list, or jump to start_row',
+			param_model=PageTableAction,
+			requires_mac_builder=True
+		)
+		async def page_table(
+			index: int, direction: Literal['next', 'previous'], start_row: Optional[int], mac_tree_builder: MacUITreeBuilder
+		):
+			logger.debug(f'Paging table {index} {direction}')
+			try:
+				if index in mac_tree_builder._element_cache and mac_tree_builder._element_cache[index].is_table:
+					table = mac_tree_builder._element_cache[index]
+					start, end, total = table.attributes['row_window']
+					if start_row is not None:
+						start = start_row - 1
+					elif direction == 'next':
+						start = end
+					else:
+						start -= mac_tree_builder.table_rows
+					start, end, total = mac_tree_builder.set_row_window(table, start)
+					# Only the table's rows changed, so only its subtree is walked again
+					await mac_tree_builder.build_subtree(table)
+					return ActionResult(
+						extracted_content=f'Table with index {index} now shows rows {start + 1}-{end} of {total}',
+						include_in_memory=True
+					)
+				else:
+					msg = f'❌ Invalid index: {index} is not a table'
+					return ActionResult(extracted_content=msg, error=msg)
+			except Exception as e:
+				msg = f'❌ An error occurred: {str(e)}'
+				logging.error(msg)
+				return ActionResult(extracted_content=msg, error=msg)
+
 		@self.registry.action(
 			'Open a mac app',
 			param_model=OpenAppAction
 		)
 		async def open_app(app_name: str):
+			import Cocoa
+
 			workspace = Cocoa.NSWorkspace.sharedWorkspace()
 			logging.info(f'\nLaunching app: {app_name}...')
 			success = workspace.launchApplication_(app_name)
@@ -186,32 +238,12 @@ class Controller:
 					msg = f'❌ Failed to launch app: {app_name} (and lowercased: {app_name_lower})'
 					return ActionResult(extracted_content=msg, error=msg)
 
-			await asyncio.sleep(1)  # Give it a moment to appear in running apps
-			pid = None
-			for app in workspace.runningApplications():
-				if app.bundleIdentifier() and app_name.lower() in app.bundleIdentifier().lower():
-					logging.debug(f'Bundle ID: {app.bundleIdentifier()}')
-					pid = app.processIdentifier()
-					logging.debug(f'PID: {pid}')
-					break
+			# Poll until the app appears in running apps instead of waiting a fixed second. Each lookup
+			# scans the running apps and the process list, so it runs off the event loop
+			registry = AppRegistry()
+			pid = await poll_until(partial(asyncio.to_thread, registry.find_pid, app_name), max_wait=2.0)
+			logging.debug(f'PID: {pid}')
 
-			# If no PID is found, try to find the app by name with pgrep -i 
-			if pid is None:
-				try:
-					result = subprocess.run(
-						['pgrep', '-i', app_name],
-						capture_output=True,
-						text=True
-					)
-					if result.returncode == 0 and result.stdout.strip():
-						# pgrep might return multiple PIDs, take the first one
-						pid = int(result.stdout.strip().split('\n')[0])
-						logging.debug(f'Found PID using pgrep: {pid}')
-					else:
-						logging.error(f'❌ Failed to find PID for app: {app_name} with pgrep')
-				except Exception as e:
-					logging.error(f'❌ Error while running pgrep: {str(e)}')
-				
 			if pid is None:
 				msg = f'Could not find running app with name: {app_name} in running applications.'
 				logging.error(msg)
@@ -284,9 +316,44 @@ class Controller:
 			logger.debug(f'Executed action {i + 1} / {len(actions)}')
 			if results[-1].is_done or results[-1].error or i == len(actions) - 1:
 				break
+			if check_for_new_elements and not await self._target_present(actions[i + 1], mac_tree_builder):
+				logger.info(
+					f'Element {actions[i + 1].get_index()} disappeared after action {i + 1} / {len(actions)}, stopping the batch'
+				)
+				break
+
+		return results
+
+	async def multi_act_stream(
+		self, actions: AsyncIterator[ActionModel], mac_tree_builder: MacUITreeBuilder, check_for_new_elements: bool = True
+	) -> list[ActionResult]:
+		"""Execute actions as they arrive, e.g. while the model is still writing the rest of them"""
+		results = []
+		action = await anext(actions, None)
+		while action is not None:
+			results.append(await self.act(action, mac_tree_builder))
+
+			logger.debug(f'Executed streamed action {len(results)}')
+			if results[-1].is_done or results[-1].error:
+				break
+			action = await anext(actions, None)
+			if action is not None and check_for_new_elements and not await self._target_present(action, mac_tree_builder):
+				logger.info(f'Element {action.get_index()} disappeared after action {len(results)}, stopping the batch')
+				break
 
 		return results
 
+	async def _target_present(self, action: ActionModel, mac_tree_builder: MacUITreeBuilder) -> bool:
+		"""
+		Whether the element the action targets is still in the UI. With stable indices the index still
+		names the same element after the UI changed, so a batch only has to stop when that element is
+		gone; that takes one attribute read on its AX reference rather than a rebuild.
+		"""
+		index = action.get_index()
+		if not mac_tree_builder.stable_indices or index is None:
+			return True
+		return await mac_tree_builder.element_exists(index)
+
 	@time_execution_sync('--act')
 	async def act(self, action: ActionModel, mac_tree_builder: MacUITreeBuilder) -> ActionResult:
 		"""Execute an action"""
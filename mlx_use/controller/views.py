@@ -30,6 +30,11 @@ class ScrollElementAction(BaseModel):
 	index: int
 	direction: Literal['up', 'down', 'left', 'right']
 
+class PageTableAction(BaseModel):
+	index: int
+	direction: Literal['next', 'previous'] = 'next'
+	start_row: Optional[int] = None  # 1-based row to jump to instead of paging
+
 # # Action Input Models
 # class SearchGoogleAction(BaseModel):
 # 	query: str
@@ -1,23 +1,15 @@
 # --- START OF FILE mac_use/mac/actions.py ---
 import logging
+from typing import Optional
 
-import Cocoa
-from ApplicationServices import (
-	AXUIElementPerformAction, 
-	AXUIElementSetAttributeValue, 
-	kAXPressAction, 
-	kAXValueAttribute, 
-	kAXConfirmAction,
-	AXUIElementCopyActionNames
-)
-from Foundation import NSString
-
+from mlx_use.mac.backend import AccessibilityBackend, default_backend, kAXValueAttribute
 from mlx_use.mac.element import MacElementNode
 
 logger = logging.getLogger(__name__)
 
-def perform_action(element: MacElementNode, action: str) -> bool:
+def perform_action(element: MacElementNode, action: str, backend: Optional[AccessibilityBackend] = None) -> bool:
 	"""Performs a specified accessibility action on an element."""
+	backend = backend or default_backend()
 	try:
 		if not element._element:
 			logger.error(f'❌ Cannot perform action: Element reference is missing for {element}')
@@ -29,7 +21,7 @@ def perform_action(element: MacElementNode, action: str) -> bool:
 			logger.error(f'❌ Action {action} not supported by element {element}. Available actions: {available_actions}')
 			return False
 
-		result = AXUIElementPerformAction(element._element, action)
+		result = backend.perform_action(element._element, action)
 		if result == 0:
 			logger.debug(f'✅ Successfully performed {action} on element: {element}')
 			return True
@@ -40,7 +32,7 @@ def perform_action(element: MacElementNode, action: str) -> bool:
 		logger.error(f'❌ Error performing {action} on element: {element}, {e}')
 		return False
 
-def click(element: MacElementNode, action: str) -> bool:
+def click(element: MacElementNode, action: str, backend: Optional[AccessibilityBackend] = None) -> bool:
 	"""Simulates a click on a Mac UI element."""
 	if not element._element:
 		logger.error(f'❌ Cannot click: Element reference is missing for {element}')
@@ -57,10 +49,11 @@ def click(element: MacElementNode, action: str) -> bool:
 		logger.error(f'❌ Cannot click: Element does not support {action} action: {element}')
 		return False
 
-	return perform_action(element, action)
+	return perform_action(element, action, backend)
 
-def type_into(element: MacElementNode, text: str, submit: bool = False) -> bool:
+def type_into(element: MacElementNode, text: str, submit: bool = False, backend: Optional[AccessibilityBackend] = None) -> bool:
     """Simulates typing text into a Mac UI element with action-based submission"""
+    backend = backend or default_backend()
     try:
         if not element._element:
             logger.error(f'❌ Cannot type: Element reference is missing for {element}')
@@ -72,8 +65,7 @@ def type_into(element: MacElementNode, text: str, submit: bool = False) -> bool:
             return False
 
         # Type the text using attribute setting
-        ns_string = NSString.stringWithString_(text)
-        type_result = AXUIElementSetAttributeValue(element._element, kAXValueAttribute, ns_string)
+        type_result = backend.set_attribute_value(element._element, kAXValueAttribute, text)
         
         if type_result != 0:
             logger.error(f"❌ Failed to type '{text}' into element: {element}, error code: {type_result}")
@@ -85,9 +77,9 @@ def type_into(element: MacElementNode, text: str, submit: bool = False) -> bool:
         if submit:
             available_actions = element.actions
             if 'AXConfirm' in available_actions:
-                return perform_action(element, 'AXConfirm')
+                return perform_action(element, 'AXConfirm', backend)
             elif 'AXPress' in available_actions:
-                return perform_action(element, 'AXPress')
+                return perform_action(element, 'AXPress', backend)
             else:
                 logger.error(f"❌ No suitable submit action found. Available actions: {available_actions}")
                 return False
@@ -98,7 +90,7 @@ def type_into(element: MacElementNode, text: str, submit: bool = False) -> bool:
         logger.error(f'❌ Error typing into element: {element}, {e}')
         return False
 
-def right_click(element: MacElementNode) -> bool:
+def right_click(element: MacElementNode, backend: Optional[AccessibilityBackend] = None) -> bool:
 	"""Simulates a right-click on a Mac UI element."""
 	if not element._element:
 		logger.error(f'❌ Cannot right click: Element reference is missing for {element}')
@@ -111,12 +103,12 @@ def right_click(element: MacElementNode) -> bool:
 
 	# Check for menu action
 	if 'AXShowMenu' in element.actions:
-		return perform_action(element, 'AXShowMenu')
+		return perform_action(element, 'AXShowMenu', backend)
 	else:
 		logger.warning(f"Element does not support AXShowMenu, falling back to regular click for: {element}")
-		return click(element)
+		return click(element, 'AXPress', backend)
 
-def scroll(element: MacElementNode, direction: str) -> bool:
+def scroll(element: MacElementNode, direction: str, backend: Optional[AccessibilityBackend] = None) -> bool:
 	"""
 	Scrolls an element in the specified direction.
 	direction can be: 'left', 'right', 'up', 'down'
@@ -134,7 +126,7 @@ def scroll(element: MacElementNode, direction: str) -> bool:
 
 	action = direction_map[direction]
 	if action in element.actions:
-		return perform_action(element, action)
+		return perform_action(element, action, backend)
 	else:
 		logger.error(f'❌ Element does not support scrolling {direction}: {element}')
 		return False
\ No newline at end of file
@@ -0,0 +1,243 @@
+"""
+Accessibility backends used by the UI tree builder and the Mac actions.
+
+The tree builder never talks to the Accessibility API directly; it goes through an
+`AccessibilityBackend`. `PyObjCBackend` is the real implementation on macOS, while
+`mlx_use.mac.recorded.InMemoryBackend` replays recorded trees so the builder can be
+profiled and regression-tested on any platform.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mlx_use.mac.process import ProcessMonitor
+
+logger = logging.getLogger(__name__)
+
+# AXError codes (HIServices/AXError.h), mirrored so callers don't need PyObjC to compare them
+kAXErrorSuccess = 0
+kAXErrorFailure = -25200
+kAXErrorIllegalArgument = -25201
+kAXErrorInvalidUIElement = -25202
+kAXErrorInvalidUIElementObserver = -25203
+kAXErrorCannotComplete = -25204
+kAXErrorAttributeUnsupported = -25205
+kAXErrorActionUnsupported = -25206
+kAXErrorNotificationUnsupported = -25207
+kAXErrorNotImplemented = -25208
+kAXErrorNotificationAlreadyRegistered = -25209
+kAXErrorNotificationNotRegistered = -25210
+kAXErrorAPIDisabled = -25211
+kAXErrorNoValue = -25212
+
+# Attribute names (HIServices/AXAttributeConstants.h)
+kAXRoleAttribute = 'AXRole'
+kAXSubroleAttribute = 'AXSubrole'
+kAXTitleAttribute = 'AXTitle'
+kAXValueAttribute = 'AXValue'
+kAXDescriptionAttribute = 'AXDescription'
+kAXEnabledAttribute = 'AXEnabled'
+kAXPositionAttribute = 'AXPosition'
+kAXSizeAttribute = 'AXSize'
+kAXChildrenAttribute = 'AXChildren'
+kAXParentAttribute = 'AXParent'
+kAXMainWindowAttribute = 'AXMainWindow'
+kAXWindowsAttribute = 'AXWindows'
+kAXFocusedWindowAttribute = 'AXFocusedWindow'
+kAXFocusedUIElementAttribute = 'AXFocusedUIElement'
+kAXMenuBarAttribute = 'AXMenuBar'
+kAXModalAttribute = 'AXModal'
+kAXRowsAttribute = 'AXRows'
+kAXVisibleRowsAttribute = 'AXVisibleRows'
+kAXColumnsAttribute = 'AXColumns'
+kAXColumnTitlesAttribute = 'AXColumnTitles'
+kAXSelectedAttribute = 'AXSelected'
+kAXDisclosureLevelAttribute = 'AXDisclosureLevel'
+
+
+class AccessibilityBackend(ABC):
+	"""Interface over the Accessibility API calls the tree builder and actions need"""
+
+	@abstractmethod
+	def application_element(self, pid: int) -> Any:
+		"""Return the root accessibility element for an application"""
+
+	@abstractmethod
+	def copy_attribute_value(self, element: Any, attribute: str) -> Tuple[int, Any]:
+		"""Read one attribute, returning `(ax_error, value)`"""
+
+	def copy_multiple_attribute_values(self, element: Any, attributes: List[str]) -> Tuple[int, List[Any]]:
+		"""
+		Read several attributes in one round trip, returning `(ax_error, values)` with `None`
+		for attributes that failed. Backends without a batched call fall back to one read per attribute.
+		"""
+		values = []
+		for attribute in attributes:
+			error, value = self.copy_attribute_value(element, attribute)
+			if error == kAXErrorCannotComplete:
+				return error, []
+			values.append(value if error == kAXErrorSuccess else None)
+		return kAXErrorSuccess, values
+
+	@abstractmethod
+	def copy_action_names(self, element: Any) -> Tuple[int, List[str]]:
+		"""Read the action names of an element, returning `(ax_error, actions)`"""
+
+	@abstractmethod
+	def perform_action(self, element: Any, action: str) -> int:
+		"""Perform an action on an element, returning the AX error code"""
+
+	@abstractmethod
+	def set_attribute_value(self, element: Any, attribute: str, value: Any) -> int:
+		"""Set an attribute on an element, returning the AX error code"""
+
+	def is_process_running(self, pid: int) -> bool:
+		"""Check whether the process owning an application is still alive"""
+		return ProcessMonitor().is_alive(pid)
+
+	def set_messaging_timeout(self, seconds: float) -> None:
+		"""Bound how long each accessibility call waits for an unresponsive app"""
+
+	def add_observer(self, pid: int, notifications: List[str], callback: Callable[[Any, str], None]) -> Optional[Any]:
+		"""
+		Subscribe `callback(element, notification)` to notifications from an application.
+		Returns an observer handle, or None if the backend can't deliver notifications.
+		"""
+		return None
+
+	def remove_observer(self, observer: Any) -> None:
+		"""Stop delivering notifications for an observer returned by `add_observer`"""
+
+	def pump_notifications(self) -> None:
+		"""Deliver notifications that are waiting to be dispatched to observer callbacks"""
+
+	def children(self, element: Any) -> List[Any]:
+		"""Return the children of an element (empty if it has none or the read failed)"""
+		error, children = self.copy_attribute_value(element, kAXChildrenAttribute)
+		if error != kAXErrorSuccess or not children:
+			return []
+		return list(children)
+
+	def element_id(self, element: Any) -> str:
+		"""Stable string identifier for an element within one snapshot"""
+		return str(element)
+
+	def decode_value(self, value: Any) -> Any:
+		"""Convert a backend value (e.g. an AXValueRef) into a plain Python value"""
+		return value
+
+
+class PyObjCBackend(AccessibilityBackend):
+	"""Accessibility backend calling the macOS Accessibility API through PyObjC"""
+
+	def __init__(self):
+		# Imported here so the rest of the package stays importable off macOS
+		import ApplicationServices
+		import CoreFoundation
+
+		self._ax = ApplicationServices
+		self._cf = CoreFoundation
+		# observer -> (callback, run loop); keeps the Python callbacks alive while registered
+		self._observers: Dict[Any, Tuple[Callable, Any]] = {}
+
+	def application_element(self, pid: int) -> Any:
+		return self._ax.AXUIElementCreateApplication(pid)
+
+	def copy_attribute_value(self, element: Any, attribute: str) -> Tuple[int, Any]:
+		return self._ax.AXUIElementCopyAttributeValue(element, attribute, None)
+
+	def copy_multiple_attribute_values(self, element: Any, attributes: List[str]) -> Tuple[int, List[Any]]:
+		ax = self._ax
+		error, values = ax.AXUIElementCopyMultipleAttributeValues(element, attributes, 0, None)
+		if error != kAXErrorSuccess or values is None:
+			return error, []
+		# Failed attributes come back in place as AXValueRefs of type kAXValueAXErrorType
+		results = []
+		for value in values:
+			try:
+				if ax.CFGetTypeID(value) == ax.AXValueGetTypeID() and ax.AXValueGetType(value) == ax.kAXValueAXErrorType:
+					value = None
+			except Exception:
+				pass
+			results.append(value)
+		return error, results
+
+	def copy_action_names(self, element: Any) -> Tuple[int, List[str]]:
+		error, actions = self._ax.AXUIElementCopyActionNames(element, None)
+		return error, list(actions) if actions else []
+
+	def perform_action(self, element: Any, action: str) -> int:
+		return self._ax.AXUIElementPerformAction(element, action)
+
+	def set_attribute_value(self, element: Any, attribute: str, value: Any) -> int:
+		if isinstance(value, str):
+			from Foundation import NSString
+
+			value = NSString.stringWithString_(value)
+		return self._ax.AXUIElementSetAttributeValue(element, attribute, value)
+
+	def set_messaging_timeout(self, seconds: float) -> None:
+		# Setting it on the system-wide element changes the default for every element
+		error = self._ax.AXUIElementSetMessagingTimeout(self._ax.AXUIElementCreateSystemWide(), seconds)
+		if error != kAXErrorSuccess:
+			logger.debug(f'AXUIElementSetMessagingTimeout failed: {error}')
+
+	def add_observer(self, pid: int, notifications: List[str], callback: Callable[[Any, str], None]) -> Optional[Any]:
+		ax, cf = self._ax, self._cf
+
+		def on_notification(observer, element, notification, refcon):
+			callback(element, notification)
+
+		error, observer = ax.AXObserverCreate(pid, on_notification, None)
+		if error != kAXErrorSuccess or observer is None:
+			logger.debug(f'AXObserverCreate failed for pid {pid}: {error}')
+			return None
+
+		app_ref = ax.AXUIElementCreateApplication(pid)
+		for notification in notifications:
+			error = ax.AXObserverAddNotification(observer, app_ref, notification, None)
+			if error != kAXErrorSuccess:
+				logger.debug(f'Could not observe {notification} for pid {pid}: {error}')
+
+		run_loop = cf.CFRunLoopGetCurrent()
+		cf.CFRunLoopAddSource(run_loop, ax.AXObserverGetRunLoopSource(observer), cf.kCFRunLoopDefaultMode)
+		self._observers[observer] = (on_notification, run_loop)
+		return observer
+
+	def remove_observer(self, observer: Any) -> None:
+		entry = self._observers.pop(observer, None)
+		if entry is None:
+			return
+		_, run_loop = entry
+		self._cf.CFRunLoopRemoveSource(run_loop, self._ax.AXObserverGetRunLoopSource(observer), self._cf.kCFRunLoopDefaultMode)
+
+	def pump_notifications(self) -> None:
+		# Process every source that is already signalled, without blocking
+		self._cf.CFRunLoopRunInMode(self._cf.kCFRunLoopDefaultMode, 0, False)
+
+	def decode_value(self, value: Any) -> Any:
+		ax = self._ax
+		try:
+			if ax.AXValueGetTypeID() == ax.CFGetTypeID(value):
+				value_type = ax.AXValueGetType(value)
+				if value_type == ax.kAXValueCGPointType:
+					_, point = ax.AXValueGetValue(value, value_type, None)
+					return (point.x, point.y)
+				if value_type == ax.kAXValueCGSizeType:
+					_, size = ax.AXValueGetValue(value, value_type, None)
+					return (size.width, size.height)
+		except Exception as e:
+			logger.debug(f'Could not decode AX value {value}: {e}')
+		return value
+
+
+_default_backend: Optional[AccessibilityBackend] = None
+
+
+def default_backend() -> AccessibilityBackend:
+	"""Shared PyObjC backend, created on first use"""
+	global _default_backend
+	if _default_backend is None:
+		_default_backend = PyObjCBackend()
+	return _default_backend
@@ -0,0 +1,102 @@
+"""
+Differences between two UI tree snapshots, as seen by the model.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
+
+# ('i', highlight index) for interactive elements, ('c', accessibility path, occurrence) for context ones
+ElementKey = Tuple
+
+
+@dataclass
+class TreeSnapshot:
+	"""
+	The prompt lines of a tree, keyed by element identity.
+
+	Taken as a copy so the tree can be patched in place (incremental builds) without
+	changing a snapshot that was already sent to the model.
+	"""
+
+	lines: Dict[ElementKey, str] = field(default_factory=dict)
+
+	@classmethod
+	def from_tree(cls, root: MacElementNode, encoding: PromptEncoding = 'verbose') -> 'TreeSnapshot':
+		return cls.from_nodes(root.iter_prompt_elements(), encoding)
+
+	@classmethod
+	def from_nodes(cls, nodes: Iterable[MacElementNode], encoding: PromptEncoding = 'verbose') -> 'TreeSnapshot':
+		"""Snapshot of just these prompt elements, e.g. those a token-budgeted state actually showed"""
+		lines: Dict[ElementKey, str] = {}
+		occurrences: Counter = Counter()
+		for node in nodes:
+			if node.highlight_index is not None:
+				key = ('i', node.highlight_index)
+			else:
+				path = node.accessibility_path
+				key = ('c', path, occurrences[path])
+				occurrences[path] += 1
+			lines[key] = node.get_prompt_line(encoding)
+		return cls(lines)
+
+	@property
+	def interactive_count(self) -> int:
+		return sum(1 for key in self.lines if key[0] == 'i')
+
+	@property
+	def context_count(self) -> int:
+		return len(self.lines) - self.interactive_count
+
+
+@dataclass
+class TreeDiff:
+	"""Prompt lines added, removed and changed between two snapshots"""
+
+	added: List[str] = field(default_factory=list)
+	removed: List[str] = field(default_factory=list)
+	# (old line, new line)
+	changed: List[Tuple[str, str]] = field(default_factory=list)
+	unchanged_interactive: int = 0
+	unchanged_context: int = 0
+
+	def __bool__(self) -> bool:
+		return bool(self.added or self.removed or self.changed)
+
+	def to_string(self) -> str:
+		"""Render as '+' added, '-' removed and '~' changed lines, followed by an unchanged summary"""
+		lines = [f'+ {line}' for line in self.added]
+		lines += [f'- {line}' for line in self.removed]
+		lines += [f'~ {new}' for _, new in self.changed]
+		if not lines:
+			lines.append('No changes.')
+		lines.append(
+			f'Unchanged: {self.unchanged_interactive} interactive and {self.unchanged_context} context elements'
+		)
+		return '\n'.join(lines)
+
+
+def diff_snapshots(old: TreeSnapshot, new: TreeSnapshot) -> TreeDiff:
+	"""Compare two snapshots; new elements are listed in document order"""
+	diff = TreeDiff()
+	for key, line in new.lines.items():
+		old_line = old.lines.get(key)
+		if old_line is None:
+			diff.added.append(line)
+		elif old_line != line:
+			diff.changed.append((old_line, line))
+		elif key[0] == 'i':
+			diff.unchanged_interactive += 1
+		else:
+			diff.unchanged_context += 1
+	diff.removed = [line for key, line in old.lines.items() if key not in new.lines]
+	return diff
+
+
+def diff_trees(old: Optional[MacElementNode], new: MacElementNode) -> TreeDiff:
+	"""Compare two trees; a missing old tree makes every element an addition"""
+	old_snapshot = TreeSnapshot.from_tree(old) if old is not None else TreeSnapshot()
+	return diff_snapshots(old_snapshot, TreeSnapshot.from_tree(new))
@@ -1,29 +1,88 @@
 # --- START OF FILE mac_use/mac/element.py ---
-from dataclasses import dataclass, field
-from typing import Optional, Dict, List, Any
-from functools import cached_property
+import sys
+import weakref
+from typing import Optional, Dict, Iterator, List, Any, Tuple
+
+from mlx_use.mac.encoding import PromptEncoding, compact_line
+
+# Action lists repeat across thousands of elements, so nodes share one tuple per distinct list
+_interned_actions: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def intern_string(value: Any) -> Any:
+    """Intern a string (PyObjC returns str subclasses, which sys.intern rejects); other values pass through"""
+    if isinstance(value, str):
+        return sys.intern(str(value))
+    return value
+
+
+def intern_actions(actions: List[str]) -> Tuple[str, ...]:
+    """Shared tuple for an action list"""
+    key = tuple(sys.intern(str(action)) for action in actions)
+    return _interned_actions.setdefault(key, key)
+
 
-@dataclass
 class MacElementNode:
     """Represents a UI element in macOS with enhanced accessibility information"""
-    # Required fields
-    role: str
-    identifier: str
-    attributes: Dict[str, Any]
-    is_visible: bool
-    app_pid: int
-
-    # Optional fields
-    children: List['MacElementNode'] = field(default_factory=list)
-    parent: Optional['MacElementNode'] = None
-    is_interactive: bool = False
-    highlight_index: Optional[int] = None
-    _element = None  # Store AX element reference
+
+    # Slots instead of a per-node __dict__: large trees hold tens of thousands of nodes
+    __slots__ = (
+        'role',
+        'identifier',
+        'attributes',
+        'is_visible',
+        'app_pid',
+        'children',
+        '_parent',
+        'is_interactive',
+        'highlight_index',
+        '_element',
+        '_accessibility_path',
+        '_prompt_cache',
+        '_detail_cache',
+        '__weakref__',
+    )
+
+    def __init__(
+        self,
+        role: str,
+        identifier: str,
+        attributes: Dict[str, Any],
+        is_visible: bool,
+        app_pid: int,
+        children: Optional[List['MacElementNode']] = None,
+        parent: Optional['MacElementNode'] = None,
+        is_interactive: bool = False,
+        highlight_index: Optional[int] = None,
+    ):
+        self.role = intern_string(role)
+        self.identifier = identifier
+        self.attributes = attributes
+        self.is_visible = is_visible
+        self.app_pid = app_pid
+        self.children = children if children is not None else []
+        self.parent = parent
+        self.is_interactive = is_interactive
+        self.highlight_index = highlight_index
+        self._element = None  # Store AX element reference
+        self._accessibility_path: Optional[str] = None
+        # Formatted lines, reused while the node is unchanged; see get_prompt_line
+        self._prompt_cache: Optional[tuple] = None
+        self._detail_cache: Optional[tuple] = None
+
+    @property
+    def parent(self) -> Optional['MacElementNode']:
+        """Parent node; a weak link so trees are freed by reference counting alone (no cycles)"""
+        return self._parent() if self._parent is not None else None
+
+    @parent.setter
+    def parent(self, parent: Optional['MacElementNode']) -> None:
+        self._parent = weakref.ref(parent) if parent is not None else None
 
     @property
     def actions(self) -> List[str]:
         """Get the list of available actions for this element"""
-        return self.attributes.get('actions', [])
+        return list(self.attributes.get('actions', ()))
 
     @property
     def enabled(self) -> bool:
@@ -74,42 +133,109 @@ class MacElementNode:
         
         return role_str
 
-    def get_clickable_elements_string(self) -> str:
+    @property
+    def is_table(self) -> bool:
+        """Table, outline or list whose rows were read as a window (builder table_rows mode)"""
+        return 'row_window' in self.attributes
+
+    @property
+    def is_table_row(self) -> bool:
+        """Compact row of a windowed table"""
+        return self.parent is not None and self.parent.is_table
+
+    @property
+    def is_context(self) -> bool:
+        """Non-interactive AXStaticText or read-only AXTextField shown to the model for context"""
+        return (self.role in ['AXStaticText', 'AXTextField'] and
+                not self.is_interactive and
+                (self.parent is None or self.parent.role == 'AXWindow' or self.parent.is_interactive))
+
+    def get_prompt_line(self, encoding: PromptEncoding = 'verbose') -> Optional[str]:
+        """
+        Line for this element in get_clickable_elements_string, or None if it isn't listed.
+
+        Lines are cached on the node until its attributes, index or listing change. The builder
+        replaces a node's attributes dict whenever it re-reads the element, so the cache checks
+        that dict's identity instead of hashing its contents; code that edits attributes in place
+        must call invalidate_prompt_cache.
+        """
+        label = self.attributes.get('window_label')
+        is_row = self.is_table_row
+        is_context = self.is_context
+        if self.highlight_index is None and not is_context and not is_row:
+            # Windows, sheets and apps of a multi-window snapshot head their elements
+            return f'=== {label} ===' if label else None
+
+        key = (self.highlight_index, is_row, is_context, label, encoding)
+        cache = self._prompt_cache
+        if cache is not None and cache[0] is self.attributes and cache[1] == key:
+            return cache[2]
+
+        line = compact_line(self) if encoding == 'compact' else self._verbose_line(is_row)
+        if label:
+            line = f'=== {label} ===\n{line}'
+        self._prompt_cache = (self.attributes, key, line)
+        return line
+
+    def _verbose_line(self, is_row: bool) -> str:
+        # Build attributes string
+        attrs_str = ''
+        important_attrs = ['title', 'value', 'description', 'enabled']
+        for key in important_attrs:
+            if key in self.attributes:
+                attrs_str += f' {key}="{self.attributes[key]}"'
+
+        # Only set when the builder prunes offscreen elements
+        if self.attributes.get('partially_visible'):
+            attrs_str += ' partially_visible="True"'
+
+        if 'row' in self.attributes:
+            attrs_str += f' row="{self.attributes["row"]}"'
+            if self.attributes.get('selected'):
+                attrs_str += ' selected="True"'
+        if self.is_table:
+            if 'columns' in self.attributes:
+                attrs_str += f' columns="{self.attributes["columns"]}"'
+            start, end, total = self.attributes['row_window']
+            attrs_str += f' rows="{start + 1}-{end} of {total}"' if end > start else f' rows="0 of {total}"'
+
+        # Add actions if available
+        if self.actions:
+            attrs_str += f' actions="{", ".join(self.actions)}"'
+
+        if self.is_table:
+            return f'{self.highlight_index}[:]<{self.role}{attrs_str}> [table]'
+        elif self.highlight_index is not None:
+            # Interactive element with numeric index
+            return f'{self.highlight_index}[:]<{self.role}{attrs_str}> [interactive]'
+        elif is_row:
+            return f'_[:]<{self.role}{attrs_str}> [row]'
+        else:
+            # Context element with "_" index
+            return f'_[:]<{self.role}{attrs_str}> [context]'
+
+    def invalidate_prompt_cache(self) -> None:
+        """Forget the cached prompt and detail lines, e.g. after changing attributes in place"""
+        self._prompt_cache = None
+        self._detail_cache = None
+
+    @property
+    def is_prompt_element(self) -> bool:
+        """Whether get_prompt_line gives this element a line: interactive, context, table row or window header"""
+        return self.highlight_index is not None or self.is_context or self.is_table_row or 'window_label' in self.attributes
+
+    def iter_prompt_elements(self) -> Iterator['MacElementNode']:
+        """Interactive and context elements of the subtree in document order"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_prompt_element:
+                yield node
+            stack.extend(reversed(node.children))
+
+    def get_clickable_elements_string(self, encoding: PromptEncoding = 'verbose') -> str:
         """Convert the UI tree to a string representation focusing on interactive and context elements"""
-        formatted_text = []
-
-        def process_node(node: 'MacElementNode', depth: int) -> None:
-            # Build attributes string
-            attrs_str = ''
-            important_attrs = ['title', 'value', 'description', 'enabled']
-            for key in important_attrs:
-                if key in node.attributes:
-                    attrs_str += f' {key}="{node.attributes[key]}"'
-            
-            # Add actions if available
-            if node.actions:
-                attrs_str += f' actions="{", ".join(node.actions)}"'
-
-            # Include both interactive and context elements
-            if node.highlight_index is not None:
-                # Interactive element with numeric index
-                formatted_text.append(
-                    f'{node.highlight_index}[:]<{node.role}{attrs_str}> [interactive]'
-                )
-            # Check if this is a context element (non-interactive AXStaticText or read-only AXTextField)
-            elif (node.role in ['AXStaticText', 'AXTextField'] and 
-                  not node.is_interactive and 
-                  (node.parent is None or node.parent.role == 'AXWindow' or node.parent.is_interactive)):
-                # Context element with "_" index
-                formatted_text.append(
-                    f'_[:]<{node.role}{attrs_str}> [context]'
-                )
-
-            for child in node.children:
-                process_node(child, depth + 1)
-
-        process_node(self, 0)
-        return '\n'.join(formatted_text)
+        return '\n'.join(node.get_prompt_line(encoding) for node in self.iter_prompt_elements())
 
     def get_detailed_info(self) -> str:
         """Return a detailed string with all attributes of the element"""
@@ -137,61 +263,99 @@ class MacElementNode:
         return ", ".join(details)
 
     def get_detailed_string(self, indent: int = 0) -> str:
-        """Recursively build a detailed string representation of the UI tree"""
-        spaces = " " * indent
-        result = f"{spaces}{self.__repr__()}\n{spaces}Details: {self.get_detailed_info()}"
-        for child in self.children:
-            result += "\n" + child.get_detailed_string(indent + 2)
-        return result
-
-    @cached_property
+        """Build a detailed string representation of the UI tree"""
+        parts = []
+        stack = [(self, indent)]
+        while stack:
+            node, depth = stack.pop()
+            spaces = " " * depth
+            description, details = node._detail_lines()
+            parts.append(f"{spaces}{description}\n{spaces}Details: {details}")
+            stack.extend((child, depth + 2) for child in reversed(node.children))
+        return "\n".join(parts)
+
+    def _detail_lines(self) -> Tuple[str, str]:
+        """(repr, detailed info), cached like the prompt line"""
+        key = (self.role, self.identifier, self.is_interactive, self.is_visible, self.highlight_index)
+        cache = self._detail_cache
+        if cache is not None and cache[0] is self.attributes and cache[1] == key:
+            return cache[2]
+        lines = (self.__repr__(), self.get_detailed_info())
+        self._detail_cache = (self.attributes, key, lines)
+        return lines
+
+    @property
     def accessibility_path(self) -> str:
         """Generate a unique path to this element including more identifiers"""
-        path_components = []
+        if self._accessibility_path is not None:
+            return self._accessibility_path
+
+        # Build on the nearest ancestor whose path is already known
+        pending = []
         current = self
-        while current.parent is not None:
-            role = current.role
-            
-            # Add identifiers to make the path more specific
-            identifiers = []
-            if 'title' in current.attributes:
-                identifiers.append(f"title={current.attributes['title']}")
-            if 'description' in current.attributes:
-                identifiers.append(f"desc={current.attributes['description']}")
-                
-            # Count siblings with same role
-            siblings = [s for s in current.parent.children if s.role == role]
-            if len(siblings) > 1:
-                idx = siblings.index(current) + 1
-                path_component = f"{role}[{idx}]"
-            else:
-                path_component = role
-                
-            # Add identifiers if available
-            if identifiers:
-                path_component += f"({','.join(identifiers)})"
-                
-            path_components.append(path_component)
+        while current.parent is not None and current._accessibility_path is None:
+            pending.append(current)
             current = current.parent
-            
-        path_components.reverse()
-        return '/' + '/'.join(path_components)
+        prefix = current._accessibility_path if current.parent is not None else ''
+
+        for current in reversed(pending):
+            # Count siblings with same role
+            siblings = [s for s in current.parent.children if s.role == current.role]
+            position = next(i for i, s in enumerate(siblings) if s is current) + 1
+            prefix = f'{prefix}/{current.path_component(position, len(siblings))}'
+            current._accessibility_path = prefix
+
+        return prefix or '/'
+
+    def path_component(self, position: int, same_role_siblings: int) -> str:
+        """This node's step in its accessibility path, given its 1-based position among siblings of its role"""
+        role = self.role
+
+        # Add identifiers to make the path more specific
+        identifiers = []
+        if 'title' in self.attributes:
+            identifiers.append(f"title={self.attributes['title']}")
+        if 'description' in self.attributes:
+            identifiers.append(f"desc={self.attributes['description']}")
+
+        if self.parent is not None and self.parent.is_table and 'row' in self.attributes:
+            # Windowed rows are numbered by their row, so a row keeps its path when the window moves
+            path_component = f"{role}[{self.attributes['row']}]"
+        elif same_role_siblings > 1:
+            path_component = f"{role}[{position}]"
+        else:
+            path_component = role
+
+        # Add identifiers if available
+        if identifiers:
+            path_component += f"({','.join(identifiers)})"
+        return path_component
+
+    def invalidate_accessibility_path(self) -> None:
+        """Forget the cached path, e.g. after the node's siblings or attributes were patched"""
+        self._accessibility_path = None
+
+    def iter_subtree(self) -> Iterator['MacElementNode']:
+        """This node and its descendants in document order"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
     def find_element_by_path(self, path: str) -> Optional['MacElementNode']:
         """Find an element using its accessibility path"""
-        if self.accessibility_path == path:
-            return self
-        for child in self.children:
-            result = child.find_element_by_path(path)
-            if result:
-                return result
+        # Only descend into children whose own path leads to `path`
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node_path = node.accessibility_path
+            if node_path == path:
+                return node
+            if node.parent is None or path.startswith(node_path + '/'):
+                stack.extend(reversed(node.children))
         return None
 
     def find_elements_by_action(self, action: str) -> List['MacElementNode']:
         """Find all elements that support a specific action"""
-        elements = []
-        if action in self.actions:
-            elements.append(self)
-        for child in self.children:
-            elements.extend(child.find_elements_by_action(action))
-        return elements
\ No newline at end of file
+        return [node for node in self.iter_subtree() if action in node.attributes.get('actions', ())]
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Compact encoding of UI state lines.
+
+The verbose encoding spells every element out as
+`12[:]<AXButton title="Save" enabled="True" actions="AXPress"> [interactive]`; the compact one
+writes the same element as `12:btn "Save"`. Roles are abbreviated, actions are left out when
+they are the role's usual ones, `enabled` only appears when false and long values are cut.
+"""
+
+from typing import TYPE_CHECKING, Dict, FrozenSet, Literal
+
+if TYPE_CHECKING:
+	from mlx_use.mac.element import MacElementNode
+
+PromptEncoding = Literal['verbose', 'compact']
+
+ROLE_ABBREVIATIONS: Dict[str, str] = {
+	'AXApplication': 'app',
+	'AXButton': 'btn',
+	'AXCell': 'cell',
+	'AXCheckBox': 'chk',
+	'AXColumn': 'col',
+	'AXComboBox': 'combo',
+	'AXDisclosureTriangle': 'disclose',
+	'AXGroup': 'grp',
+	'AXImage': 'img',
+	'AXIncrementor': 'stepper',
+	'AXLink': 'link',
+	'AXList': 'list',
+	'AXMenu': 'menu',
+	'AXMenuBar': 'menubar',
+	'AXMenuBarItem': 'menubaritem',
+	'AXMenuButton': 'menubtn',
+	'AXMenuItem': 'item',
+	'AXOutline': 'outline',
+	'AXPopUpButton': 'popup',
+	'AXRadioButton': 'radio',
+	'AXRow': 'row',
+	'AXScrollArea': 'scroll',
+	'AXScrollBar': 'scrollbar',
+	'AXSheet': 'sheet',
+	'AXSlider': 'slider',
+	'AXSplitGroup': 'split',
+	'AXStaticText': 'text',
+	'AXTabGroup': 'tabs',
+	'AXTable': 'table',
+	'AXTextArea': 'textarea',
+	'AXTextField': 'field',
+	'AXToolbar': 'toolbar',
+	'AXWebArea': 'web',
+	'AXWindow': 'win',
+}
+
+# Actions an element of the role almost always has; only other action sets are written out
+DEFAULT_ACTIONS: Dict[str, FrozenSet[str]] = {
+	'AXButton': frozenset({'AXPress'}),
+	'AXCheckBox': frozenset({'AXPress'}),
+	'AXRadioButton': frozenset({'AXPress'}),
+	'AXLink': frozenset({'AXPress'}),
+	'AXDisclosureTriangle': frozenset({'AXPress'}),
+	'AXPopUpButton': frozenset({'AXPress', 'AXShowMenu'}),
+	'AXMenuButton': frozenset({'AXPress', 'AXShowMenu'}),
+	'AXMenuItem': frozenset({'AXPress', 'AXCancel'}),
+	'AXMenuBarItem': frozenset({'AXPress', 'AXCancel'}),
+	'AXTextField': frozenset({'AXConfirm', 'AXSetValue'}),
+	'AXTextArea': frozenset({'AXConfirm', 'AXSetValue'}),
+	'AXComboBox': frozenset({'AXConfirm', 'AXSetValue', 'AXShowMenu'}),
+	'AXSlider': frozenset({'AXIncrement', 'AXDecrement'}),
+	'AXIncrementor': frozenset({'AXIncrement', 'AXDecrement'}),
+	'AXWindow': frozenset({'AXRaise'}),
+	'AXRow': frozenset({'AXShowMenu'}),
+}
+
+MAX_VALUE_LENGTH = 80
+
+
+def abbreviate_role(role: str) -> str:
+	return ROLE_ABBREVIATIONS.get(role) or (role[2:] if role.startswith('AX') else role)
+
+
+def _quote(text: str, max_length: int) -> str:
+	text = str(text).replace('\n', ' ')
+	if len(text) > max_length:
+		text = text[: max_length - 1] + '…'
+	return '"' + text.replace('"', "'") + '"'
+
+
+def compact_line(node: 'MacElementNode', max_value_length: int = MAX_VALUE_LENGTH) -> str:
+	"""Compact prompt line of a listed element (one get_prompt_line would return a line for)"""
+	attributes = node.attributes
+	if node.highlight_index is not None:
+		prefix = f'{node.highlight_index}:'
+	else:
+		prefix = '_:'
+	parts = [prefix + abbreviate_role(node.role)]
+
+	# The title is the element's name, so it goes first without a key
+	if 'title' in attributes:
+		parts.append(_quote(attributes['title'], max_value_length))
+	if 'value' in attributes:
+		parts.append('v=' + _quote(attributes['value'], max_value_length))
+	if 'description' in attributes:
+		parts.append('d=' + _quote(attributes['description'], max_value_length))
+	if 'row' in attributes:
+		parts.append(f'row={attributes["row"]}')
+		if attributes.get('selected'):
+			parts.append('sel')
+	if node.is_table:
+		if 'columns' in attributes:
+			parts.append('cols=' + _quote(attributes['columns'], max_value_length))
+		start, end, total = attributes['row_window']
+		parts.append(f'rows={start + 1}-{end}/{total}' if end > start else f'rows=0/{total}')
+	if attributes.get('enabled') is False:
+		parts.append('off')
+	if attributes.get('partially_visible'):
+		parts.append('part')
+
+	actions = attributes.get('actions', ())
+	if actions and frozenset(actions) != DEFAULT_ACTIONS.get(node.role):
+		parts.append('a=' + ','.join(action[2:] if action.startswith('AX') else action for action in actions))
+	if node.highlight_index is None and not node.is_table_row:
+		parts.append('ctx')
+	return ' '.join(parts)
+
+
+def compact_legend(tables: bool = True) -> str:
+	"""How to read the compact encoding, for the system prompt; `tables` adds the windowed table rows"""
+	roles = ', '.join(f'{short}={role}' for role, short in ROLE_ABBREVIATIONS.items())
+	defaults = '; '.join(
+		f'{ROLE_ABBREVIATIONS[role]}: {",".join(sorted(action[2:] for action in actions))}'
+		for role, actions in DEFAULT_ACTIONS.items()
+	)
+	line_format = '\'<index>:<role> "title" v="value" d="description" [flags] [a=Actions]\''
+	legend = f"""   - One element per line: {line_format} (e.g., '12:btn "Save"').
+   - '_:' instead of an index marks elements you can't act on; 'ctx' marks context elements (e.g., '_:text v="20" ctx').
+   - Flags: off = disabled, sel = selected row, part = partially visible; long values end with '…'.
+   - Roles: {roles}; other roles drop their 'AX' prefix.
+   - Actions ('a=', without the 'AX' prefix) are listed only when they differ from the role's usual ones: {defaults}."""
+	if tables:
+		table_format = '\'<index>:table cols="..." rows=1-50/500\''
+		legend += f"\n   - Tables: {table_format} followed by their rows ('row=12'); use page_table to see other rows."
+	return legend
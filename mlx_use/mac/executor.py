@@ -0,0 +1,163 @@
+"""
+Dedicated accessibility worker thread.
+
+Accessibility calls are blocking IPC into the target app, so a slow or hung app would freeze the
+asyncio event loop. `AccessibilityExecutor` runs them on a single worker thread that also owns
+the run loop AX observers are scheduled on, and exposes an async API with timeouts and
+cooperative cancellation.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional, TypeVar
+
+from mlx_use.mac.backend import AccessibilityBackend
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar('R')
+
+
+class AccessibilityTimeoutError(TimeoutError):
+	"""An accessibility call did not finish within its timeout"""
+
+
+class _WorkItem:
+	__slots__ = ('fn', 'args', 'kwargs', 'loop', 'future', 'cancelled')
+
+	def __init__(self, fn: Callable, args: tuple, kwargs: dict, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+		self.fn = fn
+		self.args = args
+		self.kwargs = kwargs
+		self.loop = loop
+		self.future = future
+		self.cancelled = False
+
+
+class AccessibilityExecutor:
+	"""Runs accessibility work on one worker thread with its own run loop"""
+
+	def __init__(
+		self,
+		backend: Optional[AccessibilityBackend] = None,
+		messaging_timeout: Optional[float] = 2.0,
+		poll_interval: float = 0.05,
+		name: str = 'mlx-use-accessibility',
+	):
+		self.backend = backend
+		# Upper bound for each AX IPC call (AXUIElementSetMessagingTimeout), so a hung app can't block the worker forever
+		self.messaging_timeout = messaging_timeout
+		self.poll_interval = poll_interval
+		self.name = name
+		self._queue: 'queue.Queue[Optional[_WorkItem]]' = queue.Queue()
+		self._thread: Optional[threading.Thread] = None
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def start(self) -> None:
+		with self._lock:
+			if self._thread is not None and self._thread.is_alive():
+				return
+			self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+			self._thread.start()
+
+	def shutdown(self, wait: bool = True) -> None:
+		"""Stop the worker after the work already queued"""
+		with self._lock:
+			thread, self._thread = self._thread, None
+		if thread is None:
+			return
+		self._queue.put(None)
+		if wait and thread is not threading.current_thread():
+			thread.join()
+
+	@property
+	def on_worker_thread(self) -> bool:
+		return self._thread is not None and threading.current_thread() is self._thread
+
+	def should_stop(self) -> bool:
+		"""Whether the work item running on the worker has been cancelled or timed out"""
+		item = getattr(self._local, 'item', None)
+		return item is not None and item.cancelled
+
+	async def run(self, fn: Callable[..., R], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> R:
+		"""Run `fn(*args, **kwargs)` on the worker thread and await its result"""
+		if self.on_worker_thread:
+			return fn(*args, **kwargs)
+
+		self.start()
+		loop = asyncio.get_running_loop()
+		item = _WorkItem(fn, args, kwargs, loop, loop.create_future())
+		self._queue.put(item)
+		try:
+			return await asyncio.wait_for(asyncio.shield(item.future), timeout)
+		except asyncio.TimeoutError:
+			item.cancelled = True
+			name = getattr(fn, '__name__', repr(fn))
+			raise AccessibilityTimeoutError(f'Accessibility call {name} timed out after {timeout}s') from None
+		except asyncio.CancelledError:
+			item.cancelled = True
+			raise
+
+	def _worker(self) -> None:
+		if self.backend is not None and self.messaging_timeout is not None:
+			try:
+				self.backend.set_messaging_timeout(self.messaging_timeout)
+			except Exception as e:
+				logger.debug(f'Could not set accessibility messaging timeout: {e}')
+
+		while True:
+			try:
+				item = self._queue.get(timeout=self.poll_interval)
+			except queue.Empty:
+				self._pump()
+				continue
+			if item is None:
+				break
+			if not item.cancelled:
+				self._execute(item)
+			# Don't keep the finished item (and the result in its future) alive while idle
+			item = None
+			self._pump()
+
+	def _execute(self, item: _WorkItem) -> None:
+		self._local.item = item
+		try:
+			result, error = item.fn(*item.args, **item.kwargs), None
+		except BaseException as e:
+			result, error = None, e
+		finally:
+			self._local.item = None
+		# Clear the thread-local first so the item and its result are not kept alive once the future is resolved
+		self._resolve(item, result, error)
+
+	async def wait_idle(self) -> None:
+		"""Wait until the worker has finished the work queued so far and dropped its references to it"""
+		if self._thread is not None and not self.on_worker_thread:
+			await self.run(lambda: None)
+
+	def _resolve(self, item: _WorkItem, result: Any, error: Optional[BaseException]) -> None:
+		def set_result():
+			if item.future.done() or item.cancelled:
+				return
+			if error is not None:
+				item.future.set_exception(error)
+			else:
+				item.future.set_result(result)
+
+		try:
+			item.loop.call_soon_threadsafe(set_result)
+		except RuntimeError:
+			# The event loop that submitted the work is closed
+			pass
+
+	def _pump(self) -> None:
+		"""Dispatch pending AX notifications to observers scheduled on this thread's run loop"""
+		if self.backend is None:
+			return
+		try:
+			self.backend.pump_notifications()
+		except Exception as e:
+			logger.debug(f'Error pumping accessibility notifications: {e}')
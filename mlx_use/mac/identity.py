@@ -0,0 +1,89 @@
+"""
+Element identity across UI tree snapshots.
+
+Matches the interactive nodes of a new snapshot to those of the previous one so an element keeps
+its highlight index from step to step.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from mlx_use.mac.element import MacElementNode
+
+logger = logging.getLogger(__name__)
+
+Signature = Tuple[str, Any, Any, Any]
+
+
+def _signature(node: MacElementNode) -> Signature:
+	"""Attributes that usually identify an element when neither its AX reference nor its path survived"""
+	attributes = node.attributes
+	return (node.role, attributes.get('title'), attributes.get('description'), attributes.get('subrole'))
+
+
+def _unique(keys: List[Any]) -> Dict[Any, int]:
+	"""Position of every key that occurs exactly once"""
+	positions: Dict[Any, Optional[int]] = {}
+	for i, key in enumerate(keys):
+		positions[key] = None if key in positions else i
+	return {key: i for key, i in positions.items() if i is not None}
+
+
+class ElementIdentityMap:
+	"""
+	Assigns highlight indices that stay stable across snapshots.
+
+	A node keeps the index of the previous snapshot's node it matches, tried in order of
+	confidence: the same AX element, the same accessibility path, then a (role, title,
+	description, subrole) signature that is unique in both snapshots. Unmatched nodes get fresh
+	indices. Indices of vanished elements are never handed out again, so an index from an old
+	step can't silently resolve to a different element.
+	"""
+
+	def __init__(self):
+		self.next_index = 0
+		self._by_element: Dict[Any, int] = {}
+		self._by_path: Dict[str, int] = {}
+		self._by_signature: Dict[Signature, int] = {}
+
+	def reset(self) -> None:
+		self.next_index = 0
+		self._by_element.clear()
+		self._by_path.clear()
+		self._by_signature.clear()
+
+	def assign(self, nodes: List[MacElementNode]) -> Dict[int, MacElementNode]:
+		"""Give each of `nodes` (interactive, in document order) an index; returns index -> node"""
+		indices: List[Optional[int]] = [None] * len(nodes)
+		claimed = set()
+
+		def claim(i: int, index: Optional[int]) -> None:
+			if index is not None and index not in claimed:
+				indices[i] = index
+				claimed.add(index)
+
+		for i, node in enumerate(nodes):
+			if node._element is not None:
+				claim(i, self._by_element.get(node._element))
+
+		paths = [node.accessibility_path for node in nodes]
+		for i, path in enumerate(paths):
+			if indices[i] is None:
+				claim(i, self._by_path.get(path))
+
+		signatures = [_signature(node) for node in nodes]
+		for signature, i in _unique(signatures).items():
+			if indices[i] is None:
+				claim(i, self._by_signature.get(signature))
+
+		matched = len(claimed)
+		for i in range(len(nodes)):
+			if indices[i] is None:
+				indices[i] = self.next_index
+				self.next_index += 1
+		logger.debug(f'Matched {matched} of {len(nodes)} interactive elements to the previous snapshot')
+
+		self._by_element = {node._element: index for node, index in zip(nodes, indices) if node._element is not None}
+		self._by_path = {path: indices[i] for path, i in _unique(paths).items()}
+		self._by_signature = {signature: indices[i] for signature, i in _unique(signatures).items()}
+		return {index: node for node, index in zip(nodes, indices)}
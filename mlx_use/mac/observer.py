@@ -0,0 +1,146 @@
+"""
+Accessibility notification tracking for incremental tree rebuilds.
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from mlx_use.mac.backend import AccessibilityBackend, kAXErrorSuccess, kAXParentAttribute
+from mlx_use.mac.element import MacElementNode
+
+logger = logging.getLogger(__name__)
+
+# Notification names (HIServices/AXNotificationConstants.h)
+kAXValueChangedNotification = 'AXValueChanged'
+kAXTitleChangedNotification = 'AXTitleChanged'
+kAXLayoutChangedNotification = 'AXLayoutChanged'
+kAXRowCountChangedNotification = 'AXRowCountChanged'
+kAXCreatedNotification = 'AXCreated'
+kAXWindowCreatedNotification = 'AXWindowCreated'
+kAXUIElementDestroyedNotification = 'AXUIElementDestroyed'
+kAXMainWindowChangedNotification = 'AXMainWindowChanged'
+
+# Only the element's own attributes changed
+ATTRIBUTE_NOTIFICATIONS = {kAXValueChangedNotification, kAXTitleChangedNotification}
+# The element's children were added, removed or reordered
+CHILDREN_NOTIFICATIONS = {kAXLayoutChangedNotification, kAXRowCountChangedNotification}
+CREATED_NOTIFICATIONS = {kAXCreatedNotification, kAXWindowCreatedNotification}
+DESTROYED_NOTIFICATIONS = {kAXUIElementDestroyedNotification}
+# The builder's root window may have changed
+REBUILD_NOTIFICATIONS = {kAXMainWindowChangedNotification}
+
+OBSERVED_NOTIFICATIONS = sorted(
+	ATTRIBUTE_NOTIFICATIONS | CHILDREN_NOTIFICATIONS | CREATED_NOTIFICATIONS | DESTROYED_NOTIFICATIONS | REBUILD_NOTIFICATIONS
+)
+
+
+@dataclass
+class DirtyNodes:
+	"""Nodes that must be refreshed before the cached tree can be reused"""
+
+	# id(node) -> node whose own attributes must be re-read
+	attributes: Dict[int, MacElementNode] = field(default_factory=dict)
+	# id(node) -> node whose children list must be re-read
+	children: Dict[int, MacElementNode] = field(default_factory=dict)
+
+	def __bool__(self) -> bool:
+		return bool(self.attributes or self.children)
+
+
+class UIChangeTracker:
+	"""Subscribes to accessibility notifications for one application and maps them to dirty tree nodes"""
+
+	def __init__(
+		self, backend: AccessibilityBackend, pid: int, max_pending: int = 200, max_parent_hops: int = 64, patch_root: bool = False
+	):
+		self.backend = backend
+		self.pid = pid
+		# Report window changes as a dirty application root instead of requiring a rebuild
+		self.patch_root = patch_root
+		self.max_pending = max_pending
+		self.max_parent_hops = max_parent_hops
+		self.overflowed = False
+		# Notifications delivered so far, including dropped ones; tells waiters whether the UI is still changing
+		self.received = 0
+		self._pending: Deque[Tuple[Any, str]] = deque()
+		self._observer = backend.add_observer(pid, OBSERVED_NOTIFICATIONS, self._on_notification)
+		if self._observer is None:
+			logger.debug(f'Accessibility notifications unavailable for pid {pid}, using full rebuilds')
+
+	@property
+	def active(self) -> bool:
+		return self._observer is not None
+
+	def _on_notification(self, element: Any, notification: str) -> None:
+		self.received += 1
+		if len(self._pending) >= self.max_pending:
+			self.overflowed = True
+			return
+		self._pending.append((element, notification))
+
+	def close(self) -> None:
+		if self._observer is not None:
+			self.backend.remove_observer(self._observer)
+			self._observer = None
+		self._pending.clear()
+
+	def collect(self, nodes_by_element: Dict[Any, MacElementNode]) -> Optional[DirtyNodes]:
+		"""
+		Drain pending notifications into a set of dirty nodes.
+
+		Returns None when the cached tree can't be patched and a full rebuild is required.
+		"""
+		self.backend.pump_notifications()
+		if self.overflowed:
+			logger.debug(f'More than {self.max_pending} UI changes since last build, rebuilding tree')
+			self._pending.clear()
+			self.overflowed = False
+			return None
+
+		dirty = DirtyNodes()
+		while self._pending:
+			element, notification = self._pending.popleft()
+			node = nodes_by_element.get(element)
+
+			if notification in REBUILD_NOTIFICATIONS:
+				root = self._root(nodes_by_element) if self.patch_root else None
+				if root is None:
+					self._pending.clear()
+					return None
+				dirty.children[id(root)] = root
+				continue
+			if notification in ATTRIBUTE_NOTIFICATIONS:
+				# Changes to elements we never walked (e.g. beyond max_children) don't affect the tree
+				if node is not None:
+					dirty.attributes[id(node)] = node
+			elif notification in DESTROYED_NOTIFICATIONS:
+				if node is not None and node.parent is not None:
+					dirty.children[id(node.parent)] = node.parent
+			else:
+				target = node if notification in CHILDREN_NOTIFICATIONS else None
+				if target is None:
+					target = self._known_ancestor(element, nodes_by_element)
+				if target is None or (target.parent is None and not self.patch_root):
+					# Unknown element or a change at the application root
+					self._pending.clear()
+					return None
+				dirty.children[id(target)] = target
+		return dirty
+
+	def _root(self, nodes_by_element: Dict[Any, MacElementNode]) -> Optional[MacElementNode]:
+		return nodes_by_element.get(self.backend.application_element(self.pid))
+
+	def _known_ancestor(self, element: Any, nodes_by_element: Dict[Any, MacElementNode]) -> Optional[MacElementNode]:
+		"""Follow AXParent from an element until reaching one that is already in the tree"""
+		current = element
+		for _ in range(self.max_parent_hops):
+			error, parent = self.backend.copy_attribute_value(current, kAXParentAttribute)
+			if error != kAXErrorSuccess or parent is None:
+				return None
+			node = nodes_by_element.get(parent)
+			if node is not None:
+				return node
+			current = parent
+		return None
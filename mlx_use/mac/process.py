@@ -0,0 +1,166 @@
+"""
+In-process liveness checks and running-application lookups.
+
+Replaces forking `ps -p` on every tree build and `pgrep` when opening apps.
+"""
+
+import ctypes
+import logging
+import os
+import select
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from mlx_use.utils import singleton
+
+logger = logging.getLogger(__name__)
+
+_LIBPROC_PATH = '/usr/lib/libproc.dylib'
+_PROC_NAME_MAX = 256
+
+
+def _signal_zero(pid: int) -> bool:
+	"""Check a pid with signal 0: delivers nothing, only reports whether the process exists"""
+	if pid <= 0:
+		return False
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		# Exists but belongs to another user
+		return True
+	return True
+
+
+@singleton
+class ProcessMonitor:
+	"""
+	Cached process liveness.
+
+	Each pid is checked with signal 0 and, where kqueue is available (macOS), watched for
+	NOTE_EXIT so later checks are answered from the cache until the process actually exits.
+	Without kqueue, results are cached for `ttl` seconds.
+	"""
+
+	def __init__(self, ttl: float = 1.0):
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		# pid -> (alive, checked at)
+		self._cache: Dict[int, Tuple[bool, float]] = {}
+		self._watched: Set[int] = set()
+		self._kqueue = select.kqueue() if hasattr(select, 'kqueue') else None
+
+	def is_alive(self, pid: int) -> bool:
+		with self._lock:
+			self._drain_exit_events()
+			now = time.monotonic()
+			cached = self._cache.get(pid)
+			if cached is not None and (pid in self._watched or now - cached[1] < self.ttl):
+				return cached[0]
+
+			alive = _signal_zero(pid)
+			self._cache[pid] = (alive, now)
+			if alive:
+				self._watch(pid)
+			return alive
+
+	def forget(self, pid: int) -> None:
+		with self._lock:
+			self._cache.pop(pid, None)
+			self._watched.discard(pid)
+
+	def _watch(self, pid: int) -> None:
+		if self._kqueue is None or pid in self._watched:
+			return
+		event = select.kevent(
+			pid,
+			filter=select.KQ_FILTER_PROC,
+			flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT,
+			fflags=select.KQ_NOTE_EXIT,
+		)
+		try:
+			self._kqueue.control([event], 0, 0)
+			self._watched.add(pid)
+		except ProcessLookupError:
+			self._cache[pid] = (False, time.monotonic())
+		except OSError as e:
+			logger.debug(f'Could not watch pid {pid} for exit: {e}')
+
+	def _drain_exit_events(self) -> None:
+		if self._kqueue is None or not self._watched:
+			return
+		now = time.monotonic()
+		for event in self._kqueue.control(None, 64, 0):
+			self._cache[event.ident] = (False, now)
+			self._watched.discard(event.ident)
+
+
+@singleton
+class AppRegistry:
+	"""Finds the pid of a running application by name without spawning subprocesses"""
+
+	def __init__(self):
+		self.monitor = ProcessMonitor()
+		# lowercased app name -> pid from the last successful lookup
+		self._pids: Dict[str, int] = {}
+
+	def find_pid(self, app_name: str) -> Optional[int]:
+		"""Resolve an app name to a live pid: bundle id, then app name, then process name"""
+		key = app_name.lower()
+		pid = self._pids.get(key)
+		if pid is not None and self.monitor.is_alive(pid):
+			return pid
+
+		pid = self._find_running_application(key)
+		if pid is None:
+			pid = self._find_process(key)
+		if pid is not None:
+			self._pids[key] = pid
+		else:
+			self._pids.pop(key, None)
+		return pid
+
+	def _find_running_application(self, name: str) -> Optional[int]:
+		import Cocoa
+
+		apps = list(Cocoa.NSWorkspace.sharedWorkspace().runningApplications())
+		for app in apps:
+			if app.bundleIdentifier() and name in app.bundleIdentifier().lower():
+				logger.debug(f'Bundle ID: {app.bundleIdentifier()}')
+				return app.processIdentifier()
+		for app in apps:
+			if app.localizedName() and name == app.localizedName().lower():
+				return app.processIdentifier()
+		return None
+
+	def _find_process(self, name: str) -> Optional[int]:
+		"""Match process names like `pgrep -i`, through libproc instead of a subprocess"""
+		for pid, process_name in _list_processes():
+			if name in process_name.lower():
+				logger.debug(f'Found PID {pid} by process name {process_name}')
+				return pid
+		return None
+
+
+def _list_processes() -> List[Tuple[int, str]]:
+	"""(pid, name) for every process visible to this user, oldest first"""
+	try:
+		libproc = ctypes.CDLL(_LIBPROC_PATH)
+	except OSError:
+		return []
+
+	count = libproc.proc_listallpids(None, 0)
+	if count <= 0:
+		return []
+	# The process table can grow between the two calls
+	pids = (ctypes.c_int * (count * 2))()
+	count = libproc.proc_listallpids(pids, ctypes.sizeof(pids))
+
+	processes = []
+	name = ctypes.create_string_buffer(_PROC_NAME_MAX)
+	for pid in sorted(pids[:count]):
+		if pid > 0 and libproc.proc_name(pid, name, _PROC_NAME_MAX) > 0:
+			processes.append((pid, name.value.decode('utf-8', 'replace')))
+	return processes
@@ -0,0 +1,239 @@
+"""
+Selector queries over UI trees.
+
+A selector is a CSS-like chain of compound selectors:
+
+	AXButton                       role
+	*[title="Save"]                attribute equals (any node attribute, compared as text)
+	AXTextField[value*="draft"]    attribute contains
+	AXSheet AXButton               descendant of
+	AXTable > AXRow                child of
+	#12                            highlight index
+	AXButton:interactive           has a highlight index
+	AXRow:nth(0)                   n-th match (0-based, document order) of everything left of it
+
+Queries run on a `TreeIndex` built once per snapshot, so a role, title, path or index lookup is
+O(1) and a selector costs O(k * depth) for k candidates instead of a walk over the whole tree.
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from mlx_use.mac.element import MacElementNode
+
+
+class SelectorError(ValueError):
+	"""A selector could not be parsed"""
+
+
+@dataclass(frozen=True)
+class Compound:
+	"""One step of a selector: conditions on a single node"""
+
+	role: Optional[str] = None
+	highlight_index: Optional[int] = None
+	# (attribute, operator, value) with operator '=' or '*='
+	attributes: Tuple[Tuple[str, str, str], ...] = ()
+	interactive: bool = False
+	nth: Optional[int] = None
+
+	def matches(self, node: MacElementNode) -> bool:
+		if self.role is not None and node.role != self.role:
+			return False
+		if self.highlight_index is not None and node.highlight_index != self.highlight_index:
+			return False
+		if self.interactive and node.highlight_index is None:
+			return False
+		for name, operator, expected in self.attributes:
+			if name not in node.attributes:
+				return False
+			actual = str(node.attributes[name])
+			if operator == '=' and actual != expected:
+				return False
+			if operator == '*=' and expected not in actual:
+				return False
+		return True
+
+
+# (combinator, compound) with combinator '' for the first step, ' ' for descendant and '>' for child
+Selector = Tuple[Tuple[str, Compound], ...]
+
+_TOKEN = re.compile(
+	r'\s*(?:'
+	r'(?P<child>>)'
+	r'|(?P<role>\*|[A-Za-z][\w.-]*)'
+	r'|#(?P<index>\d+)'
+	r'|\[\s*(?P<attr>[\w-]+)\s*(?P<op>\*?=)\s*(?:"(?P<dq>(?:[^"\\]|\\.)*)"|\'(?P<sq>(?:[^\'\\]|\\.)*)\'|(?P<bare>[^\]\s]+))\s*\]'
+	r'|:(?P<pseudo>interactive|nth\(\s*(?P<nth>\d+)\s*\))'
+	r')'
+)
+
+
+@lru_cache(maxsize=256)
+def parse_selector(text: str) -> Selector:
+	"""Parse a selector; raises SelectorError with the position of the first bad character"""
+	steps: List[Tuple[str, Compound]] = []
+	combinator = ''
+	current: Optional[dict] = None
+	pos = 0
+	text = text.rstrip()
+
+	def finish() -> None:
+		nonlocal current
+		if current is not None:
+			steps.append((combinator, Compound(**current)))
+			current = None
+
+	while pos < len(text):
+		match = _TOKEN.match(text, pos)
+		if match is None or match.end() == pos:
+			raise SelectorError(f'Invalid selector {text!r} at position {pos}')
+		# Whitespace between two compounds is the descendant combinator
+		separated = text[pos].isspace()
+		pos = match.end()
+
+		if match.group('child'):
+			if current is None and not steps:
+				raise SelectorError(f'Selector {text!r} starts with a combinator')
+			finish()
+			combinator = '>'
+			continue
+		if current is not None and separated:
+			finish()
+			combinator = ' '
+		if current is None:
+			if steps and not combinator:
+				combinator = ' '
+			current = {'attributes': ()}
+
+		if match.group('role'):
+			if len(current) > 1 or current['attributes']:
+				raise SelectorError(f'Role must come first in a compound selector: {text!r}')
+			current['role'] = None if match.group('role') == '*' else match.group('role')
+		elif match.group('index'):
+			current['highlight_index'] = int(match.group('index'))
+		elif match.group('attr'):
+			value = match.group('dq')
+			if value is None:
+				value = match.group('sq')
+			if value is None:
+				value = match.group('bare')
+			value = re.sub(r'\\(.)', r'\1', value)
+			current['attributes'] = current['attributes'] + ((match.group('attr'), match.group('op'), value),)
+		elif match.group('nth') is not None:
+			current['nth'] = int(match.group('nth'))
+		else:
+			current['interactive'] = True
+
+	if current is None:
+		raise SelectorError(f'Selector {text!r} is empty or ends with a combinator')
+	steps.append((combinator, Compound(**current)))
+	return tuple(steps)
+
+
+@dataclass
+class TreeIndex:
+	"""Lookup tables over one tree snapshot; rebuild it (or ask the builder for it) after the tree changes"""
+
+	root: MacElementNode
+	# Every node in document order
+	nodes: List[MacElementNode] = field(default_factory=list)
+	by_role: Dict[str, List[MacElementNode]] = field(default_factory=dict)
+	by_title: Dict[str, List[MacElementNode]] = field(default_factory=dict)
+	by_action: Dict[str, List[MacElementNode]] = field(default_factory=dict)
+	by_path: Dict[str, MacElementNode] = field(default_factory=dict)
+	by_index: Dict[int, MacElementNode] = field(default_factory=dict)
+
+	@classmethod
+	def from_tree(cls, root: MacElementNode) -> 'TreeIndex':
+		"""Index a tree in one pass, computing every accessibility path along the way"""
+		index = cls(root)
+		by_role, by_title, by_action = defaultdict(list), defaultdict(list), defaultdict(list)
+		root_path = root.accessibility_path
+		index.by_path[root_path] = root
+		stack = [(root, '' if root.parent is None else root_path)]
+		while stack:
+			node, path = stack.pop()
+			index.nodes.append(node)
+			by_role[node.role].append(node)
+			title = node.attributes.get('title')
+			if title is not None:
+				by_title[str(title)].append(node)
+			for action in node.attributes.get('actions', ()):
+				by_action[action].append(node)
+			if node.highlight_index is not None:
+				index.by_index[node.highlight_index] = node
+
+			# Number same-role siblings once per parent instead of once per child
+			counts: Dict[str, int] = defaultdict(int)
+			for child in node.children:
+				counts[child.role] += 1
+			seen: Dict[str, int] = defaultdict(int)
+			entries = []
+			for child in node.children:
+				seen[child.role] += 1
+				child_path = f'{path}/{child.path_component(seen[child.role], counts[child.role])}'
+				child._accessibility_path = child_path
+				index.by_path.setdefault(child_path, child)
+				entries.append((child, child_path))
+			stack.extend(reversed(entries))
+
+		index.by_role, index.by_title, index.by_action = dict(by_role), dict(by_title), dict(by_action)
+		return index
+
+	def find_by_path(self, path: str) -> Optional[MacElementNode]:
+		return self.by_path.get(path)
+
+	def find_by_action(self, action: str) -> List[MacElementNode]:
+		return self.by_action.get(action, [])
+
+	def _candidates(self, compound: Compound) -> List[MacElementNode]:
+		"""Smallest indexed list that contains every match of `compound`, in document order"""
+		if compound.highlight_index is not None:
+			node = self.by_index.get(compound.highlight_index)
+			return [node] if node is not None else []
+		lists = []
+		if compound.role is not None:
+			lists.append(self.by_role.get(compound.role, []))
+		for name, operator, value in compound.attributes:
+			if name == 'title' and operator == '=':
+				lists.append(self.by_title.get(value, []))
+		return min(lists, key=len) if lists else self.nodes
+
+	def select(self, selector: str) -> List[MacElementNode]:
+		"""All nodes matching `selector`, in document order"""
+		matches: Optional[List[MacElementNode]] = None
+		for combinator, compound in parse_selector(selector):
+			candidates = [node for node in self._candidates(compound) if compound.matches(node)]
+			if matches is not None:
+				previous = {id(node) for node in matches}
+				if combinator == '>':
+					candidates = [node for node in candidates if node.parent is not None and id(node.parent) in previous]
+				else:
+					candidates = [node for node in candidates if _has_ancestor_in(node, previous)]
+			if compound.nth is not None:
+				candidates = candidates[compound.nth : compound.nth + 1]
+			matches = candidates
+		return matches or []
+
+	def select_one(self, selector: str) -> Optional[MacElementNode]:
+		"""First node matching `selector`, or None"""
+		matches = self.select(selector)
+		return matches[0] if matches else None
+
+
+def _has_ancestor_in(node: MacElementNode, ids: set) -> bool:
+	parent = node.parent
+	while parent is not None:
+		if id(parent) in ids:
+			return True
+		parent = parent.parent
+	return False
+
+
+def select(root: MacElementNode, selector: str) -> List[MacElementNode]:
+	"""One-off query on a tree; index it once with TreeIndex.from_tree to run several"""
+	return TreeIndex.from_tree(root).select(selector)
@@ -0,0 +1,498 @@
+"""
+In-memory accessibility backend that replays recorded UI trees.
+
+Recordings are plain JSON:
+
+	{
+		"version": 1,
+		"applications": [
+			{"pid": 123, "name": "Calculator", "root": <node>}
+		]
+	}
+
+where each node is `{"attributes": {"AXRole": "AXButton", ...}, "actions": [...], "children": [...]}`.
+The application root's windows are its `AXWindow` children (front to back); `AXMainWindow` resolves to
+the first window with `"AXMain": true`, or the first window, and `AXFocusedWindow` likewise with
+`"AXFocused"`. `AXFocusedUIElement` is the first other element with `"AXFocused": true`, and
+`AXMenuBar` is the root's `AXMenuBar` child. A table's or outline's `AXRows` and `AXColumns`
+are its `AXRow` and `AXColumn` children.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from mlx_use.mac.backend import (
+	AccessibilityBackend,
+	kAXChildrenAttribute,
+	kAXColumnsAttribute,
+	kAXErrorActionUnsupported,
+	kAXErrorAttributeUnsupported,
+	kAXErrorCannotComplete,
+	kAXErrorInvalidUIElement,
+	kAXErrorNoValue,
+	kAXErrorSuccess,
+	kAXFocusedUIElementAttribute,
+	kAXFocusedWindowAttribute,
+	kAXMainWindowAttribute,
+	kAXMenuBarAttribute,
+	kAXParentAttribute,
+	kAXRoleAttribute,
+	kAXRowsAttribute,
+	kAXWindowsAttribute,
+)
+from mlx_use.mac.observer import kAXUIElementDestroyedNotification
+
+logger = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+
+# Attributes captured by `record_application`
+RECORDED_ATTRIBUTES = [
+	'AXRole',
+	'AXSubrole',
+	'AXTitle',
+	'AXValue',
+	'AXDescription',
+	'AXEnabled',
+	'AXFocused',
+	'AXMain',
+	'AXPosition',
+	'AXSize',
+]
+
+
+class RecordedElement:
+	"""A recorded accessibility element"""
+
+	__slots__ = ('id', 'attributes', 'actions', 'children', 'parent')
+
+	def __init__(
+		self,
+		id: str,
+		attributes: Dict[str, Any],
+		actions: Optional[List[str]] = None,
+		children: Optional[List['RecordedElement']] = None,
+		parent: Optional['RecordedElement'] = None,
+	):
+		self.id = id
+		self.attributes = attributes
+		self.actions = actions or []
+		self.children = children or []
+		self.parent = parent
+
+	def __repr__(self) -> str:
+		return f'<RecordedElement {self.id} {self.attributes.get(kAXRoleAttribute)}>'
+
+	def to_dict(self) -> Dict[str, Any]:
+		data: Dict[str, Any] = {'attributes': self.attributes}
+		if self.actions:
+			data['actions'] = self.actions
+		if self.children:
+			data['children'] = [child.to_dict() for child in self.children]
+		return data
+
+
+class InMemoryBackend(AccessibilityBackend):
+	"""
+	Accessibility backend backed by recorded trees.
+
+	Every call sleeps for `latency` seconds (blocking, like real AX IPC) and is counted in
+	`calls`, so build times and round-trip counts are repeatable off a Mac.
+	"""
+
+	def __init__(self, applications: Dict[int, RecordedElement], latency: float = 0.0):
+		self.applications = applications
+		self.latency = latency
+		self.calls: Counter = Counter()
+		self.performed: List[Tuple[str, str]] = []
+		self._observers: Dict[int, Tuple[int, List[str], Callable[[Any, str], None]]] = {}
+		self._queued: Deque[Tuple[RecordedElement, str]] = deque()
+		self._next_observer = 0
+		# Ids of removed elements; references to them stay around but no longer answer
+		self._destroyed: set = set()
+
+	@classmethod
+	def from_dict(cls, data: Dict[str, Any], latency: float = 0.0) -> 'InMemoryBackend':
+		applications = {}
+		for app in data['applications']:
+			counter = [0]
+			applications[int(app['pid'])] = _element_from_dict(app['root'], f"{app['pid']}", counter)
+		return cls(applications, latency=latency)
+
+	@classmethod
+	def from_file(cls, path: str | Path, latency: float = 0.0) -> 'InMemoryBackend':
+		with open(path, 'r', encoding='utf-8') as f:
+			return cls.from_dict(json.load(f), latency=latency)
+
+	def reset_stats(self) -> None:
+		self.calls.clear()
+		self.performed.clear()
+
+	@property
+	def total_calls(self) -> int:
+		return sum(self.calls.values())
+
+	def _call(self, name: str) -> None:
+		self.calls[name] += 1
+		if self.latency:
+			time.sleep(self.latency)
+
+	def application_element(self, pid: int) -> Any:
+		self._call('application_element')
+		# Like AXUIElementCreateApplication, this never fails; reads on an unknown pid do
+		return self.applications.get(pid) or RecordedElement(id=f'{pid}:missing', attributes={})
+
+	def copy_attribute_value(self, element: RecordedElement, attribute: str) -> Tuple[int, Any]:
+		self._call('copy_attribute_value')
+		return self._lookup(element, attribute)
+
+	def copy_multiple_attribute_values(self, element: RecordedElement, attributes: List[str]) -> Tuple[int, List[Any]]:
+		self._call('copy_multiple_attribute_values')
+		if element.id in self._destroyed:
+			return kAXErrorInvalidUIElement, []
+		if not element.attributes:
+			return kAXErrorCannotComplete, []
+		values = []
+		for attribute in attributes:
+			error, value = self._lookup(element, attribute)
+			values.append(value if error == kAXErrorSuccess else None)
+		return kAXErrorSuccess, values
+
+	def _lookup(self, element: RecordedElement, attribute: str) -> Tuple[int, Any]:
+		if element.id in self._destroyed:
+			return kAXErrorInvalidUIElement, None
+		if not element.attributes:
+			return kAXErrorCannotComplete, None
+		if attribute == kAXChildrenAttribute:
+			return kAXErrorSuccess, list(element.children)
+		if attribute == kAXParentAttribute:
+			return (kAXErrorSuccess, element.parent) if element.parent else (kAXErrorNoValue, None)
+		if attribute == kAXWindowsAttribute:
+			return kAXErrorSuccess, _windows(element)
+		if attribute == kAXRowsAttribute and element.attributes.get(kAXRoleAttribute) in ('AXTable', 'AXOutline'):
+			return kAXErrorSuccess, [child for child in element.children if child.attributes.get(kAXRoleAttribute) == 'AXRow']
+		if attribute == kAXColumnsAttribute and element.attributes.get(kAXRoleAttribute) in ('AXTable', 'AXOutline'):
+			return kAXErrorSuccess, [child for child in element.children if child.attributes.get(kAXRoleAttribute) == 'AXColumn']
+		if attribute == kAXMainWindowAttribute and kAXMainWindowAttribute not in element.attributes:
+			windows = _windows(element)
+			main = next((w for w in windows if w.attributes.get('AXMain')), windows[0] if windows else None)
+			return (kAXErrorSuccess, main) if main else (kAXErrorNoValue, None)
+		if attribute == kAXFocusedWindowAttribute and kAXFocusedWindowAttribute not in element.attributes:
+			windows = _windows(element)
+			focused = next((w for w in windows if w.attributes.get('AXFocused')), None)
+			if focused is None:
+				return self._lookup(element, kAXMainWindowAttribute)
+			return kAXErrorSuccess, focused
+		if attribute == kAXFocusedUIElementAttribute and element.parent is None:
+			focused = _find(
+				element, lambda e: bool(e.attributes.get('AXFocused')) and e.attributes.get(kAXRoleAttribute) != 'AXWindow'
+			)
+			return (kAXErrorSuccess, focused) if focused else (kAXErrorNoValue, None)
+		if attribute == kAXMenuBarAttribute and element.parent is None:
+			menu_bar = next((c for c in element.children if c.attributes.get(kAXRoleAttribute) == 'AXMenuBar'), None)
+			return (kAXErrorSuccess, menu_bar) if menu_bar else (kAXErrorNoValue, None)
+		if attribute not in element.attributes:
+			return kAXErrorAttributeUnsupported, None
+		return kAXErrorSuccess, element.attributes[attribute]
+
+	def copy_action_names(self, element: RecordedElement) -> Tuple[int, List[str]]:
+		self._call('copy_action_names')
+		if not element.attributes:
+			return kAXErrorCannotComplete, []
+		return kAXErrorSuccess, list(element.actions)
+
+	def perform_action(self, element: RecordedElement, action: str) -> int:
+		self._call('perform_action')
+		if element.id in self._destroyed:
+			return kAXErrorInvalidUIElement
+		if action not in element.actions:
+			return kAXErrorActionUnsupported
+		self.performed.append((element.id, action))
+		return kAXErrorSuccess
+
+	def set_attribute_value(self, element: RecordedElement, attribute: str, value: Any) -> int:
+		self._call('set_attribute_value')
+		if not element.attributes:
+			return kAXErrorCannotComplete
+		element.attributes[attribute] = value
+		self.performed.append((element.id, f'set:{attribute}'))
+		return kAXErrorSuccess
+
+	def add_observer(self, pid: int, notifications: List[str], callback: Callable[[Any, str], None]) -> Optional[Any]:
+		self._call('add_observer')
+		if pid not in self.applications:
+			return None
+		self._next_observer += 1
+		self._observers[self._next_observer] = (pid, list(notifications), callback)
+		return self._next_observer
+
+	def remove_observer(self, observer: Any) -> None:
+		self._observers.pop(observer, None)
+
+	def pump_notifications(self) -> None:
+		while self._queued:
+			element, notification = self._queued.popleft()
+			pid = int(element.id.split(':', 1)[0])
+			for observed_pid, notifications, callback in list(self._observers.values()):
+				if observed_pid == pid and notification in notifications:
+					callback(element, notification)
+
+	def post_notification(self, element: RecordedElement, notification: str) -> None:
+		"""Queue a notification, delivered to observers on the next `pump_notifications`"""
+		self._queued.append((element, notification))
+
+	def remove_element(self, element: RecordedElement) -> None:
+		"""Remove an element and its subtree from the UI, like an app closing a view, and post AXUIElementDestroyed"""
+		if element.parent is not None:
+			element.parent.children.remove(element)
+		stack = [element]
+		while stack:
+			removed = stack.pop()
+			self._destroyed.add(removed.id)
+			stack.extend(removed.children)
+		self.post_notification(element, kAXUIElementDestroyedNotification)
+
+	def is_process_running(self, pid: int) -> bool:
+		self._call('is_process_running')
+		return pid in self.applications
+
+	def element_id(self, element: RecordedElement) -> str:
+		return element.id
+
+
+def _windows(element: RecordedElement) -> List[RecordedElement]:
+	return [child for child in element.children if child.attributes.get(kAXRoleAttribute) == 'AXWindow']
+
+
+def _find(root: RecordedElement, predicate: Callable[[RecordedElement], bool]) -> Optional[RecordedElement]:
+	"""First element below `root` in document order matching `predicate`"""
+	stack = list(reversed(root.children))
+	while stack:
+		element = stack.pop()
+		if predicate(element):
+			return element
+		stack.extend(reversed(element.children))
+	return None
+
+
+def _element_from_dict(
+	data: Dict[str, Any], prefix: str, counter: List[int], parent: Optional[RecordedElement] = None
+) -> RecordedElement:
+	attributes = dict(data.get('attributes', {}))
+	for key in ('AXPosition', 'AXSize'):
+		if isinstance(attributes.get(key), list):
+			attributes[key] = tuple(attributes[key])
+	element = RecordedElement(
+		id=f'{prefix}:{counter[0]}', attributes=attributes, actions=list(data.get('actions', [])), parent=parent
+	)
+	counter[0] += 1
+	element.children = [_element_from_dict(child, prefix, counter, element) for child in data.get('children', [])]
+	return element
+
+
+def _to_json_value(value: Any) -> Any:
+	if value is None or isinstance(value, (bool, int, float, str)):
+		return value
+	if isinstance(value, (tuple, list)):
+		return [_to_json_value(v) for v in value]
+	return str(value)
+
+
+def record_application(
+	pid: int, name: str = '', backend: Optional[AccessibilityBackend] = None, max_depth: int = 30
+) -> Dict[str, Any]:
+	"""Walk a live application through `backend` and return a JSON-serializable recording"""
+	if backend is None:
+		from mlx_use.mac.backend import default_backend
+
+		backend = default_backend()
+
+	def walk(element: Any, depth: int) -> Dict[str, Any]:
+		attributes = {}
+		for attribute in RECORDED_ATTRIBUTES:
+			error, value = backend.copy_attribute_value(element, attribute)
+			if error == kAXErrorSuccess and value is not None:
+				attributes[attribute] = _to_json_value(backend.decode_value(value))
+		node: Dict[str, Any] = {'attributes': attributes}
+		_, actions = backend.copy_action_names(element)
+		if actions:
+			node['actions'] = list(actions)
+		if depth < max_depth:
+			children = [walk(child, depth + 1) for child in backend.children(element)]
+			if children:
+				node['children'] = children
+		return node
+
+	app_ref = backend.application_element(pid)
+	root = walk(app_ref, 0)
+	# Windows are not always children of the application element; make sure they are recorded
+	error, windows = backend.copy_attribute_value(app_ref, kAXWindowsAttribute)
+	if error == kAXErrorSuccess and windows and not root.get('children'):
+		root['children'] = [walk(window, 1) for window in windows]
+	return {'version': RECORDING_VERSION, 'applications': [{'pid': pid, 'name': name, 'root': root}]}
+
+
+def save_recording(recording: Dict[str, Any], path: str | Path) -> None:
+	"""Write a recording produced by `record_application` to disk"""
+	Path(path).parent.mkdir(parents=True, exist_ok=True)
+	with open(path, 'w', encoding='utf-8') as f:
+		json.dump(recording, f, indent=1)
+
+
+def synthetic_application(
+	pid: int = 1000,
+	n_nodes: int = 5000,
+	fanout: int = 8,
+	seed: int = 0,
+	name: str = 'Synthetic',
+	table_rows: int = 0,
+	dialog: bool = False,
+	menu_bar: bool = False,
+) -> Dict[str, Any]:
+	"""
+	Generate a deterministic recording with roughly `n_nodes` elements, mixing groups,
+	buttons, text and fields the way a typical document window does. With `table_rows`, the
+	window also gets a three-column AXTable (a message list) with that many rows; `dialog`
+	puts a focused "Save changes?" dialog in front of it and `menu_bar` adds a File/Edit/View
+	menu bar.
+	"""
+	rng = random.Random(seed)
+	leaf_kinds = [
+		('AXButton', ['AXPress'], 'title'),
+		('AXButton', ['AXPress', 'AXShowMenu'], 'description'),
+		('AXStaticText', [], 'value'),
+		('AXTextField', ['AXConfirm', 'AXSetValue'], 'value'),
+		('AXCheckBox', ['AXPress'], 'title'),
+		('AXImage', [], 'description'),
+	]
+	remaining = [n_nodes - 2]
+	y = [0]
+
+	def leaf(i: int) -> Dict[str, Any]:
+		role, actions, text_attr = rng.choice(leaf_kinds)
+		y[0] += 22
+		attributes = {
+			'AXRole': role,
+			'AXEnabled': rng.random() > 0.05,
+			'AXPosition': [20 + (i % 10) * 40, y[0]],
+			'AXSize': [80, 20],
+			f'AX{text_attr.capitalize()}': f'{role[2:].lower()} {i}',
+		}
+		node: Dict[str, Any] = {'attributes': attributes}
+		if actions:
+			node['actions'] = list(actions)
+		return node
+
+	def group(depth: int) -> Dict[str, Any]:
+		children = []
+		count = rng.randint(max(1, fanout // 2), fanout)
+		for i in range(count):
+			if remaining[0] <= 0:
+				break
+			remaining[0] -= 1
+			if depth < 6 and rng.random() < 0.3:
+				children.append(group(depth + 1))
+			else:
+				children.append(leaf(remaining[0]))
+		return {'attributes': {'AXRole': 'AXGroup', 'AXEnabled': True}, 'children': children}
+
+	groups = []
+	while remaining[0] > 0:
+		remaining[0] -= 1
+		groups.append(group(1))
+
+	if table_rows:
+		groups.insert(0, _synthetic_table(table_rows))
+
+	window = {
+		'attributes': {
+			'AXRole': 'AXWindow',
+			'AXTitle': name,
+			'AXMain': True,
+			'AXPosition': [0, 0],
+			'AXSize': [1440, 900],
+		},
+		'actions': ['AXRaise'],
+		'children': groups,
+	}
+	children = [window]
+	if dialog:
+		children.insert(0, _synthetic_dialog())
+	if menu_bar:
+		children.append(_synthetic_menu_bar(name))
+	root = {'attributes': {'AXRole': 'AXApplication', 'AXTitle': name}, 'children': children}
+	return {'version': RECORDING_VERSION, 'applications': [{'pid': pid, 'name': name, 'root': root}]}
+
+
+def _synthetic_table(n_rows: int) -> Dict[str, Any]:
+	def cell(text: str) -> Dict[str, Any]:
+		return {
+			'attributes': {'AXRole': 'AXCell'},
+			'children': [{'attributes': {'AXRole': 'AXStaticText', 'AXValue': text}}],
+		}
+
+	rows = [
+		{
+			'attributes': {'AXRole': 'AXRow', 'AXSelected': i == 0},
+			'actions': ['AXShowMenu'],
+			'children': [cell(f'sender {i}'), cell(f'subject {i}'), cell(f'2024-01-{i % 28 + 1:02d}')],
+		}
+		for i in range(n_rows)
+	]
+	columns = [{'attributes': {'AXRole': 'AXColumn', 'AXTitle': title}} for title in ('From', 'Subject', 'Date')]
+	return {'attributes': {'AXRole': 'AXTable', 'AXDescription': 'messages'}, 'children': rows + columns}
+
+
+def _synthetic_dialog() -> Dict[str, Any]:
+	def button(title: str) -> Dict[str, Any]:
+		return {'attributes': {'AXRole': 'AXButton', 'AXTitle': title, 'AXEnabled': True}, 'actions': ['AXPress']}
+
+	return {
+		'attributes': {
+			'AXRole': 'AXWindow',
+			'AXSubrole': 'AXDialog',
+			'AXTitle': 'Save changes?',
+			'AXFocused': True,
+			'AXModal': True,
+			'AXPosition': [520, 300],
+			'AXSize': [400, 160],
+		},
+		'actions': ['AXRaise'],
+		'children': [
+			{'attributes': {'AXRole': 'AXStaticText', 'AXValue': 'Do you want to save the changes you made?'}},
+			button("Don't Save"),
+			button('Cancel'),
+			button('Save'),
+		],
+	}
+
+
+def _synthetic_menu_bar(name: str) -> Dict[str, Any]:
+	def item(title: str, entries: List[str]) -> Dict[str, Any]:
+		menu = {
+			'attributes': {'AXRole': 'AXMenu'},
+			'children': [
+				{'attributes': {'AXRole': 'AXMenuItem', 'AXTitle': entry, 'AXEnabled': True}, 'actions': ['AXPress', 'AXCancel']}
+				for entry in entries
+			],
+		}
+		return {
+			'attributes': {'AXRole': 'AXMenuBarItem', 'AXTitle': title, 'AXEnabled': True},
+			'actions': ['AXPress', 'AXCancel'],
+			'children': [menu],
+		}
+
+	return {
+		'attributes': {'AXRole': 'AXMenuBar'},
+		'children': [
+			item(name, ['About', 'Settings…', 'Quit']),
+			item('File', ['New', 'Open…', 'Save', 'Close']),
+			item('Edit', ['Undo', 'Cut', 'Copy', 'Paste']),
+			item('View', ['Show Sidebar', 'Enter Full Screen']),
+		],
+	}
@@ -0,0 +1,138 @@
+"""
+Token-budgeted serialization of a UI tree into the state message's element list.
+"""
+
+import heapq
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
+
+OMITTED_MARKER = '... {omitted} more elements omitted to keep the UI state within {max_tokens} tokens'
+
+
+def estimate_tokens(text: str, chars_per_token: int = 3) -> int:
+	"""Rough token count of a line, rounded up so per-line sums don't undercount"""
+	return -(-len(text) // chars_per_token)
+
+
+def _focus_depths(node: Optional[MacElementNode]) -> Dict[int, int]:
+	"""id -> depth below the root for `node` and its ancestors"""
+	chain = []
+	while node is not None:
+		chain.append(node)
+		node = node.parent
+	return {id(ancestor): depth for depth, ancestor in enumerate(reversed(chain))}
+
+
+class StateSerializer:
+	"""
+	Turns a tree into prompt lines that fit a token budget.
+
+	When the whole element list fits, the lines are exactly those of
+	`MacElementNode.get_clickable_elements_string` in the same encoding. Otherwise elements are
+	taken in priority order until the budget is spent: nearest the focused element first, enabled
+	before disabled, then nearest the element of the last action, then document order. The chosen
+	lines are still emitted in document order, followed by a marker saying how many were left out.
+	Window headers are always kept.
+
+	Without a budget lines are yielded as the tree is walked. With one, elements are ranked from
+	their place in the tree alone; lines are only formatted and counted as elements are taken, so
+	the work stops once the budget is spent.
+	"""
+
+	def __init__(
+		self,
+		max_tokens: Optional[int] = None,
+		count_tokens: Callable[[str], int] = estimate_tokens,
+		encoding: PromptEncoding = 'verbose',
+	):
+		self.max_tokens = max_tokens
+		self.count_tokens = count_tokens
+		self.encoding = encoding
+		# Filled in while iterating: elements emitted (document order), elements left out, tokens used
+		self.nodes: List[MacElementNode] = []
+		self.omitted = 0
+		self.tokens = 0
+
+	def serialize(
+		self, root: MacElementNode, focus: Optional[MacElementNode] = None, anchor: Optional[MacElementNode] = None
+	) -> str:
+		return '\n'.join(self.iter_lines(root, focus, anchor))
+
+	def iter_lines(
+		self, root: MacElementNode, focus: Optional[MacElementNode] = None, anchor: Optional[MacElementNode] = None
+	) -> Iterator[str]:
+		"""Yield the prompt lines of `root`'s subtree; `focus` and `anchor` (the last action's element) rank them"""
+		self.nodes, self.omitted, self.tokens = [], 0, 0
+		if self.max_tokens is None:
+			for node in root.iter_prompt_elements():
+				line = node.get_prompt_line(self.encoding)
+				self.nodes.append(node)
+				self.tokens += self.count_tokens(line) + 1
+				yield line
+			return
+
+		for node, line, tokens in self._select(self._candidates(root, focus, anchor)):
+			self.nodes.append(node)
+			self.tokens += tokens
+			yield line
+		if self.omitted:
+			marker = OMITTED_MARKER.format(omitted=self.omitted, max_tokens=self.max_tokens)
+			self.tokens += self.count_tokens(marker)
+			yield marker
+
+	def _candidates(
+		self, root: MacElementNode, focus: Optional[MacElementNode], anchor: Optional[MacElementNode]
+	) -> List[Tuple[tuple, MacElementNode]]:
+		"""(priority key, node) for every listed element; the key ends with the element's document position"""
+		focus_depths = _focus_depths(focus)
+		anchor_depths = _focus_depths(anchor)
+		focus_depth = len(focus_depths) - 1
+		anchor_depth = len(anchor_depths) - 1
+
+		candidates = []
+		# (node, depth, depth of the deepest common ancestor with the focus, same for the anchor)
+		stack = [(root, 0, 0, 0)]
+		while stack:
+			node, depth, focus_common, anchor_common = stack.pop()
+			if node.is_prompt_element:
+				# Tree distance through the deepest common ancestor; 0 for everything without a focus/anchor
+				focus_distance = depth + focus_depth - 2 * focus_common if focus_depths else 0
+				anchor_distance = depth + anchor_depth - 2 * anchor_common if anchor_depths else 0
+				# Interactive windows carry their header in their own line
+				is_header = 'window_label' in node.attributes
+				key = (not is_header, focus_distance, not node.enabled, anchor_distance, len(candidates))
+				candidates.append((key, node))
+			for child in reversed(node.children):
+				child_focus = depth + 1 if id(child) in focus_depths else focus_common
+				child_anchor = depth + 1 if id(child) in anchor_depths else anchor_common
+				stack.append((child, depth + 1, child_focus, child_anchor))
+		return candidates
+
+	def _select(self, candidates: List[Tuple[tuple, MacElementNode]]) -> List[Tuple[MacElementNode, str, int]]:
+		"""
+		(node, line, tokens) of the highest-priority candidates that fit the budget, back in document
+		order. Everything is kept if it all fits; otherwise room is left for the marker.
+		"""
+		total = len(candidates)
+		reserve = self.count_tokens(OMITTED_MARKER.format(omitted=total, max_tokens=self.max_tokens))
+		heapq.heapify(candidates)
+		chosen: List[Tuple[int, MacElementNode, str, int]] = []
+		used = 0
+		# Number of chosen entries that fit next to the marker
+		fits_with_marker: Optional[int] = None
+		while candidates:
+			key, node = heapq.heappop(candidates)
+			line = node.get_prompt_line(self.encoding)
+			tokens = self.count_tokens(line) + 1
+			if fits_with_marker is None and used + tokens > self.max_tokens - reserve:
+				fits_with_marker = len(chosen)
+			if used + tokens > self.max_tokens:
+				chosen = chosen[:fits_with_marker]
+				self.omitted = total - len(chosen)
+				break
+			chosen.append((key[-1], node, line, tokens))
+			used += tokens
+		chosen.sort(key=lambda entry: entry[0])
+		return [(node, line, tokens) for _, node, line, tokens in chosen]
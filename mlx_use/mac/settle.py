@@ -0,0 +1,170 @@
+"""
+Waiting for an application's UI to settle after an action.
+
+Actions return as soon as the app accepted them, often before it has redrawn. Instead of waiting
+a fixed time, `UISettleDetector` waits until the UI has stopped changing for `quiet_period`:
+with an incremental tree builder it watches the accessibility notifications the builder already
+observes, otherwise it polls a cheap fingerprint of the focused window with exponential backoff.
+Either way it gives up after `max_wait`.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Literal, Optional, TypeVar
+
+from mlx_use.mac.backend import (
+	AccessibilityBackend,
+	kAXChildrenAttribute,
+	kAXErrorCannotComplete,
+	kAXErrorSuccess,
+	kAXFocusedUIElementAttribute,
+	kAXFocusedWindowAttribute,
+	kAXTitleAttribute,
+	kAXValueAttribute,
+	kAXWindowsAttribute,
+)
+from mlx_use.mac.executor import AccessibilityTimeoutError
+from mlx_use.mac.tree import MacUITreeBuilder
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_APP_ATTRIBUTES = [kAXFocusedWindowAttribute, kAXFocusedUIElementAttribute, kAXWindowsAttribute]
+_WINDOW_ATTRIBUTES = [kAXTitleAttribute, kAXChildrenAttribute]
+
+
+@dataclass
+class SettleResult:
+	"""How long one wait for the UI took"""
+
+	seconds: float = 0.0
+	# False when max_wait ran out while the UI was still changing
+	settled: bool = True
+	method: Literal['notifications', 'fingerprint', 'none'] = 'none'
+	polls: int = 0
+
+
+class _Busy:
+	"""Fingerprint of an app that didn't answer; never equal to another one, so the wait goes on"""
+
+	def __eq__(self, other: Any) -> bool:
+		return False
+
+	__hash__ = object.__hash__
+
+
+def ui_fingerprint(backend: AccessibilityBackend, pid: int) -> Any:
+	"""
+	Cheap summary of what an app shows: its window count, the focused window with its title and
+	child count, and the focused element with its value. Three round trips with batched reads.
+	"""
+	app = backend.application_element(pid)
+	error, (window, focused, windows) = _read(backend, app, _APP_ATTRIBUTES)
+	if error == kAXErrorCannotComplete:
+		return _Busy()
+	title = children = value = None
+	if window is not None:
+		error, (title, children) = _read(backend, window, _WINDOW_ATTRIBUTES)
+		if error == kAXErrorCannotComplete:
+			return _Busy()
+	if focused is not None:
+		error, value = backend.copy_attribute_value(focused, kAXValueAttribute)
+		if error == kAXErrorCannotComplete:
+			return _Busy()
+		if error != kAXErrorSuccess:
+			value = None
+	# Elements compare with CFEqual, so references read in different polls match
+	return (len(windows or ()), window, title, len(children or ()), focused, value)
+
+
+def _read(backend: AccessibilityBackend, element: Any, attributes: list) -> tuple:
+	error, values = backend.copy_multiple_attribute_values(element, attributes)
+	if error != kAXErrorSuccess or len(values) != len(attributes):
+		return error, [None] * len(attributes)
+	return error, values
+
+
+async def poll_until(
+	probe: Callable[[], Awaitable[Optional[T]]], max_wait: float, initial_interval: float = 0.025, max_interval: float = 0.2
+) -> Optional[T]:
+	"""
+	Await `probe` with exponentially growing pauses until it returns something other than None or
+	max_wait passes. Blocking probes should run off the event loop, e.g. through asyncio.to_thread.
+	"""
+	deadline = time.perf_counter() + max_wait
+	interval = initial_interval
+	while True:
+		result = await probe()
+		if result is not None:
+			return result
+		remaining = deadline - time.perf_counter()
+		if remaining <= 0:
+			return None
+		await asyncio.sleep(min(interval, remaining))
+		interval = min(interval * 2, max_interval)
+
+
+class UISettleDetector:
+	"""Waits until an app's UI has been quiet for `quiet_period` seconds, at most `max_wait` seconds"""
+
+	def __init__(
+		self,
+		builder: MacUITreeBuilder,
+		quiet_period: float = 0.1,
+		max_wait: float = 1.0,
+		initial_interval: float = 0.025,
+		max_interval: float = 0.2,
+	):
+		self.builder = builder
+		self.quiet_period = quiet_period
+		self.max_wait = max_wait
+		# Polls start this far apart and back off exponentially, so a UI that keeps animating isn't read 40 times a second
+		self.initial_interval = initial_interval
+		self.max_interval = max_interval
+
+	def _notification_count(self, pid: int) -> Optional[int]:
+		"""Notifications the builder's change tracker has received for pid; None if it doesn't observe pid"""
+		tracker = self.builder._change_tracker
+		if tracker is None or tracker.pid != pid or not tracker.active:
+			return None
+		self.builder.backend.pump_notifications()
+		return tracker.received
+
+	async def wait(self, pid: Optional[int]) -> SettleResult:
+		if pid is None or self.max_wait <= 0:
+			return SettleResult()
+		executor = self.builder.executor
+		timeout = self.builder.call_timeout
+		start = time.perf_counter()
+		try:
+			method = 'notifications'
+			state = await executor.run(self._notification_count, pid, timeout=timeout)
+			if state is None:
+				method = 'fingerprint'
+				state = await executor.run(ui_fingerprint, self.builder.backend, pid, timeout=timeout)
+			probe = self._notification_count if method == 'notifications' else partial(ui_fingerprint, self.builder.backend)
+
+			polls = 1
+			last_change = time.perf_counter()
+			interval = self.initial_interval
+			while True:
+				now = time.perf_counter()
+				if now - last_change >= self.quiet_period:
+					return SettleResult(now - start, True, method, polls)
+				remaining = start + self.max_wait - now
+				if remaining <= 0:
+					logger.debug(f'UI of pid {pid} still changing after {self.max_wait}s, reading it anyway')
+					return SettleResult(now - start, False, method, polls)
+				await asyncio.sleep(min(interval, remaining, self.quiet_period - (now - last_change)))
+				current = await executor.run(probe, pid, timeout=timeout)
+				polls += 1
+				if current != state:
+					state, last_change = current, time.perf_counter()
+				interval = min(interval * 2, self.max_interval)
+		except AccessibilityTimeoutError as e:
+			logger.debug(f'Could not check whether the UI of pid {pid} settled: {e}')
+			return SettleResult(time.perf_counter() - start, False, 'none')
@@ -0,0 +1,203 @@
+"""
+Content-addressed store of the UI states an agent run has seen.
+
+Each state is stored as a Merkle tree over the UI tree: a node's hash covers its prompt line and
+its children's hashes, so a subtree that looks the same in two steps is stored once and two
+states can be diffed by descending only where their hashes differ.
+"""
+
+import hashlib
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mlx_use.mac.diff import TreeDiff
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import PromptEncoding
+
+# hash -> (prompt line or None, child hashes, interactive lines in the subtree, context lines in the subtree)
+Entry = Tuple[Optional[str], Tuple[str, ...], int, int]
+
+
+def _digest(*parts: str) -> str:
+	return hashlib.blake2b('\0'.join(parts).encode(), digest_size=12).hexdigest()
+
+
+class SnapshotStore:
+	"""
+	States by snapshot id, with identical subtrees shared across snapshots.
+
+	Only elements a state listed are stored; unlisted nodes without listed descendants are left
+	out and unlisted nodes with a single stored child collapse into it. Text after the element
+	lines (e.g. the omitted-elements marker) is kept per snapshot.
+	"""
+
+	def __init__(self):
+		self.entries: Dict[str, Entry] = {}
+		# snapshot id -> (root hash or None, text after the element lines)
+		self.snapshots: Dict[str, Tuple[Optional[str], str]] = {}
+
+	def __len__(self) -> int:
+		return len(self.snapshots)
+
+	def __contains__(self, snapshot_id: str) -> bool:
+		return snapshot_id in self.snapshots
+
+	def add(
+		self,
+		state: str,
+		root: Optional[MacElementNode] = None,
+		nodes: Optional[Iterable[MacElementNode]] = None,
+		encoding: PromptEncoding = 'verbose',
+	) -> str:
+		"""
+		Store a state and return its snapshot id.
+
+		With `root`, the state's element lines are stored as subtrees of that tree; `nodes` are the
+		elements the state lists (every prompt element by default). Without it, or if the state
+		doesn't start with those lines, the state is stored as plain text.
+		"""
+		root_hash, tail = None, state
+		if root is not None:
+			listed = nodes if nodes is not None else root.iter_prompt_elements()
+			root_hash, lines = self._add_tree(root, {id(node) for node in listed}, encoding)
+			body = '\n'.join(lines)
+			if state.startswith(body):
+				tail = state[len(body) :]
+			else:
+				root_hash = None
+		snapshot_id = _digest(root_hash or '', tail)
+		self.snapshots.setdefault(snapshot_id, (root_hash, tail))
+		return snapshot_id
+
+	def _add_tree(self, root: MacElementNode, listed: set, encoding: PromptEncoding) -> Tuple[Optional[str], List[str]]:
+		"""Hash the tree bottom-up, storing new entries; returns the root hash and the lines in document order"""
+		order: List[MacElementNode] = []
+		lines: List[str] = []
+		stack = [root]
+		while stack:
+			node = stack.pop()
+			order.append(node)
+			if id(node) in listed:
+				lines.append(node.get_prompt_line(encoding))
+			stack.extend(reversed(node.children))
+
+		hashes: Dict[int, Optional[str]] = {}
+		# Reversed pre-order visits every node after its descendants
+		for node in reversed(order):
+			children = tuple(hashes.pop(id(child)) for child in node.children)
+			children = tuple(child for child in children if child is not None)
+			if id(node) not in listed:
+				if len(children) <= 1:
+					hashes[id(node)] = children[0] if children else None
+					continue
+				line = None
+				interactive = context = 0
+			else:
+				line = node.get_prompt_line(encoding)
+				interactive = node.highlight_index is not None
+				context = not interactive and (node.is_context or node.is_table_row)
+			node_hash = _digest(line if line is not None else '\x01', *children)
+			if node_hash not in self.entries:
+				for child in children:
+					interactive += self.entries[child][2]
+					context += self.entries[child][3]
+				self.entries[node_hash] = (line, children, int(interactive), int(context))
+			hashes[id(node)] = node_hash
+		return hashes[id(root)], lines
+
+	def get(self, snapshot_id: str) -> str:
+		"""The state text of a snapshot"""
+		root_hash, tail = self.snapshots[snapshot_id]
+		return '\n'.join(self._iter_lines(root_hash)) + tail
+
+	def _iter_lines(self, node_hash: Optional[str]) -> Iterator[str]:
+		stack = [node_hash] if node_hash is not None else []
+		while stack:
+			line, children, _, _ = self.entries[stack.pop()]
+			if line is not None:
+				yield line
+			stack.extend(reversed(children))
+
+	def _own_counts(self, node_hash: str) -> Tuple[int, int]:
+		_, children, interactive, context = self.entries[node_hash]
+		for child in children:
+			interactive -= self.entries[child][2]
+			context -= self.entries[child][3]
+		return interactive, context
+
+	def diff(self, old_id: str, new_id: str) -> TreeDiff:
+		"""
+		Lines added, removed and changed from one snapshot to another.
+
+		Subtrees with equal hashes are skipped whole, so this costs O(changed subtrees x depth).
+		Children are matched by hash first and the rest pairwise in order, so a changed line is
+		reported against the element in the same place of the old tree.
+		"""
+		result = TreeDiff()
+		pairs = [(self.snapshots[old_id][0], self.snapshots[new_id][0])]
+		while pairs:
+			old, new = pairs.pop()
+			if old == new:
+				if new is not None:
+					result.unchanged_interactive += self.entries[new][2]
+					result.unchanged_context += self.entries[new][3]
+				continue
+			if old is None:
+				result.added.extend(self._iter_lines(new))
+				continue
+			if new is None:
+				result.removed.extend(self._iter_lines(old))
+				continue
+
+			old_line, old_children = self.entries[old][:2]
+			new_line, new_children = self.entries[new][:2]
+			if old_line == new_line:
+				if new_line is not None:
+					interactive, context = self._own_counts(new)
+					result.unchanged_interactive += interactive
+					result.unchanged_context += context
+			elif old_line is not None and new_line is not None:
+				result.changed.append((old_line, new_line))
+			else:
+				if old_line is not None:
+					result.removed.append(old_line)
+				if new_line is not None:
+					result.added.append(new_line)
+
+			remaining = Counter(new_children)
+			old_rest = []
+			for child in old_children:
+				if remaining[child] > 0:
+					remaining[child] -= 1
+					pairs.append((child, child))
+				else:
+					old_rest.append(child)
+			matched = Counter(old_children)
+			matched.subtract(old_rest)
+			new_rest = []
+			for child in new_children:
+				if matched[child] > 0:
+					matched[child] -= 1
+				else:
+					new_rest.append(child)
+			for i in range(max(len(old_rest), len(new_rest))):
+				pairs.append((old_rest[i] if i < len(old_rest) else None, new_rest[i] if i < len(new_rest) else None))
+		return result
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			'entries': {
+				node_hash: [line, list(children), interactive, context]
+				for node_hash, (line, children, interactive, context) in self.entries.items()
+			},
+			'snapshots': {snapshot_id: list(snapshot) for snapshot_id, snapshot in self.snapshots.items()},
+		}
+
+	@classmethod
+	def from_dict(cls, data: Dict[str, Any]) -> 'SnapshotStore':
+		store = cls()
+		for node_hash, (line, children, interactive, context) in data.get('entries', {}).items():
+			store.entries[node_hash] = (line, tuple(children), interactive, context)
+		for snapshot_id, (root_hash, tail) in data.get('snapshots', {}).items():
+			store.snapshots[snapshot_id] = (root_hash, tail)
+		return store
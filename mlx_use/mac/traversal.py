@@ -0,0 +1,93 @@
+"""
+Explicit-stack traversal engine for accessibility trees.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, List, Literal, Optional, Tuple
+
+from mlx_use.mac.element import MacElementNode
+
+# visit(element, parent, depth) -> (node, child elements to walk) or None to skip the element
+VisitFn = Callable[[Any, Optional[MacElementNode], int], Optional[Tuple[MacElementNode, List[Any]]]]
+
+
+@dataclass
+class TraversalBudget:
+	"""Limits for a single traversal; None means unlimited"""
+
+	max_nodes: Optional[int] = None
+	# Wall-clock seconds from the start of the traversal
+	time_limit: Optional[float] = None
+	order: Literal['dfs', 'bfs'] = 'dfs'
+
+
+@dataclass
+class TraversalResult:
+	"""Outcome of a traversal"""
+
+	# One entry per root, None if the root was skipped or never reached
+	nodes: List[Optional[MacElementNode]] = field(default_factory=list)
+	visited: int = 0
+	truncated: bool = False
+	truncation_reason: Optional[str] = None
+	# Elements still waiting in the frontier when the budget ran out
+	pending: int = 0
+
+
+def traverse(
+	roots: List[Tuple[Any, Optional[MacElementNode], int]],
+	visit: VisitFn,
+	budget: TraversalBudget,
+	should_stop: Optional[Callable[[], bool]] = None,
+) -> TraversalResult:
+	"""
+	Walk from `roots` (element, parent node, depth) without recursion.
+
+	Visited children are appended to their parent node in sibling order for both orders, so a
+	breadth-first walk produces the same tree shape as a depth-first one. Roots are not attached
+	to their parents; callers place them from `TraversalResult.nodes`. When the budget runs out
+	the partial tree is kept and the result is flagged as truncated; the same happens when
+	`should_stop` returns True (e.g. the caller was cancelled).
+	"""
+	result = TraversalResult(nodes=[None] * len(roots))
+	deadline = time.monotonic() + budget.time_limit if budget.time_limit is not None else None
+	depth_first = budget.order == 'dfs'
+
+	# (element, parent, depth, root index or -1)
+	frontier: Deque[Tuple[Any, Optional[MacElementNode], int, int]] = deque()
+	entries = [(element, parent, depth, i) for i, (element, parent, depth) in enumerate(roots)]
+	frontier.extend(reversed(entries) if depth_first else entries)
+	pop = frontier.pop if depth_first else frontier.popleft
+
+	while frontier:
+		if budget.max_nodes is not None and result.visited >= budget.max_nodes:
+			result.truncation_reason = f'node budget of {budget.max_nodes} reached'
+			break
+		if deadline is not None and time.monotonic() >= deadline:
+			result.truncation_reason = f'time budget of {budget.time_limit:.2f}s reached'
+			break
+		if should_stop is not None and should_stop():
+			result.truncation_reason = 'cancelled'
+			break
+
+		element, parent, depth, root_index = pop()
+		visited = visit(element, parent, depth)
+		if visited is None:
+			continue
+		node, children = visited
+		result.visited += 1
+
+		if root_index >= 0:
+			result.nodes[root_index] = node
+		elif parent is not None:
+			parent.children.append(node)
+
+		entries = [(child, node, depth + 1, -1) for child in children]
+		frontier.extend(reversed(entries) if depth_first else entries)
+
+	if frontier:
+		result.truncated = True
+		result.pending = len(frontier)
+	return result
@@ -1,53 +1,170 @@
 # --- START OF FILE mac_use/mac/tree.py ---
-import asyncio
-
-# --- START OF FILE mac_use/mac/actions.py ---
 import logging
-from typing import Callable, Dict, List, Optional
-
-import Cocoa
-from ApplicationServices import AXUIElementPerformAction, AXUIElementSetAttributeValue, kAXPressAction, kAXValueAttribute
-from Foundation import NSString
-
-from mlx_use.mac.element import MacElementNode
-
-logger = logging.getLogger(__name__)
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple, Union
 
-import Cocoa
-import objc
-from ApplicationServices import (
-	AXError,
-	AXUIElement,
-	AXUIElementCopyActionNames,
-	AXUIElementCopyAttributeValue,
-	AXUIElementCreateApplication,
+from .backend import (
+	AccessibilityBackend,
+	PyObjCBackend,
 	kAXChildrenAttribute,
+	kAXColumnsAttribute,
+	kAXColumnTitlesAttribute,
 	kAXDescriptionAttribute,
+	kAXDisclosureLevelAttribute,
+	kAXEnabledAttribute,
 	kAXErrorAPIDisabled,
 	kAXErrorAttributeUnsupported,
 	kAXErrorCannotComplete,
-	kAXErrorFailure,
-	kAXErrorIllegalArgument,
+	kAXErrorInvalidUIElement,
 	kAXErrorSuccess,
+	kAXFocusedUIElementAttribute,
+	kAXFocusedWindowAttribute,
 	kAXMainWindowAttribute,
+	kAXMenuBarAttribute,
+	kAXModalAttribute,
+	kAXParentAttribute,
+	kAXPositionAttribute,
 	kAXRoleAttribute,
+	kAXRowsAttribute,
+	kAXSelectedAttribute,
+	kAXSizeAttribute,
+	kAXSubroleAttribute,
 	kAXTitleAttribute,
 	kAXValueAttribute,
+	kAXVisibleRowsAttribute,
 	kAXWindowsAttribute,
 )
-from CoreFoundation import CFRunLoopAddSource, CFRunLoopGetCurrent, kCFRunLoopDefaultMode
-
-from .element import MacElementNode
+from .element import MacElementNode, intern_actions, intern_string
+from .executor import AccessibilityExecutor, AccessibilityTimeoutError
+from .identity import ElementIdentityMap
+from .observer import UIChangeTracker
+from .query import TreeIndex
+from .traversal import TraversalBudget, traverse
+from .viewport import CLIPPING_ROLES, Rect, Visibility, element_rect, intersect, visibility
 
 logger = logging.getLogger(__name__)
 
+# Attributes read for every element after its role (AXChildren last so the walk can continue)
+DEFAULT_ELEMENT_ATTRIBUTES = [
+	kAXTitleAttribute,
+	kAXValueAttribute,
+	kAXDescriptionAttribute,
+	kAXEnabledAttribute,
+	kAXPositionAttribute,
+	kAXSizeAttribute,
+	kAXSubroleAttribute,
+	kAXChildrenAttribute,
+]
+
+# Containers whose rows are read as a window of compact one-line rows when table_rows is set
+TABLE_ROLES = {'AXTable', 'AXOutline', 'AXList'}
+_TABLE_ATTRIBUTES = [kAXRowsAttribute, kAXVisibleRowsAttribute, kAXColumnTitlesAttribute, kAXColumnsAttribute]
+_ROW_ATTRIBUTES = [kAXRoleAttribute, kAXEnabledAttribute, kAXSelectedAttribute, kAXDisclosureLevelAttribute, kAXChildrenAttribute]
+_CELL_ATTRIBUTES = [kAXValueAttribute, kAXTitleAttribute, kAXDescriptionAttribute, kAXChildrenAttribute]
+
+# Scrolling these changes which elements are in view
+SCROLL_ROLES = {'AXScrollBar', 'AXValueIndicator'}
+
+# Roles that read more than DEFAULT_ELEMENT_ATTRIBUTES
+ROLE_ATTRIBUTES: Dict[str, List[str]] = {
+	# A menu bar item is selected while its menu is open; closed menus aren't walked
+	'AXMenuBarItem': DEFAULT_ELEMENT_ATTRIBUTES[:-1] + [kAXSelectedAttribute, kAXChildrenAttribute],
+}
+
+# Window subroles shown as something other than "Window" in window labels
+WINDOW_KINDS = {
+	'AXDialog': 'Dialog',
+	'AXSystemDialog': 'Dialog',
+	'AXFloatingWindow': 'Panel',
+	'AXSystemFloatingWindow': 'Panel',
+}
+
+
+@dataclass
+class TreeBuildStats:
+	"""Counters for one build_tree call"""
+
+	nodes: int = 0
+	round_trips: int = 0
+	# The traversal budget ran out before the whole tree was visited
+	truncated: bool = False
+	pending: int = 0
+	# Round trips the same build would have made reading one attribute per call
+	unbatched_round_trips: int = 0
+	# Elements skipped (with their subtrees) because they were scrolled out of view or clipped
+	pruned: int = 0
+
+	@property
+	def round_trips_saved(self) -> int:
+		return self.unbatched_round_trips - self.round_trips
 
 
 class MacUITreeBuilder:
-	def __init__(self):
+	def __init__(
+		self,
+		backend: Optional[AccessibilityBackend] = None,
+		batch_attributes: bool = True,
+		incremental: bool = False,
+		max_nodes: Optional[int] = None,
+		time_budget: Optional[float] = None,
+		traversal_order: Literal['dfs', 'bfs'] = 'dfs',
+		executor: Optional[AccessibilityExecutor] = None,
+		call_timeout: Optional[float] = 30.0,
+		stable_indices: bool = True,
+		prune_offscreen: bool = False,
+		table_rows: Optional[int] = None,
+		windows: Literal['main', 'all'] = 'main',
+		include_menu_bar: bool = False,
+		extra_pids: Optional[Sequence[int]] = None,
+		focus_first: bool = False,
+	):
+		self.backend = backend or PyObjCBackend()
+		# Read each element's attributes with one AXUIElementCopyMultipleAttributeValues call
+		self.batch_attributes = batch_attributes
+		# Patch the previous tree from AX notifications instead of rebuilding it every step
+		self.incremental = incremental
+		# Node, wall-clock and order limits for each walk; exceeding them yields a truncated tree
+		self.budget = TraversalBudget(max_nodes=max_nodes, time_limit=time_budget, order=traversal_order)
+		# All AX work runs on this worker thread so slow apps don't block the event loop
+		self._executor = executor
+		self._owns_executor = executor is None
+		# Seconds to wait for a build or action before giving up on the app
+		self.call_timeout = call_timeout
+		# Keep an element's highlight index across builds instead of renumbering in document order
+		self.stable_indices = stable_indices
+		self._identities = ElementIdentityMap()
+		# Skip subtrees that are scrolled out of view or clipped by their window or scroll area
+		self.prune_offscreen = prune_offscreen
+		# id(node) -> (node, clip rect) for the current build or patch pass
+		self._clip_rects: Dict[int, Tuple[MacElementNode, Optional[Rect]]] = {}
+		# Rows per table/outline/list window; None walks their rows like any other children
+		self.table_rows = table_rows
+		self.max_columns = 12
+		# Table AX element -> first row (0-based) of its window, once paged away from the visible rows
+		self._table_offsets: Dict[Any, int] = {}
+		# id(row node) -> cell elements routed to the row for change notifications
+		self._row_cells: Dict[int, List[Any]] = {}
+		# 'main' walks the main window only; 'all' walks every window front to back (dialogs, panels,
+		# secondary windows) as its own subtree, labelled per window in the prompt
+		self.windows = windows
+		# Add the app's menu bar (top-level items, plus the menu that is open) as its own subtree; needs windows='all'
+		self.include_menu_bar = include_menu_bar
+		# Other apps whose windows are added to every snapshot (e.g. a helper process showing a dialog); needs windows='all'
+		self.extra_pids: List[int] = list(extra_pids or [])
+		# Walk the subtree around AXFocusedUIElement first and expand outward from it, so a traversal
+		# budget spends itself where the user is working
+		self.focus_first = focus_first
+		self.stats = TreeBuildStats()
 		self.highlight_index = 0
 		self._element_cache = {}
 		self._observers = {}
+		self._change_tracker: Optional[UIChangeTracker] = None
+		self._root: Optional[MacElementNode] = None
+		# Query index over _root, built on first use after each change to the tree
+		self._index: Optional[TreeIndex] = None
+		# Node of the app's AXFocusedUIElement as of the last build, if it is in the tree
+		self.focused_node: Optional[MacElementNode] = None
+		self._nodes_by_element: Dict[Any, MacElementNode] = {}
 		self._processed_elements = set()
 		self._current_app_pid = None
 		self.max_depth = 30
@@ -73,14 +190,38 @@ class MacUITreeBuilder:
 			'AXScrollDownByPage'
 		}
 
+	@property
+	def executor(self) -> AccessibilityExecutor:
+		"""Worker thread that owns AX calls and observers for this builder, created on first use"""
+		if self._executor is None:
+			self._executor = AccessibilityExecutor(self.backend)
+		return self._executor
+
 	def _setup_observer(self, pid: int) -> bool:
 		"""Setup accessibility observer for an application"""
-		return True  #  Temporarily always return True
+		if not self.incremental:
+			return True
+		if self._change_tracker is not None and self._change_tracker.pid == pid:
+			return True
+
+		self._close_observer()
+		self._root = None
+		# Windows opening and closing only re-list the application's windows when all of them are walked
+		self._change_tracker = UIChangeTracker(self.backend, pid, patch_root=self.windows == 'all')
+		# Without notifications every build is a full rebuild, which is still a valid tree
+		return True
+
+	def _close_observer(self) -> None:
+		if self._change_tracker is not None:
+			self._change_tracker.close()
+			self._change_tracker = None
 
-	def _get_attribute(self, element: 'AXUIElement', attribute: str) -> any:
+	def _get_attribute(self, element: Any, attribute: str) -> Any:
 		"""Safely get an accessibility attribute with error reporting"""
+		self.stats.round_trips += 1
+		self.stats.unbatched_round_trips += 1
 		try:
-			error, value_ref = AXUIElementCopyAttributeValue(element, attribute, None)
+			error, value_ref = self.backend.copy_attribute_value(element, attribute)
 			if error == kAXErrorSuccess:
 				return value_ref
 			elif error == kAXErrorAttributeUnsupported:
@@ -93,10 +234,33 @@ class MacUITreeBuilder:
 			# logger.debug(f"Exception getting attribute '{attribute}': {str(e)}")
 			return None
 
-	def _get_actions(self, element: 'AXUIElement') -> List[str]:
+	def _get_attributes(self, element: Any, attributes: List[str]) -> Dict[str, Any]:
+		"""Read several attributes, batched into one round trip unless batching is disabled"""
+		if not self.batch_attributes:
+			values = {attribute: self._get_attribute(element, attribute) for attribute in attributes}
+		else:
+			self.stats.round_trips += 1
+			self.stats.unbatched_round_trips += len(attributes)
+			try:
+				error, batch = self.backend.copy_multiple_attribute_values(element, attributes)
+				if error != kAXErrorSuccess:
+					return {attribute: None for attribute in attributes}
+				values = dict(zip(attributes, batch))
+			except Exception:
+				return {attribute: None for attribute in attributes}
+
+		# Geometry comes back as AXValue boxes; unpack to (x, y) and (width, height)
+		for attribute in (kAXPositionAttribute, kAXSizeAttribute):
+			if values.get(attribute) is not None:
+				values[attribute] = self.backend.decode_value(values[attribute])
+		return values
+
+	def _get_actions(self, element: Any) -> List[str]:
 		"""Get available actions for an element with proper error handling"""
+		self.stats.round_trips += 1
+		self.stats.unbatched_round_trips += 1
 		try:
-			error, actions = AXUIElementCopyActionNames(element, None)
+			error, actions = self.backend.copy_action_names(element)
 			if error == kAXErrorSuccess and actions:
 				# Convert NSArray to Python list
 				return list(actions)
@@ -105,8 +269,8 @@ class MacUITreeBuilder:
 			logger.debug(f'Error getting actions: {e}')
 			return []
 
-	def _is_interactive(self, element: 'AXUIElement', role: str, actions: List[str]) -> bool:
-		"""Determine if an element is truly interactive based on its role and actions."""
+	def _is_interactive(self, role: str, actions: List[str], enabled: Any) -> bool:
+		"""Determine if an element is truly interactive based on its role, actions and AXEnabled value."""
 		if not actions:
 			return False
 
@@ -116,20 +280,20 @@ class MacUITreeBuilder:
 		
 		# Special handling for text input fields
 		if 'AXSetValue' in actions and role == 'AXTextField':
-			enabled = self._get_attribute(element, 'AXEnabled')
 			return bool(enabled)
 
 		# Special handling for buttons with AXPress
 		if 'AXPress' in actions and role in ['AXButton', 'AXLink']:
-			enabled = self._get_attribute(element, 'AXEnabled')
 			return bool(enabled)
 
 		return has_interactive or has_scroll
 
-	async def _process_element(self, element: 'AXUIElement', pid: int, parent: Optional[MacElementNode] = None, depth: int = 0) -> Optional[MacElementNode]:
-		"""Process a single UI element"""
-		element_identifier = str(element)
-		
+	def _visit_element(
+		self, element: Any, pid: int, parent: Optional[MacElementNode], depth: int
+	) -> Optional[Tuple[MacElementNode, List[Any]]]:
+		"""Process a single UI element, returning its node and the child elements to walk next"""
+		element_identifier = self.backend.element_id(element)
+
 		if element_identifier in self._processed_elements:
 			return None
 
@@ -140,9 +304,18 @@ class MacUITreeBuilder:
 			if not role:
 				return None
 
-			# Get all possible attributes and actions
+			# Get basic and additional attributes (one round trip when batching)
+			values = self._get_attributes(element, ROLE_ATTRIBUTES.get(role, DEFAULT_ELEMENT_ATTRIBUTES))
+			visibility = self._visibility(values, parent)
+			if visibility == 'hidden':
+				# Skip the element's actions and its whole subtree
+				self._processed_elements.discard(element_identifier)
+				self.stats.pruned += 1
+				return None
+
+			# Get all possible actions
 			actions = self._get_actions(element)
-			
+
 			# Create node with enhanced attributes
 			node = MacElementNode(
 				role=role,
@@ -154,129 +327,726 @@ class MacUITreeBuilder:
 			)
 			node._element = element
 
-			# Store the actions in the node's attributes for reference
-			if actions:
-				node.attributes['actions'] = actions
-
-			# Get basic attributes
-			title = self._get_attribute(element, kAXTitleAttribute)
-			value = self._get_attribute(element, kAXValueAttribute)
-			description = self._get_attribute(element, kAXDescriptionAttribute)
-			is_enabled = self._get_attribute(element, 'AXEnabled')
-			
-			# Additional useful attributes
-			position = self._get_attribute(element, 'AXPosition')
-			size = self._get_attribute(element, 'AXSize')
-			subrole = self._get_attribute(element, 'AXSubrole')
-
-			# Update node attributes
-			if title:
-				node.attributes['title'] = title
-			if value:
-				node.attributes['value'] = value
-			if description:
-				node.attributes['description'] = description
-			if is_enabled is not None:
-				node.is_visible = bool(is_enabled)
-				node.attributes['enabled'] = bool(is_enabled)
-			if position:
-				node.attributes['position'] = position
-			if size:
-				node.attributes['size'] = size
-			if subrole:
-				node.attributes['subrole'] = subrole
-
-			# Determine if element should be included as context
-			is_context = (role in ['AXStaticText', 'AXTextField'] and 
-						'AXSetValue' not in actions and
-						(parent is None or parent.role == 'AXWindow' or parent.is_interactive))
-
-			# Determine interactivity based on actions
-			node.is_interactive = self._is_interactive(element, role, actions)
-			
-			if node.is_interactive:
-				node.highlight_index = self.highlight_index
-				self._element_cache[self.highlight_index] = node
-				self.highlight_index += 1
-			elif is_context:
-				node.highlight_index = None
-				self._element_cache[f'ctx_{element_identifier}'] = node
-				logger.debug(f'Added context element {role}')
-
-			# Process children
-			children_ref = self._get_attribute(element, kAXChildrenAttribute)
-			if children_ref and depth < self.max_depth:
-				try:
-					children_count = len(list(children_ref))
-					if children_count > self.max_children:
-						logger.error(f"Max children limit ({self.max_children}) exceeded for element {role}. Found {children_count} children. Some elements will not be processed.")
-					
-					children_list = list(children_ref)[:self.max_children]
-					for child in children_list:
-						child_node = await self._process_element(child, pid, node, depth + 1)
-						if child_node:
-							node.children.append(child_node)
-				except Exception as e:
-					logger.warning(f"Error processing children: {e}")
-			elif children_ref and depth >= self.max_depth:
-				logger.error(f"Max depth limit ({self.max_depth}) reached for element {role}. Children at depth {depth} will not be processed.")
-
-			return node
+			self.stats.nodes += 1
+			self._apply_attributes(node, actions, values, visibility)
+			self._nodes_by_element[element] = node
+
+			if self.table_rows and role in TABLE_ROLES:
+				# Rows are read here as a window instead of being walked
+				self._read_table(node, values, pid)
+				return node, []
+			if role == 'AXMenuBarItem' and not values.get(kAXSelectedAttribute):
+				return node, []
+
+			# Collect children for the traversal engine
+			children_ref = values.get(kAXChildrenAttribute)
+			if not children_ref:
+				return node, []
+			if depth >= self.max_depth:
+				logger.error(
+					f"Max depth limit ({self.max_depth}) reached for element {role}. "
+					f"Children at depth {depth} will not be processed."
+				)
+				return node, []
+
+			children_list = list(children_ref)
+			if len(children_list) > self.max_children:
+				logger.error(
+					f"Max children limit ({self.max_children}) exceeded for element {role}. "
+					f"Found {len(children_list)} children. Some elements will not be processed."
+				)
+			return node, children_list[: self.max_children]
 
 		except Exception as e:
 			logger.error(f'Error processing element: {str(e)}')
 			return None
 
+	def _walk_windows(
+		self, app_ref: Any, roots: List[Tuple[Any, MacElementNode, int]], pid: int
+	) -> List[Optional[MacElementNode]]:
+		"""Walk window roots, focus first when enabled"""
+		if self.focus_first:
+			return self._walk_focus_first(app_ref, roots, pid)
+		return self._walk(roots, pid)
+
+	def _focus_chain(self, app_ref: Any, root_elements: List[Any]) -> Optional[List[Any]]:
+		"""Elements from one of `root_elements` down to the app's focused element, or None if focus is elsewhere"""
+		element = self._get_attribute(app_ref, kAXFocusedUIElementAttribute)
+		chain = []
+		while element is not None and len(chain) <= self.max_depth:
+			chain.append(element)
+			if element in root_elements:
+				return chain[::-1]
+			element = self._get_attribute(element, kAXParentAttribute)
+		return None
+
+	def _walk_focus_first(
+		self, app_ref: Any, roots: List[Tuple[Any, MacElementNode, int]], pid: int
+	) -> List[Optional[MacElementNode]]:
+		"""
+		Walk `roots` starting with the focused element's subtree, then its siblings' subtrees, then
+		those of each ancestor's other children outward to the window, then the other roots.
+
+		The tree comes out the same as a plain walk; only the visiting order differs, so a node or
+		time budget cuts off the parts farthest from the focus.
+		"""
+		root_elements = [element for element, _, _ in roots]
+		chain = self._focus_chain(app_ref, root_elements)
+		if chain is None:
+			return self._walk(roots, pid)
+		root_index = root_elements.index(chain[0])
+		_, parent, depth = roots[root_index]
+
+		# Visit the chain itself top-down, as far as each link is one of its parent's walkable children
+		path: List[Tuple[MacElementNode, List[Any]]] = []
+		# Position of each link below the top among its parent's children
+		positions: List[int] = []
+		for level, element in enumerate(chain):
+			if path:
+				siblings = path[-1][1]
+				if element not in siblings:
+					break
+				position = siblings.index(element)
+			visited = self._visit_element(element, pid, path[-1][0] if path else parent, depth + level)
+			if visited is None:
+				break
+			path.append(visited)
+			if level:
+				positions.append(position)
+		if not path:
+			return self._walk(roots, pid)
+
+		# Nearest levels first: the focused element's children, then its siblings, and so on outward
+		walk_roots: List[Tuple[Any, MacElementNode, int]] = []
+		slots: Dict[Tuple[int, int], int] = {}
+		for level in range(len(path) - 1, -1, -1):
+			node, children = path[level]
+			for i, child in enumerate(children):
+				if level < len(positions) and i == positions[level]:
+					continue
+				slots[(level, i)] = len(walk_roots)
+				walk_roots.append((child, node, depth + level + 1))
+		others = [i for i in range(len(roots)) if i != root_index]
+		walk_roots += [roots[i] for i in others]
+		walked = self._walk(walk_roots, pid)
+
+		# Attach everything in sibling order, the chain child in its own place
+		for level, (node, children) in enumerate(path):
+			for i, child in enumerate(children):
+				if (level, i) in slots:
+					child_node = walked[slots[(level, i)]]
+				else:
+					child_node = path[level + 1][0]
+				if child_node is not None:
+					node.children.append(child_node)
+
+		nodes: List[Optional[MacElementNode]] = [None] * len(roots)
+		nodes[root_index] = path[0][0]
+		for i, node in zip(others, walked[len(walk_roots) - len(others):]):
+			nodes[i] = node
+		return nodes
+
+	def _walk(self, roots: List[Tuple[Any, MacElementNode, int]], pid: int) -> List[Optional[MacElementNode]]:
+		"""Walk subtrees from (element, parent, depth) roots under the builder's traversal budget"""
+		result = traverse(
+			roots,
+			lambda element, parent, depth: self._visit_element(element, pid, parent, depth),
+			self.budget,
+			should_stop=self.executor.should_stop if self.executor.on_worker_thread else None,
+		)
+		if result.truncated:
+			self.stats.truncated = True
+			self.stats.pending += result.pending
+			logger.warning(f'UI tree truncated: {result.truncation_reason}, {result.pending} elements not visited')
+		return result.nodes
+
+	def _visibility(self, values: Dict[str, Any], parent: Optional[MacElementNode]) -> Visibility:
+		"""How much of an element shows inside its window and scroll areas; always visible unless pruning"""
+		if not self.prune_offscreen:
+			return 'visible'
+		rect = element_rect(values.get(kAXPositionAttribute), values.get(kAXSizeAttribute))
+		return visibility(rect, self._clip_rect(parent))
+
+	def _clip_rect(self, node: Optional[MacElementNode]) -> Optional[Rect]:
+		"""Screen area a node's children can show in (its clipping ancestors' frames); None if unbounded"""
+		chain = []
+		while node is not None:
+			cached = self._clip_rects.get(id(node))
+			if cached is not None and cached[0] is node:
+				break
+			chain.append(node)
+			node = node.parent
+		clip = self._clip_rects[id(node)][1] if node is not None else None
+		for current in reversed(chain):
+			if current.role in CLIPPING_ROLES:
+				clip = intersect(clip, element_rect(current.position, current.size))
+			self._clip_rects[id(current)] = (current, clip)
+		return clip
+
+	def _apply_attributes(
+		self, node: MacElementNode, actions: List[str], values: Dict[str, Any], visibility: Visibility = 'visible'
+	) -> None:
+		"""Store fetched attribute values on a node and derive its interactivity"""
+		node.attributes = {}
+		# Store the actions in the node's attributes for reference
+		if actions:
+			node.attributes['actions'] = intern_actions(actions)
+
+		title = values.get(kAXTitleAttribute)
+		value = values.get(kAXValueAttribute)
+		description = values.get(kAXDescriptionAttribute)
+		is_enabled = values.get(kAXEnabledAttribute)
+		position = values.get(kAXPositionAttribute)
+		size = values.get(kAXSizeAttribute)
+		subrole = values.get(kAXSubroleAttribute)
+
+		# Update node attributes
+		if title:
+			node.attributes['title'] = title
+		if value:
+			node.attributes['value'] = value
+		if description:
+			node.attributes['description'] = description
+		if is_enabled is not None:
+			node.is_visible = bool(is_enabled)
+			node.attributes['enabled'] = bool(is_enabled)
+		if position:
+			node.attributes['position'] = position
+		if size:
+			node.attributes['size'] = size
+		if subrole:
+			node.attributes['subrole'] = intern_string(subrole)
+		if visibility == 'partial':
+			node.attributes['partially_visible'] = True
+		if self.windows == 'all' and node.role == 'AXSheet':
+			node.attributes['window_label'] = _window_label('Sheet', title)
+
+		# Determine interactivity based on actions
+		node.is_interactive = self._is_interactive(node.role, actions, is_enabled)
+
+	def _read_table(self, node: MacElementNode, values: Dict[str, Any], pid: int) -> None:
+		"""Replace a table's children with one compact node per row in its current row window"""
+		element = node._element
+		if node.role == 'AXList':
+			rows = list(values.get(kAXChildrenAttribute) or [])
+			visible_rows, headers = [], []
+		else:
+			table = self._get_attributes(element, _TABLE_ATTRIBUTES)
+			rows = list(table.get(kAXRowsAttribute) or [])
+			visible_rows = list(table.get(kAXVisibleRowsAttribute) or [])
+			headers = list(table.get(kAXColumnTitlesAttribute) or table.get(kAXColumnsAttribute) or [])
+
+		start = self._table_offsets.get(element)
+		if start is None:
+			start = self._first_visible_row(rows, visible_rows)
+		start = max(0, min(start, len(rows) - self.table_rows))
+		end = min(len(rows), start + self.table_rows)
+
+		node.attributes['row_window'] = (start, end, len(rows))
+		columns = [self._cell_text(header) for header in headers[: self.max_columns]]
+		if any(columns):
+			node.attributes['columns'] = ' | '.join(columns)
+		# Give the table an index so page_table can refer to it
+		node.is_interactive = True
+
+		for child in node.children:
+			self._forget(child)
+		node.children = []
+		for i in range(start, end):
+			row = MacElementNode(
+				role='AXRow',
+				identifier=self.backend.element_id(rows[i]),
+				attributes={},
+				is_visible=True,
+				parent=node,
+				app_pid=pid,
+			)
+			row._element = rows[i]
+			self._read_row(row, i)
+			self._nodes_by_element[rows[i]] = row
+			self._processed_elements.add(row.identifier)
+			node.children.append(row)
+
+	def _first_visible_row(self, rows: List[Any], visible_rows: List[Any]) -> int:
+		if not visible_rows:
+			return 0
+		try:
+			return rows.index(visible_rows[0])
+		except ValueError:
+			return 0
+
+	def _read_row(self, node: MacElementNode, row_number: int) -> None:
+		"""Read a row's cells into a single `value` of ' | '-separated columns"""
+		values = self._get_attributes(node._element, _ROW_ATTRIBUTES)
+		actions = self._get_actions(node._element)
+		if values.get(kAXRoleAttribute):
+			node.role = intern_string(values[kAXRoleAttribute])
+
+		cells = list(values.get(kAXChildrenAttribute) or [])[: self.max_columns]
+		routed: List[Any] = []
+		if cells:
+			text = ' | '.join(self._cell_text(cell, routed) for cell in cells)
+		else:
+			# List items are usually a single text element
+			text = self._cell_text(node._element, routed)
+		level = values.get(kAXDisclosureLevelAttribute)
+		if level:
+			# Outline rows are indented by their depth
+			text = '  ' * int(level) + text
+
+		node.attributes = {'row': row_number + 1}
+		if actions:
+			node.attributes['actions'] = intern_actions(actions)
+		if text.strip():
+			node.attributes['value'] = text
+		enabled = values.get(kAXEnabledAttribute)
+		if enabled is not None and not enabled:
+			node.attributes['enabled'] = False
+		if values.get(kAXSelectedAttribute):
+			node.attributes['selected'] = True
+		node.is_interactive = self._is_interactive(node.role, actions, True if enabled is None else enabled)
+		self.stats.nodes += 1
+
+		# Cells aren't nodes; send their change notifications to the row
+		self._unroute_cells(node)
+		for cell in routed:
+			self._nodes_by_element.setdefault(cell, node)
+		self._row_cells[id(node)] = routed
+
+	def _unroute_cells(self, node: MacElementNode) -> None:
+		for cell in self._row_cells.pop(id(node), []):
+			if self._nodes_by_element.get(cell) is node:
+				del self._nodes_by_element[cell]
+
+	def _cell_text(self, cell: Any, routed: Optional[List[Any]] = None) -> str:
+		"""Text of a cell or header: its own value/title/description, else that of its first children"""
+		values = self._get_attributes(cell, _CELL_ATTRIBUTES)
+		if routed is not None:
+			routed.append(cell)
+		text = _first_text(values)
+		if text:
+			return text
+		for child in list(values.get(kAXChildrenAttribute) or [])[:3]:
+			child_values = self._get_attributes(child, _CELL_ATTRIBUTES[:-1])
+			if routed is not None:
+				routed.append(child)
+			text = _first_text(child_values)
+			if text:
+				return text
+		return ''
+
+	def set_row_window(self, table: MacElementNode, start: int) -> Tuple[int, int, int]:
+		"""
+		Show rows from `start` (0-based) of a windowed table; returns (start, end, total). The cached
+		tree shows them once the table is rebuilt with `build_subtree(table)`, or after a full build.
+		"""
+		total = table.attributes['row_window'][2]
+		start = max(0, min(start, total - self.table_rows))
+		self._table_offsets[table._element] = start
+		return start, min(total, start + self.table_rows), total
+
+	def _is_table(self, node: MacElementNode) -> bool:
+		return 'row_window' in node.attributes
+
+	def _is_table_row(self, node: MacElementNode) -> bool:
+		return node.parent is not None and self._is_table(node.parent)
+
+	def _index_node(self, node: MacElementNode, cache: Dict[Any, MacElementNode]) -> None:
+		"""Give interactive nodes the next highlight index and cache context nodes"""
+		parent = node.parent
+		# Determine if element should be included as context
+		is_context = (node.role in ['AXStaticText', 'AXTextField'] and
+					'AXSetValue' not in node.actions and
+					(parent is None or parent.role == 'AXWindow' or parent.is_interactive))
+
+		if node.is_interactive:
+			node.highlight_index = self.highlight_index
+			cache[self.highlight_index] = node
+			self.highlight_index += 1
+		else:
+			node.highlight_index = None
+			if is_context:
+				cache[f'ctx_{node.identifier}'] = node
+				logger.debug(f'Added context element {node.role}')
+
+	def _reindex(self, root: MacElementNode) -> None:
+		"""
+		Reassign highlight indices after the tree was built or patched. The element cache is rebuilt
+		aside and swapped in, since actions read it on the event loop while the worker builds.
+		"""
+		self._index = None
+		self.highlight_index = 0
+		cache: Dict[Any, MacElementNode] = {}
+		stack = list(reversed(root.children))
+		while stack:
+			node = stack.pop()
+			# Patched trees reuse nodes whose siblings may have changed
+			node.invalidate_accessibility_path()
+			self._index_node(node, cache)
+			stack.extend(reversed(node.children))
+
+		# A truncated tree would retire the indices of every element it didn't reach
+		if self._discard_if_cancelled():
+			return
+		if self.stable_indices:
+			interactive = [cache.pop(index) for index in range(self.highlight_index)]
+			for index, node in self._identities.assign(interactive).items():
+				node.highlight_index = index
+				cache[index] = node
+			self.highlight_index = self._identities.next_index
+		if not self._discard_if_cancelled():
+			self._element_cache = cache
+
+	def _discard_if_cancelled(self) -> bool:
+		"""
+		Whether the caller stopped waiting for the build running on the worker. Its results aren't
+		published, and as a patch may have been applied halfway the next build starts from scratch.
+		"""
+		if not (self.executor.on_worker_thread and self.executor.should_stop()):
+			return False
+		logger.debug('Tree build was cancelled or timed out, discarding it')
+		self._root = None
+		return True
+
+	def _forget(self, node: MacElementNode) -> None:
+		"""Drop a detached subtree from the element lookup tables"""
+		stack = [node]
+		while stack:
+			current = stack.pop()
+			if self._nodes_by_element.get(current._element) is current:
+				del self._nodes_by_element[current._element]
+			self._unroute_cells(current)
+			self._processed_elements.discard(current.identifier)
+			stack.extend(current.children)
+
+	def _depth(self, node: MacElementNode) -> int:
+		"""Depth of a node below the application root"""
+		depth = -1
+		while node.parent is not None:
+			depth += 1
+			node = node.parent
+		return depth
+
+	def _refresh_children(self, node: MacElementNode, pid: int) -> None:
+		"""Re-list a node's children, keeping the nodes of children that are still there"""
+		if self._is_table(node) or self._is_table_row(node):
+			self._reload_table_part(node, pid)
+			return
+		if node.parent is None and self.windows == 'all':
+			self._collect_windows(node, pid)
+			return
+		self.stats.round_trips += 1
+		self.stats.unbatched_round_trips += 1
+		children = self.backend.children(node._element)[: self.max_children]
+		depth = self._depth(node)
+
+		slots: List[Optional[MacElementNode]] = []
+		to_walk = []
+		for child in children:
+			existing = self._nodes_by_element.get(child)
+			if existing is not None and existing.parent is node:
+				slots.append(existing)
+				continue
+			if existing is not None:
+				# Element moved here from elsewhere in the tree
+				self._forget(existing)
+			to_walk.append((len(slots), child))
+			slots.append(None)
+
+		if to_walk:
+			walked = self._walk([(child, node, depth + 1) for _, child in to_walk], pid)
+			for (slot, _), child_node in zip(to_walk, walked):
+				slots[slot] = child_node
+
+		new_children = [child for child in slots if child is not None]
+		kept = {id(child) for child in new_children}
+		for old_child in node.children:
+			if id(old_child) not in kept:
+				self._forget(old_child)
+		node.children = new_children
+
+	def _reload_table_part(self, node: MacElementNode, pid: int) -> None:
+		"""Re-read a changed row in place, or a changed table with its whole row window"""
+		if self._is_table_row(node):
+			self._read_row(node, node.attributes['row'] - 1)
+			return
+		actions = self._get_actions(node._element)
+		values = self._get_attributes(node._element, ROLE_ATTRIBUTES.get(node.role, DEFAULT_ELEMENT_ATTRIBUTES))
+		self._apply_attributes(node, actions, values, self._visibility(values, node.parent))
+		self._read_table(node, values, pid)
+
+	def _find_focused(self, root: MacElementNode) -> Optional[MacElementNode]:
+		focused = self._get_attribute(root._element, kAXFocusedUIElementAttribute)
+		return self._nodes_by_element.get(focused) if focused is not None else None
+
+	def _collect_windows(self, app: MacElementNode, pid: int) -> None:
+		"""
+		Make an application node's children its windows front to back, plus the menu bar; windows
+		already in the tree keep their subtrees
+		"""
+		tops = list(self._get_attribute(app._element, kAXWindowsAttribute) or [])[: self.max_children]
+		if self.include_menu_bar:
+			menu_bar = self._get_attribute(app._element, kAXMenuBarAttribute)
+			if menu_bar is not None:
+				tops.append(menu_bar)
+
+		existing = {}
+		for child in app.children:
+			existing[child._element] = child
+		slots: List[Optional[MacElementNode]] = [existing.pop(element, None) for element in tops]
+		to_walk = [(element, app, 0) for element, node in zip(tops, slots) if node is None]
+		if to_walk:
+			walked = iter(self._walk_windows(app._element, to_walk, pid))
+			slots = [node if node is not None else next(walked) for node in slots]
+		for closed in existing.values():
+			self._forget(closed)
+		app.children = [node for node in slots if node is not None]
+
+	def _label_windows(self, root: MacElementNode) -> None:
+		"""Label each top-level subtree of the snapshot's applications for the prompt"""
+		apps = [root] + [child for child in root.children if child.role == 'application']
+		for app in apps:
+			if self.extra_pids:
+				name = self._get_attribute(app._element, kAXTitleAttribute)
+				app.attributes['window_label'] = f'App "{name or "unknown"}" (pid {app.app_pid})'
+			main = self._get_attribute(app._element, kAXMainWindowAttribute)
+			focused = self._get_attribute(app._element, kAXFocusedWindowAttribute)
+			for child in app.children:
+				if child.role == 'AXMenuBar':
+					child.attributes['window_label'] = 'Menu bar'
+				elif child.role != 'application':
+					flags = []
+					if focused is not None and child._element == focused:
+						flags.append('focused')
+					if main is not None and child._element == main:
+						flags.append('main')
+					if self._get_attribute(child._element, kAXModalAttribute):
+						flags.append('modal')
+					kind = WINDOW_KINDS.get(child.attributes.get('subrole'), 'Window')
+					child.attributes['window_label'] = _window_label(kind, child.attributes.get('title'), flags)
+
+	def _collect_extra_apps(self, root: MacElementNode) -> None:
+		"""Walk the windows of `extra_pids` afresh under the root; they aren't observed, so nothing is patched"""
+		for child in root.children:
+			if child.role == 'application':
+				self._forget(child)
+		root.children = [child for child in root.children if child.role != 'application']
+		for pid in self.extra_pids:
+			if pid == root.app_pid or not self.backend.is_process_running(pid):
+				continue
+			app_ref = self.backend.application_element(pid)
+			app = MacElementNode(
+				role='application',
+				identifier=self.backend.element_id(app_ref),
+				attributes={},
+				is_visible=True,
+				parent=root,
+				app_pid=pid,
+			)
+			app._element = app_ref
+			self._nodes_by_element[app_ref] = app
+			self._collect_windows(app, pid)
+			root.children.append(app)
+
+	def _refresh_tree(self, pid: int) -> Optional[MacElementNode]:
+		"""Patch the previous tree from pending notifications; None if it must be rebuilt"""
+		tracker = self._change_tracker
+		if self._root is None or tracker is None or not tracker.active or tracker.pid != pid:
+			return None
+		if self._root.attributes.get('truncated'):
+			# A partial tree can't be patched into a complete one
+			return None
+
+		dirty = tracker.collect(self._nodes_by_element)
+		if dirty is None:
+			return None
+		if self.prune_offscreen and any(node.role in SCROLL_ROLES for node in dirty.attributes.values()):
+			# Scrolling moves elements in and out of view without notifying about them
+			return None
+
+		self.stats = TreeBuildStats()
+		for node in dirty.attributes.values():
+			if self._nodes_by_element.get(node._element) is not node or id(node) in dirty.children:
+				continue
+			if self._is_table(node) or self._is_table_row(node):
+				self._reload_table_part(node, pid)
+				continue
+			actions = self._get_actions(node._element)
+			values = self._get_attributes(node._element, ROLE_ATTRIBUTES.get(node.role, DEFAULT_ELEMENT_ATTRIBUTES))
+			self._apply_attributes(node, actions, values, self._visibility(values, node.parent))
+			self.stats.nodes += 1
+
+		for node in dirty.children.values():
+			# Skip nodes detached by an earlier refresh in this pass
+			if self._nodes_by_element.get(node._element) is not node:
+				continue
+			self._refresh_children(node, pid)
+		if self.windows == 'all':
+			# Other apps aren't observed at all, and focus and main window change without notifications
+			self._collect_extra_apps(self._root)
+			self._label_windows(self._root)
+		self._clip_rects.clear()
+
+		if dirty or self.windows == 'all':
+			self._reindex(self._root)
+		if self._discard_if_cancelled():
+			return None
+		self.focused_node = self._find_focused(self._root)
+		logger.debug(
+			f'Patched tree: {len(dirty.attributes)} attribute and {len(dirty.children)} children updates, '
+			f'{self.stats.round_trips} AX round trips'
+		)
+		return self._root
+
 	def cleanup(self):
 		"""Cleanup observers and release resources"""
 		# Clear the element cache to prevent holding on to stale references
-		self._element_cache.clear()
+		self._element_cache = {}
 		# Clear processed elements set
 		self._processed_elements.clear()
 		# Reset highlight index
 		self.highlight_index = 0
 		# Reset current app PID
 		self._current_app_pid = None
-		
-		# Force garbage collection to release any Objective-C references
-		import gc
-		gc.collect()
-		
+		# Indices from a closed app mean nothing for the next one
+		self._identities.reset()
+		self._table_offsets.clear()
+		# Drop the incremental state and stop observing the app
+		self._close_observer()
+		self._root = None
+		self._nodes_by_element.clear()
+		self._row_cells.clear()
+		self.focused_node = None
+		# Parent links are weak, so dropping the root frees the tree (and its AX references) without gc.collect()
+
 		# Log the cleanup
 		logger.debug("MacUITreeBuilder cleanup completed: all references released")
 
 	def reset_state(self):
 		"""Reset the state between major steps"""
 		self.highlight_index = 0  # Reset index
-		self._element_cache.clear()  # Clear cache
+		self._element_cache = {}  # Clear cache
 		self._processed_elements.clear()  # Clear processed set
+		self._root = None  # Next build is a full rebuild
+		self._nodes_by_element.clear()
+		self._row_cells.clear()
+		self.focused_node = None
 		
 		# Don't reset _current_app_pid here as it's needed for continuity between steps
 		
 		# Log the reset
 		logger.debug("MacUITreeBuilder state reset")
 
+	async def close(self) -> None:
+		"""
+		Release the tree and stop observing the app, then stop the worker thread if this builder
+		started it. The builder can still be used afterwards; its next build starts from scratch.
+		"""
+		try:
+			await self.executor.run(self.cleanup, timeout=self.call_timeout)
+		except AccessibilityTimeoutError as e:
+			logger.error(f'Error closing tree builder: {e}')
+		if self._owns_executor and self._executor is not None:
+			self._executor.shutdown(wait=False)
+
 	async def build_tree(self, pid: Optional[int] = None) -> Optional[MacElementNode]:
 		"""Build UI tree for a specific application"""
 		try:
-			# Reset processed elements and cache before building new tree
-			self._processed_elements.clear()
-			self._element_cache.clear()
-			self.highlight_index = 0
+			return await self.executor.run(self._build_tree, pid, timeout=self.call_timeout)
+		except AccessibilityTimeoutError as e:
+			logger.error(f'Error building tree: {e}')
+			return None
+
+	async def element_exists(self, index: int) -> bool:
+		"""Whether the element at a highlight index is still in the UI: one attribute read on its AX reference, no rebuild"""
+		node = self._element_cache.get(index)
+		if node is None or node._element is None:
+			return False
+		try:
+			return await self.executor.run(self._element_alive, node._element, timeout=self.call_timeout)
+		except AccessibilityTimeoutError:
+			# A busy app hasn't destroyed the element; the action itself will find out
+			return True
+
+	def _element_alive(self, element: Any) -> bool:
+		error, _ = self.backend.copy_attribute_value(element, kAXRoleAttribute)
+		return error != kAXErrorInvalidUIElement
+
+	@property
+	def index(self) -> Optional[TreeIndex]:
+		"""Role, title, action, path and highlight index lookups over the current tree; None before the first build"""
+		if self._root is None:
+			return None
+		if self._index is None or self._index.root is not self._root:
+			self._index = TreeIndex.from_tree(self._root)
+		return self._index
+
+	def query(self, selector: str) -> List[MacElementNode]:
+		"""Nodes of the current tree matching a selector such as 'AXSheet AXButton[title="Save"]' (see mlx_use.mac.query)"""
+		index = self.index
+		return index.select(selector) if index is not None else []
+
+	async def build_subtree(self, scope: Union[MacElementNode, str]) -> Optional[MacElementNode]:
+		"""
+		Re-walk one part of the current tree, given as a node or its accessibility path, and splice
+		it in; returns the part's new node. The rest of the tree and its indices are kept, so this
+		costs time in proportion to the part's size.
+		"""
+		try:
+			return await self.executor.run(self._build_subtree, scope, timeout=self.call_timeout)
+		except AccessibilityTimeoutError as e:
+			logger.error(f'Error building subtree: {e}')
+			return None
+
+	def _build_subtree(self, scope: Union[MacElementNode, str]) -> Optional[MacElementNode]:
+		if self._root is None:
+			logger.warning('No tree to scope a build to; call build_tree first')
+			return None
+		node = self.index.find_by_path(scope) if isinstance(scope, str) else scope
+		if node is None or self._nodes_by_element.get(node._element) is not node:
+			logger.warning(f'Scope {scope} is not part of the current tree')
+			return None
+		if node.parent is None:
+			self._root = None
+			return self._build_tree(self._current_app_pid)
 
+		self.stats = TreeBuildStats()
+		parent = node.parent
+		self._forget(node)
+		fresh = self._walk([(node._element, parent, self._depth(node))], node.app_pid)[0]
+		if fresh is None:
+			parent.children = [child for child in parent.children if child is not node]
+		else:
+			parent.children = [fresh if child is node else child for child in parent.children]
+		self._clip_rects.clear()
+		if self.stats.truncated:
+			self._root.attributes['truncated'] = True
+		self._reindex(self._root)
+		if self._discard_if_cancelled():
+			return None
+		if self.windows == 'all' and parent.role == 'application':
+			# A rebuilt window lost its label
+			self._label_windows(self._root)
+		logger.debug(f'Rebuilt {node.role} subtree with {self.stats.nodes} nodes in {self.stats.round_trips} AX round trips')
+		return fresh
+
+	def _build_tree(self, pid: Optional[int]) -> Optional[MacElementNode]:
+		"""Build the tree synchronously; runs on the accessibility worker thread"""
+		try:
 			if pid is None and self._current_app_pid is None:
 				logger.debug('No app is currently open - waiting for app to be launched')
 				raise ValueError('No app is currently open')
 
 			if pid is not None:
+				if pid != self._current_app_pid:
+					self._identities.reset()
+					self._table_offsets.clear()
 				# Always update with the latest PID if provided
 				self._current_app_pid = pid
 
 			# Verify the process is still running
-			import subprocess
 			try:
-				result = subprocess.run(['ps', '-p', str(self._current_app_pid)], capture_output=True, text=True)
-				if result.returncode != 0:
+				if not self.backend.is_process_running(self._current_app_pid):
 					logger.error(f"Process with PID {self._current_app_pid} is no longer running")
 					self._current_app_pid = None
 					self.cleanup()
@@ -288,18 +1058,31 @@ class MacUITreeBuilder:
 				logger.warning('Failed to setup accessibility observer')
 				return None
 
+			if self.incremental:
+				root = self._refresh_tree(self._current_app_pid)
+				if root is not None or self._discard_if_cancelled():
+					return root
+
+			# Reset processed elements before building new tree; the element cache is replaced once it is built
+			self._processed_elements.clear()
+			self._nodes_by_element.clear()
+			self._row_cells.clear()
+			self._root = None
+			self.highlight_index = 0
+			self.stats = TreeBuildStats()
+
 			logger.debug(f'Creating AX element for pid {self._current_app_pid}')
-			app_ref = AXUIElementCreateApplication(self._current_app_pid)
+			app_ref = self.backend.application_element(self._current_app_pid)
 
 			logger.debug('Testing accessibility permissions (Role)...')
-			error, role_attr = AXUIElementCopyAttributeValue(app_ref, kAXRoleAttribute, None)
+			error, role_attr = self.backend.copy_attribute_value(app_ref, kAXRoleAttribute)
 			if error == kAXErrorSuccess:
 				logger.debug(f'Successfully got role attribute: ({error}, {role_attr})')
 			else:
 				logger.error(f'Error getting role attribute: {error}')
 				if error == kAXErrorAPIDisabled:
 					logger.error('Accessibility is not enabled. Please enable it in System Settings.')
-				elif error == -25204:
+				elif error == kAXErrorCannotComplete:
 					logger.error(f'Error -25204: Accessibility connection failed. The app may have been closed or restarted.')
 					# Reset current app PID as it's no longer valid
 					self._current_app_pid = None
@@ -309,41 +1092,61 @@ class MacUITreeBuilder:
 
 			root = MacElementNode(
 				role='application',
-				identifier=str(app_ref),
+				identifier=self.backend.element_id(app_ref),
 				attributes={},
 				is_visible=True,
 				app_pid=self._current_app_pid,
 			)
 			root._element = app_ref
+			self._nodes_by_element[app_ref] = root
 
-			logger.debug('Trying to get the main window...')
-			error, main_window_ref = AXUIElementCopyAttributeValue(app_ref, kAXMainWindowAttribute, None)
-			if error == '-25212':
-				return None, "Window not found"
-			if error != kAXErrorSuccess or not main_window_ref:
-				logger.warning(f'Could not get main window (error: {error}), trying fallback attribute AXWindows')
-				error, windows = AXUIElementCopyAttributeValue(app_ref, kAXWindowsAttribute, None)
-				if error == kAXErrorSuccess and windows:
-					try:
-						windows_list = list(windows)
-						if windows_list:
-							main_window_ref = windows_list[0]
-							logger.debug(f'Fallback: selected first window from AXWindows: {main_window_ref}')
-						else:
-							logger.warning("Fallback: AXWindows returned an empty list")
-					except Exception as e:
-						logger.error(f'Failed to iterate over AXWindows: {e}')
-				else:
-					logger.error(f'Fallback failed: could not get AXWindows (error: {error})')
+			main_window_ref = None
+			if self.windows == 'main':
+				logger.debug('Trying to get the main window...')
+				error, main_window_ref = self.backend.copy_attribute_value(app_ref, kAXMainWindowAttribute)
+				if error == '-25212':
+					return None, "Window not found"
+				if error != kAXErrorSuccess or not main_window_ref:
+					logger.warning(f'Could not get main window (error: {error}), trying fallback attribute AXWindows')
+					error, windows = self.backend.copy_attribute_value(app_ref, kAXWindowsAttribute)
+					if error == kAXErrorSuccess and windows:
+						try:
+							windows_list = list(windows)
+							if windows_list:
+								main_window_ref = windows_list[0]
+								logger.debug(f'Fallback: selected first window from AXWindows: {main_window_ref}')
+							else:
+								logger.warning("Fallback: AXWindows returned an empty list")
+						except Exception as e:
+							logger.error(f'Failed to iterate over AXWindows: {e}')
+					else:
+						logger.error(f'Fallback failed: could not get AXWindows (error: {error})')
 
-			if main_window_ref:
+			if self.windows == 'all':
+				self._collect_windows(root, self._current_app_pid)
+				self._collect_extra_apps(root)
+				self._label_windows(root)
+			elif main_window_ref:
 				logger.debug(f'Found main window: {main_window_ref}')
-				window_node = await self._process_element(main_window_ref, self._current_app_pid, root)
+				window_node = self._walk_windows(app_ref, [(main_window_ref, root, 0)], self._current_app_pid)[0]
 				if window_node:
 					root.children.append(window_node)
 			else:
 				logger.error('Could not determine a main window for the application.')
+			self._reindex(root)
+
+			self._clip_rects.clear()
+			if self.stats.truncated:
+				root.attributes['truncated'] = True
+			self.focused_node = self._find_focused(root)
 
+			logger.debug(
+				f'Built tree with {self.stats.nodes} nodes in {self.stats.round_trips} AX round trips '
+				f'({self.stats.round_trips_saved} saved by batching, {self.stats.pruned} offscreen elements pruned)'
+			)
+			if self._discard_if_cancelled():
+				return None
+			self._root = root
 			return root
 
 		except Exception as e:
@@ -352,3 +1155,18 @@ class MacUITreeBuilder:
 				import traceback
 				traceback.print_exc()
 			return None
+
+
+def _first_text(values: Dict[str, Any]) -> str:
+	for attribute in (kAXValueAttribute, kAXTitleAttribute, kAXDescriptionAttribute):
+		value = values.get(attribute)
+		if value is not None and str(value).strip():
+			return str(value)
+	return ''
+
+
+def _window_label(kind: str, title: Any, flags: Sequence[str] = ()) -> str:
+	label = f'{kind} "{title}"' if title else kind
+	if flags:
+		label += f' ({", ".join(flags)})'
+	return label
@@ -0,0 +1,47 @@
+"""
+Screen-geometry helpers for pruning elements that are scrolled out of view or clipped.
+"""
+
+from typing import Any, Literal, Optional, Tuple
+
+# (left, top, right, bottom) in screen points
+Rect = Tuple[float, float, float, float]
+
+Visibility = Literal['visible', 'partial', 'hidden']
+
+# Elements that clip their descendants to their own frame
+CLIPPING_ROLES = {'AXWindow', 'AXSheet', 'AXScrollArea'}
+
+
+def element_rect(position: Any, size: Any) -> Optional[Rect]:
+	"""Frame of an element from decoded AXPosition/AXSize, or None if unknown or empty"""
+	try:
+		x, y = position
+		width, height = size
+	except (TypeError, ValueError):
+		return None
+	if width <= 0 or height <= 0:
+		# Zero-size containers often still lay out visible children, so they don't prove anything
+		return None
+	return (x, y, x + width, y + height)
+
+
+def intersect(a: Optional[Rect], b: Optional[Rect]) -> Optional[Rect]:
+	"""Intersection of two rects where None means unbounded; may be empty"""
+	if a is None:
+		return b
+	if b is None:
+		return a
+	return (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+
+def visibility(rect: Optional[Rect], clip: Optional[Rect]) -> Visibility:
+	"""How much of `rect` shows through `clip`; unknown geometry counts as visible"""
+	if rect is None or clip is None:
+		return 'visible'
+	visible = intersect(rect, clip)
+	if visible[2] <= visible[0] or visible[3] <= visible[1]:
+		return 'hidden'
+	if visible == rect:
+		return 'visible'
+	return 'partial'
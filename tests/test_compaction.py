@@ -0,0 +1,121 @@
+from typing import List
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from mlx_use.agent.message_manager.service import PREFIX_MESSAGES, SUMMARY_HEADER, MessageManager
+from mlx_use.agent.prompts import SystemPrompt
+from mlx_use.agent.views import ActionResult, AgentOutput
+from mlx_use.controller.service import Controller
+
+STATE = 'Current UI elements:\n' + '\n'.join(f'{i}[:]<AXButton title="Button {i}"> [interactive]' for i in range(40))
+
+
+class FakeSummaryLLM:
+	"""Summarizer that records its prompts and answers with a fixed summary, or fails"""
+
+	def __init__(self, fail: bool = False):
+		self.fail = fail
+		self.prompts: List[List[BaseMessage]] = []
+
+	async def ainvoke(self, messages: List[BaseMessage]) -> AIMessage:
+		self.prompts.append(messages)
+		if self.fail:
+			raise RuntimeError('summary model unavailable')
+		return AIMessage(content=f'- summary {len(self.prompts)}')
+
+
+def _manager(**kwargs) -> MessageManager:
+	controller = Controller()
+	return MessageManager(
+		llm=ChatAnthropic(model='claude-3-5-sonnet-20241022', api_key='test'),
+		task='Rename the note',
+		action_descriptions=controller.registry.get_prompt_description(),
+		system_prompt_class=SystemPrompt,
+		**kwargs,
+	)
+
+
+def _output(step: int) -> AgentOutput:
+	ActionModel = Controller().registry.create_action_model()
+	output_model = AgentOutput.type_with_custom_actions(ActionModel)
+	return output_model(
+		current_state={'evaluation_previous_goal': 'Success', 'memory': f'step {step}', 'next_goal': f'goal {step}'},
+		action=[ActionModel(click_element={'index': step, 'action': 'AXPress'})],
+	)
+
+
+async def _run_steps(manager: MessageManager, steps: int) -> None:
+	"""Steps as the agent takes them: compact, add the state, answer, drop the state"""
+	for step in range(steps):
+		result = [ActionResult(extracted_content=f'clicked {step - 1}', include_in_memory=True)] if step else None
+		await manager.compact(manager.state_messages(STATE, result))
+		manager.add_state_message(STATE, result)
+		manager._remove_last_state_message()
+		manager.add_model_output(_output(step))
+
+
+async def test_history_within_budget_is_left_alone():
+	manager = _manager(summary_llm=FakeSummaryLLM())
+	await _run_steps(manager, 3)
+
+	assert not await manager.compact()
+	assert not manager.summary_llm.prompts
+	assert all(not str(m.message.content).startswith(SUMMARY_HEADER) for m in manager.history.messages)
+
+
+async def test_old_steps_are_folded_into_a_summary():
+	prefix_tokens = _manager().history.total_tokens
+	summary_llm = FakeSummaryLLM()
+	manager = _manager(summary_llm=summary_llm, max_input_tokens=prefix_tokens + 1000, keep_recent_steps=2)
+	prefix = [m.message for m in manager.history.messages]
+	await _run_steps(manager, 20)
+	messages = manager.get_messages()
+	pending = manager.state_messages(STATE)
+
+	assert manager.history.total_tokens + sum(manager._count_tokens(m) for m in pending) <= manager.max_input_tokens
+	assert messages[:PREFIX_MESSAGES] == prefix
+	assert messages[PREFIX_MESSAGES].content == f'{SUMMARY_HEADER}- summary {len(summary_llm.prompts)}'
+	# The summarizer saw the folded steps and, after the first time, its previous summary
+	assert 'goal: goal 0' in summary_llm.prompts[0][-1].content
+	assert 'clicked 0' in summary_llm.prompts[0][-1].content
+	assert len(summary_llm.prompts) > 1 and '- summary 1' in summary_llm.prompts[1][-1].content
+	# The recent steps are kept as they were
+	tool_calls = [m.tool_calls[0]['args'] for m in messages[PREFIX_MESSAGES:] if isinstance(m, AIMessage)]
+	assert [args['current_state']['next_goal'] for args in tool_calls][-2:] == ['goal 18', 'goal 19']
+	assert sum(isinstance(m, ToolMessage) for m in messages[PREFIX_MESSAGES:]) >= 2
+
+
+async def test_summary_falls_back_to_a_plain_record():
+	prefix_tokens = _manager().history.total_tokens
+	manager = _manager(summary_llm=FakeSummaryLLM(fail=True), max_input_tokens=prefix_tokens + 1000)
+	await _run_steps(manager, 12)
+	summary = manager.get_messages()[PREFIX_MESSAGES]
+
+	assert isinstance(summary, HumanMessage)
+	assert summary.content.startswith(SUMMARY_HEADER + '- goal: goal 0 | memory: step 0 | actions: ')
+	assert '  Action result: clicked 0' in summary.content
+
+
+async def test_summary_is_trimmed_to_its_budget():
+	prefix_tokens = _manager().history.total_tokens
+	manager = _manager(max_input_tokens=prefix_tokens + 1000, max_summary_tokens=60)
+	await _run_steps(manager, 30)
+	summary = manager.get_messages()[PREFIX_MESSAGES].content[len(SUMMARY_HEADER) :]
+
+	assert manager.token_counter.count(summary) <= 60
+	# The oldest lines go first
+	assert 'goal 0 ' not in summary
+
+
+async def test_kept_state_messages_are_dropped_first():
+	prefix_tokens = _manager().history.total_tokens
+	manager = _manager(summary_llm=FakeSummaryLLM(), max_input_tokens=prefix_tokens + 1000)
+	manager.add_state_message(STATE)
+	manager.keep_last_state_message()
+	kept = manager.history.messages[-1]
+	manager.add_model_output(_output(0))
+
+	assert await manager.compact(manager.state_messages(STATE * 3))
+	assert kept not in manager.history.messages
+	assert not manager.summary_llm.prompts
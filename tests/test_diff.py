@@ -0,0 +1,75 @@
+import pytest
+
+from mlx_use.mac.diff import TreeSnapshot, diff_snapshots, diff_trees
+from mlx_use.mac.observer import kAXCreatedNotification, kAXTitleChangedNotification
+from mlx_use.mac.recorded import InMemoryBackend, RecordedElement, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+
+
+@pytest.fixture
+def backend() -> InMemoryBackend:
+	return InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=200, seed=4))
+
+
+@pytest.fixture
+async def builder(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend, incremental=True)
+	yield builder
+	await builder.close()
+
+
+def _button(builder: MacUITreeBuilder) -> RecordedElement:
+	return next(
+		node._element for node in builder._element_cache.values() if node.role == 'AXButton' and 'title' in node.attributes
+	)
+
+
+async def test_unchanged_tree_has_no_diff(builder: MacUITreeBuilder):
+	old = TreeSnapshot.from_tree(await builder.build_tree(PID))
+	new = TreeSnapshot.from_tree(await builder.build_tree(PID))
+	diff = diff_snapshots(old, new)
+
+	assert not diff
+	assert diff.unchanged_interactive == new.interactive_count
+	assert diff.unchanged_context == new.context_count
+	assert diff.to_string().startswith('No changes.\nUnchanged: ')
+
+
+async def test_changed_added_and_removed_lines(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	old = TreeSnapshot.from_tree(await builder.build_tree(PID))
+	button = _button(builder)
+	button.attributes['AXTitle'] = 'Renamed'
+	backend.post_notification(button, kAXTitleChangedNotification)
+	window = backend.applications[PID].children[0]
+	field = RecordedElement(
+		id=f'{PID}:field', attributes={'AXRole': 'AXTextField', 'AXValue': 'typed'}, actions=['AXSetValue'], parent=window
+	)
+	window.children.append(field)
+	backend.post_notification(field, kAXCreatedNotification)
+	removed = next(
+		node for node in builder._element_cache.values() if node.role == 'AXCheckBox' and node._element is not button
+	)
+	backend.remove_element(removed._element)
+
+	# The snapshot is a copy: patching the tree in place doesn't change it
+	sent = dict(old.lines)
+	new = TreeSnapshot.from_tree(await builder.build_tree(PID))
+	assert old.lines == sent
+	diff = diff_snapshots(old, new)
+
+	assert [new_line for _, new_line in diff.changed] == [line for line in new.lines.values() if 'Renamed' in line]
+	assert len(diff.added) == 1 and 'typed' in diff.added[0]
+	assert diff.removed == [removed.get_prompt_line()]
+	assert diff.unchanged_interactive == old.interactive_count - 2
+	lines = diff.to_string().splitlines()
+	assert [line[0] for line in lines[:-1]] == ['+', '-', '~']
+
+
+async def test_diff_against_no_tree_adds_everything(builder: MacUITreeBuilder):
+	root = await builder.build_tree(PID)
+	diff = diff_trees(None, root)
+
+	assert diff.added == [node.get_prompt_line() for node in root.iter_prompt_elements()]
+	assert not diff.removed and not diff.changed
@@ -0,0 +1,52 @@
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.encoding import MAX_VALUE_LENGTH, ROLE_ABBREVIATIONS, abbreviate_role, compact_legend, compact_line
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+
+def _node(role: str, index=None, **attributes) -> MacElementNode:
+	return MacElementNode(role, role, attributes, True, 1, is_interactive=index is not None, highlight_index=index)
+
+
+def test_abbreviate_role():
+	assert abbreviate_role('AXButton') == 'btn'
+	assert abbreviate_role('AXLevelIndicator') == 'LevelIndicator'
+	assert abbreviate_role('custom') == 'custom'
+
+
+def test_default_actions_and_enabled_are_left_out():
+	assert compact_line(_node('AXButton', 12, title='Save', enabled=True, actions=['AXPress'])) == '12:btn "Save"'
+	button = _node('AXButton', 3, title='Menu', enabled=False, actions=['AXPress', 'AXShowMenu'])
+	assert compact_line(button) == '3:btn "Menu" off a=Press,ShowMenu'
+
+
+def test_values_are_quoted_and_cut():
+	field = _node('AXTextField', 7, value='say "hi"\nthere', description='x' * 200, actions=['AXSetValue', 'AXConfirm'])
+	line = compact_line(field)
+
+	assert line.startswith('7:field v="say \'hi\' there" d="')
+	assert line.endswith('…"')
+	assert len(line.split('d=', 1)[1]) == MAX_VALUE_LENGTH + 2
+
+
+def test_context_elements():
+	assert compact_line(_node('AXStaticText', value='20')) == '_:text v="20" ctx'
+
+
+def test_legend_lists_every_abbreviation():
+	legend = compact_legend()
+
+	assert all(f'{short}={role}' in legend for role, short in ROLE_ABBREVIATIONS.items())
+
+
+async def test_compact_state_is_smaller():
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=1000, n_nodes=300, seed=6, table_rows=40))
+	builder = MacUITreeBuilder(backend=backend)
+	root = await builder.build_tree(1000)
+	await builder.close()
+	verbose = root.get_clickable_elements_string('verbose').splitlines()
+	compact = root.get_clickable_elements_string('compact').splitlines()
+
+	assert len(compact) == len(verbose)
+	assert [line.split(':', 1)[0] for line in compact] == [line.split('[', 1)[0] for line in verbose]
+	assert len('\n'.join(compact)) < len('\n'.join(verbose)) / 2
@@ -0,0 +1,75 @@
+from typing import List, Optional
+
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.identity import ElementIdentityMap
+
+
+def _node(role: str, parent: Optional[MacElementNode] = None, element: object = None, **attributes) -> MacElementNode:
+	node = MacElementNode(role, f'{role}_{id(element)}', attributes, True, 1, parent=parent, is_interactive=True)
+	node._element = element if element is not None else object()
+	if parent is not None:
+		parent.children.append(node)
+	return node
+
+
+def _window(*titles: str, group: str = 'Main') -> List[MacElementNode]:
+	"""Buttons with these titles in a group of a window; fresh AX references every call"""
+	window = _node('AXWindow', title='Notes')
+	parent = _node('AXGroup', window, description=group)
+	nodes = [_node('AXButton', parent, title=title) for title in titles]
+	# Cache the paths while the window is alive; parent links are weak
+	for node in nodes:
+		node.accessibility_path
+	return nodes
+
+
+def _indices(assigned: dict) -> dict:
+	return {node.attributes['title']: index for index, node in assigned.items()}
+
+
+def test_same_elements_keep_their_indices():
+	identities = ElementIdentityMap()
+	nodes = _window('Open', 'Save', 'Close')
+	first = identities.assign(nodes)
+
+	assert _indices(first) == {'Open': 0, 'Save': 1, 'Close': 2}
+	# Reversed document order, same AX references
+	assert _indices(identities.assign(list(reversed(nodes)))) == {'Open': 0, 'Save': 1, 'Close': 2}
+
+
+def test_matches_by_path_when_references_change():
+	identities = ElementIdentityMap()
+	# Duplicate titles, so only the paths tell the buttons apart
+	identities.assign(_window('OK', 'OK'))
+
+	assert sorted(identities.assign(_window('OK', 'OK'))) == [0, 1]
+
+
+def test_matches_by_unique_signature_when_path_changes():
+	identities = ElementIdentityMap()
+	identities.assign(_window('Open', 'Save'))
+
+	# Moved to another group: new references and paths, but role and title still unique
+	assert _indices(identities.assign(_window('Save', 'Open', group='Toolbar'))) == {'Open': 0, 'Save': 1}
+
+
+def test_ambiguous_signatures_get_fresh_indices():
+	identities = ElementIdentityMap()
+	identities.assign(_window('OK', 'OK'))
+
+	assigned = identities.assign(_window('OK', 'OK', group='Sheet'))
+	assert sorted(assigned) == [2, 3]
+
+
+def test_vanished_indices_are_not_reused():
+	identities = ElementIdentityMap()
+	open_, save, close = _window('Open', 'Save', 'Close')
+	identities.assign([open_, save, close])
+	identities.assign([open_, close])
+
+	new = _window('Print')[0]
+	assert _indices(identities.assign([open_, new, close])) == {'Open': 0, 'Print': 3, 'Close': 2}
+	assert identities.next_index == 4
+
+	identities.reset()
+	assert _indices(identities.assign([open_])) == {'Open': 0}
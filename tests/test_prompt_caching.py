@@ -0,0 +1,84 @@
+import re
+from typing import List, Optional
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_openai import ChatOpenAI
+
+from mlx_use.agent.message_manager import tokens
+from mlx_use.agent.message_manager.service import PREFIX_MESSAGES, MessageManager
+from mlx_use.agent.prompts import SystemPrompt
+from mlx_use.agent.views import AgentOutput
+from mlx_use.controller.service import Controller
+
+STATE = '0[:]<AXButton title="Save"> [interactive]'
+
+
+def _manager(llm: Optional[BaseChatModel] = None, prompt_caching: bool = True) -> MessageManager:
+	return MessageManager(
+		llm=llm or ChatAnthropic(model='claude-3-5-sonnet-20241022', api_key='test'),
+		task='Rename the note',
+		action_descriptions=Controller().registry.get_prompt_description(),
+		system_prompt_class=SystemPrompt,
+		prompt_caching=prompt_caching,
+	)
+
+
+def _step(manager: MessageManager, step: int) -> List[BaseMessage]:
+	"""Messages of one step's request; the state is removed and the answer added afterwards"""
+	ActionModel = Controller().registry.create_action_model()
+	output = AgentOutput.type_with_custom_actions(ActionModel)(
+		current_state={'evaluation_previous_goal': '', 'memory': '', 'next_goal': f'goal {step}'},
+		action=[ActionModel(click_element={'index': 0, 'action': 'AXPress'})],
+	)
+	manager.add_state_message(STATE)
+	messages = manager.get_messages()
+	manager._remove_last_state_message()
+	manager.add_model_output(output)
+	return messages
+
+
+def _breakpoints(messages: List[BaseMessage]) -> List[int]:
+	return [
+		i
+		for i, message in enumerate(messages)
+		if isinstance(message.content, list) and any('cache_control' in block for block in message.content)
+	]
+
+
+def test_breakpoints_on_prefix_and_last_tool_message():
+	manager = _manager()
+	_step(manager, 0)
+	messages = _step(manager, 1)
+	last_tool = max(i for i, message in enumerate(messages) if isinstance(message, ToolMessage))
+
+	assert _breakpoints(messages) == [0, PREFIX_MESSAGES - 1, last_tool]
+	assert messages[last_tool].content[0]['type'] == 'tool_result'
+	assert messages[0].content[0]['text'] == manager.system_prompt.content
+	# History itself is left as it was
+	assert not _breakpoints([m.message for m in manager.history.messages])
+
+
+def test_prefix_is_the_same_every_step():
+	manager = _manager()
+	first = _step(manager, 0)[:PREFIX_MESSAGES]
+
+	assert _step(manager, 1)[:PREFIX_MESSAGES] == first
+	assert _manager().get_messages()[:PREFIX_MESSAGES] == first
+
+
+def test_time_of_day_moves_to_the_state_message():
+	cached = _manager().get_messages()[0].content[0]['text']
+	uncached = _manager(prompt_caching=False).get_messages()[0].content
+
+	assert re.search(r'Current date: \d{4}-\d{2}-\d{2}\n', cached)
+	assert re.search(r'Current date and time: \d{4}-\d{2}-\d{2} \d{2}:\d{2}\n', uncached)
+	assert 'Current time: ' in str(_step(_manager(), 0)[-1].content)
+
+
+def test_no_breakpoints_unless_enabled_for_anthropic(monkeypatch):
+	monkeypatch.setattr(tokens, '_openai_encoding', lambda model: None)
+
+	assert not _breakpoints(_step(_manager(prompt_caching=False), 0))
+	assert not _breakpoints(_step(_manager(ChatOpenAI(model='gpt-4o', api_key='test')), 0))
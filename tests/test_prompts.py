@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+from langchain_anthropic import ChatAnthropic
+
+from mlx_use.agent.prompts import SystemPrompt
+from mlx_use.agent.service import Agent
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+RULES = {
+	'window_headers': ['Window headers:', 'modal dialog or sheet'],
+	'table_windows': ['Large tables and lists', 'to see other rows'],
+	'truncated_states': ['more elements omitted'],
+}
+
+
+def _prompt(**kwargs) -> str:
+	return SystemPrompt('actions', current_date=datetime(2026, 1, 1), **kwargs).get_system_message().content
+
+
+@pytest.mark.parametrize('encoding', ['verbose', 'compact'])
+def test_optional_rules_follow_their_feature(encoding: str):
+	default = _prompt(prompt_encoding=encoding)
+	assert not any(text in default for texts in RULES.values() for text in texts)
+
+	for feature, texts in RULES.items():
+		prompt = _prompt(prompt_encoding=encoding, **{feature: True})
+		assert all(text in prompt for text in texts)
+		assert not any(text in prompt for other, others in RULES.items() if other != feature for text in others)
+
+
+def test_agent_passes_its_state_options(monkeypatch):
+	monkeypatch.setenv('ANONYMIZED_TELEMETRY', 'false')
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=1000, n_nodes=50, seed=2))
+	llm = ChatAnthropic(model='claude-3-5-sonnet-20241022', api_key='test')
+
+	plain = Agent(task='Save the note', llm=llm, mac_tree_builder=MacUITreeBuilder(backend=backend))
+	full = Agent(
+		task='Save the note',
+		llm=llm,
+		mac_tree_builder=MacUITreeBuilder(backend=backend, windows='all', table_rows=50),
+		max_state_tokens=4000,
+	)
+
+	assert not any(text in plain.message_manager.system_prompt.content for texts in RULES.values() for text in texts)
+	assert all(text in full.message_manager.system_prompt.content for texts in RULES.values() for text in texts)
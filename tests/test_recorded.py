@@ -0,0 +1,54 @@
+from mlx_use.mac.backend import kAXErrorInvalidUIElement, kAXErrorSuccess, kAXRoleAttribute
+from mlx_use.mac.recorded import InMemoryBackend, record_application, save_recording, synthetic_application
+
+PID = 1000
+
+
+def _count(element) -> int:
+	return 1 + sum(_count(child) for child in element.children)
+
+
+def test_synthetic_application_size():
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=200, seed=3))
+
+	assert _count(backend.applications[PID]) == 200
+	assert backend.application_element(PID).attributes[kAXRoleAttribute] == 'AXApplication'
+
+
+def test_recording_round_trip(tmp_path):
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=150, seed=2, dialog=True, menu_bar=True))
+	recording = record_application(PID, 'Synthetic', backend=backend)
+	path = tmp_path / 'recording.json'
+	save_recording(recording, path)
+
+	replayed = InMemoryBackend.from_file(path)
+	assert record_application(PID, 'Synthetic', backend=replayed) == recording
+	assert _count(replayed.applications[PID]) == _count(backend.applications[PID])
+
+
+def test_calls_are_counted():
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=20))
+	app = backend.application_element(PID)
+	backend.copy_attribute_value(app, kAXRoleAttribute)
+	backend.copy_multiple_attribute_values(app, [kAXRoleAttribute])
+
+	assert backend.total_calls == 3
+	backend.reset_stats()
+	assert backend.total_calls == 0
+
+
+def test_removed_element_no_longer_answers():
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=50, seed=1))
+	window = backend.applications[PID].children[0]
+	group = next(child for child in window.children if child.children)
+	leaf = group.children[0]
+
+	backend.remove_element(group)
+
+	assert group not in window.children
+	for element in (group, leaf):
+		assert backend.copy_attribute_value(element, kAXRoleAttribute) == (kAXErrorInvalidUIElement, None)
+		assert backend.copy_multiple_attribute_values(element, [kAXRoleAttribute])[0] == kAXErrorInvalidUIElement
+		assert backend.perform_action(element, 'AXPress') == kAXErrorInvalidUIElement
+	assert backend.copy_attribute_value(window, kAXRoleAttribute)[0] == kAXErrorSuccess
+	assert backend.performed == []
@@ -0,0 +1,91 @@
+import pytest
+
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.serializer import OMITTED_MARKER, StateSerializer, estimate_tokens
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+
+
+async def _build(**kwargs) -> MacElementNode:
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=400, seed=5, dialog=True, menu_bar=True))
+	builder = MacUITreeBuilder(backend=backend, **kwargs)
+	root = await builder.build_tree(PID)
+	await builder.close()
+	return root
+
+
+@pytest.fixture
+async def root() -> MacElementNode:
+	return await _build()
+
+
+def _deepest(root: MacElementNode) -> MacElementNode:
+	"""Last interactive element with the most ancestors"""
+
+	def depth(node: MacElementNode) -> int:
+		return 0 if node.parent is None else 1 + depth(node.parent)
+
+	return max((node for node in root.iter_prompt_elements() if node.highlight_index is not None), key=depth)
+
+
+@pytest.mark.parametrize('encoding', ['verbose', 'compact'])
+async def test_unbudgeted_matches_element_string(root: MacElementNode, encoding: str):
+	serializer = StateSerializer(encoding=encoding)
+
+	assert serializer.serialize(root) == root.get_clickable_elements_string(encoding)
+	assert serializer.omitted == 0
+	assert serializer.nodes == list(root.iter_prompt_elements())
+
+
+async def test_budget_is_respected(root: MacElementNode):
+	full = StateSerializer().serialize(root)
+	max_tokens = estimate_tokens(full) // 4
+	serializer = StateSerializer(max_tokens=max_tokens)
+	lines = serializer.serialize(root).splitlines()
+
+	assert serializer.tokens <= max_tokens
+	assert serializer.omitted == len(full.splitlines()) - len(serializer.nodes)
+	assert lines[-1] == OMITTED_MARKER.format(omitted=serializer.omitted, max_tokens=max_tokens)
+	# Kept lines stay in document order
+	full_lines = full.splitlines()
+	positions = [full_lines.index(line) for line in lines[:-1]]
+	assert positions == sorted(positions)
+
+
+async def test_focus_and_its_neighbourhood_are_kept(root: MacElementNode):
+	focus = _deepest(root)
+	unfocused = StateSerializer(max_tokens=200)
+	unfocused.serialize(root)
+	assert focus not in unfocused.nodes
+
+	serializer = StateSerializer(max_tokens=200)
+	serializer.serialize(root, focus=focus)
+	assert focus in serializer.nodes
+	siblings = [node for node in focus.parent.children if node.get_prompt_line() is not None]
+	assert all(node in serializer.nodes for node in siblings)
+
+
+async def test_window_headers_are_always_kept():
+	root = await _build(windows='all')
+	serializer = StateSerializer(max_tokens=150)
+	serializer.serialize(root, focus=_deepest(root))
+	headers = [node for node in root.iter_prompt_elements() if 'window_label' in node.attributes]
+
+	assert headers and all(header in serializer.nodes for header in headers)
+
+
+async def test_small_budget_formats_few_lines(root: MacElementNode):
+	counted = []
+
+	def count_tokens(text: str) -> int:
+		counted.append(text)
+		return estimate_tokens(text)
+
+	serializer = StateSerializer(max_tokens=100, count_tokens=count_tokens)
+	serializer.serialize(root)
+
+	assert serializer.omitted > 10 * len(serializer.nodes)
+	# The kept lines, a few that didn't fit and the marker (sized up front and once emitted)
+	assert len(counted) <= len(serializer.nodes) + 10
@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from mlx_use.mac.observer import kAXTitleChangedNotification
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.settle import UISettleDetector, poll_until, ui_fingerprint
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+
+
+@pytest.fixture
+def backend() -> InMemoryBackend:
+	return InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=100, seed=8))
+
+
+@contextlib.asynccontextmanager
+async def _animating(backend: InMemoryBackend, notify: bool = False, interval: float = 0.01):
+	"""Keep retitling the window until the block exits"""
+	window = backend.applications[PID].children[0]
+
+	async def animate() -> None:
+		frame = 0
+		while True:
+			frame += 1
+			window.attributes['AXTitle'] = f'Loading {frame}'
+			if notify:
+				backend.post_notification(window, kAXTitleChangedNotification)
+			await asyncio.sleep(interval)
+
+	task = asyncio.create_task(animate())
+	try:
+		yield
+	finally:
+		task.cancel()
+
+
+def test_fingerprint_follows_the_focused_window(backend: InMemoryBackend):
+	before = ui_fingerprint(backend, PID)
+	assert ui_fingerprint(backend, PID) == before
+
+	backend.applications[PID].children[0].attributes['AXTitle'] = 'Changed'
+	assert ui_fingerprint(backend, PID) != before
+	# An app that doesn't answer never looks settled
+	assert ui_fingerprint(backend, PID + 1) != ui_fingerprint(backend, PID + 1)
+
+
+async def test_quiet_ui_settles_after_the_quiet_period(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	result = await UISettleDetector(builder, quiet_period=0.05, max_wait=1).wait(PID)
+	await builder.close()
+
+	assert result.settled and result.method == 'fingerprint'
+	assert 0.05 <= result.seconds < 0.5
+	assert result.polls >= 2
+
+
+async def test_changing_ui_waits_until_max_wait(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	async with _animating(backend):
+		result = await UISettleDetector(builder, quiet_period=0.05, max_wait=0.3, max_interval=0.02).wait(PID)
+	await builder.close()
+
+	assert not result.settled
+	assert result.seconds >= 0.3
+
+
+async def test_incremental_builder_counts_notifications(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend, incremental=True)
+	await builder.build_tree(PID)
+	detector = UISettleDetector(builder, quiet_period=0.05, max_wait=0.3, max_interval=0.02)
+
+	async with _animating(backend, notify=True):
+		busy = await detector.wait(PID)
+	backend.reset_stats()
+	quiet = await detector.wait(PID)
+	await builder.close()
+
+	assert busy.method == quiet.method == 'notifications'
+	assert not busy.settled and quiet.settled
+	# Counting notifications doesn't read the UI
+	assert backend.total_calls == 0
+
+
+async def test_nothing_to_wait_for(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	assert (await UISettleDetector(builder).wait(None)).method == 'none'
+	assert (await UISettleDetector(builder, max_wait=0).wait(PID)).method == 'none'
+	await builder.close()
+
+
+async def test_poll_until():
+	calls = []
+
+	async def probe():
+		calls.append(1)
+		return 'ready' if len(calls) == 3 else None
+
+	async def never():
+		return None
+
+	assert await poll_until(probe, max_wait=1, initial_interval=0.001) == 'ready'
+	assert await poll_until(never, max_wait=0.02, initial_interval=0.001) is None
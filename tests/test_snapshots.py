@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from mlx_use.agent.views import ActionResult, AgentHistory, AgentHistoryList, AgentOutput
+from mlx_use.controller.service import Controller
+from mlx_use.mac.diff import TreeSnapshot, diff_snapshots
+from mlx_use.mac.element import MacElementNode
+from mlx_use.mac.observer import kAXTitleChangedNotification
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.snapshots import SnapshotStore
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+TAIL = '\n... 3 more elements omitted'
+
+
+@pytest.fixture
+def backend() -> InMemoryBackend:
+	return InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=300, seed=7))
+
+
+@pytest.fixture
+async def builder(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	yield builder
+	await builder.close()
+
+
+async def _retitled(builder: MacUITreeBuilder, backend: InMemoryBackend) -> MacElementNode:
+	"""Rebuild after renaming the last titled button"""
+	node = [node for node in builder._element_cache.values() if node.role == 'AXButton' and 'title' in node.attributes][-1]
+	node._element.attributes['AXTitle'] = 'Renamed'
+	backend.post_notification(node._element, kAXTitleChangedNotification)
+	return await builder.build_tree(PID)
+
+
+async def test_states_round_trip(builder: MacUITreeBuilder):
+	root = await builder.build_tree(PID)
+	state = root.get_clickable_elements_string() + TAIL
+	store = SnapshotStore()
+	snapshot_id = store.add(state, root)
+
+	assert store.get(snapshot_id) == state
+	assert store.add('plain text') in store
+	assert store.get(store.add('plain text')) == 'plain text'
+	assert len(store) == 2
+
+
+async def test_identical_subtrees_are_stored_once(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	root = await builder.build_tree(PID)
+	store = SnapshotStore()
+	first = store.add(root.get_clickable_elements_string(), root)
+	entries = len(store.entries)
+
+	assert store.add(root.get_clickable_elements_string(), root) == first
+	assert len(store.entries) == entries
+
+	root = await _retitled(builder, backend)
+	second = store.add(root.get_clickable_elements_string(), root)
+	assert second != first
+	# Only the renamed element and its ancestors are new
+	assert len(store.entries) - entries < 10
+
+
+async def test_diff_matches_tree_diff(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	store = SnapshotStore()
+	root = await builder.build_tree(PID)
+	old_snapshot = TreeSnapshot.from_tree(root)
+	old_id = store.add(root.get_clickable_elements_string(), root)
+	root = await _retitled(builder, backend)
+	new_id = store.add(root.get_clickable_elements_string(), root)
+
+	diff = store.diff(old_id, new_id)
+	expected = diff_snapshots(old_snapshot, TreeSnapshot.from_tree(root))
+	assert diff.changed == expected.changed and len(diff.changed) == 1
+	assert not diff.added and not diff.removed
+	assert diff.unchanged_interactive == expected.unchanged_interactive
+	assert diff.unchanged_context == expected.unchanged_context
+
+
+async def test_store_survives_json(builder: MacUITreeBuilder):
+	root = await builder.build_tree(PID)
+	store = SnapshotStore()
+	snapshot_id = store.add(root.get_clickable_elements_string() + TAIL, root)
+	loaded = SnapshotStore.from_dict(json.loads(json.dumps(store.to_dict())))
+
+	assert loaded.get(snapshot_id) == store.get(snapshot_id)
+	assert loaded.entries == store.entries
+
+
+@pytest.mark.parametrize('compact', [False, True])
+async def test_history_states_load_back(builder: MacUITreeBuilder, backend: InMemoryBackend, tmp_path, compact: bool):
+	store = SnapshotStore()
+	states, ids = [], []
+	for root in (await builder.build_tree(PID), await _retitled(builder, backend)):
+		states.append(root.get_clickable_elements_string())
+		ids.append(store.add(states[-1], root))
+	history = AgentHistoryList(
+		history=[AgentHistory(model_output=None, result=[ActionResult()], state_id=state_id) for state_id in ids]
+		# Items from before the store only carry their text
+		+ [AgentHistory(model_output=None, result=[ActionResult()], state='legacy state')],
+		snapshots=store,
+	)
+	assert [item.state for item in history.history] == states + ['legacy state']
+
+	path = tmp_path / 'history.json'
+	history.save_to_file(path, compact=compact)
+	saved = json.loads(path.read_text())
+	assert ('snapshots' in saved) == compact
+	assert all(('state' in item) != compact for item in saved['history'][:2])
+
+	output_model = AgentOutput.type_with_custom_actions(Controller().registry.create_action_model())
+	loaded = AgentHistoryList.load_from_file(path, output_model)
+	assert [item.state for item in loaded.history] == states + ['legacy state']
+	if compact:
+		assert len(loaded.diff_states(0, 1).changed) == 1
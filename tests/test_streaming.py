@@ -0,0 +1,194 @@
+import asyncio
+import json
+import random
+from typing import Any, AsyncIterator, List, Optional
+
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+
+from mlx_use.agent.message_manager import tokens
+from mlx_use.agent.service import Agent
+from mlx_use.agent.structured_output import JsonArrayStream, StructuredOutput
+from mlx_use.agent.views import ActionResult, AgentOutput
+from mlx_use.controller.service import Controller
+from mlx_use.mac.recorded import InMemoryBackend, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+
+OUTPUT = {
+	'current_state': {
+		'evaluation_previous_goal': 'Success - "quoted" text with } ] { and \\ inside',
+		'memory': 'the "action": [{"fake": 1}] in a string is not an item',
+		'next_goal': 'Save the note',
+	},
+	'action': [
+		{'input_text': {'index': 2, 'text': 'brackets [}{ and "quotes" \\"', 'submit': False}},
+		{'click_element': {'index': 1, 'action': 'AXPress'}},
+		{'done': {'text': 'Saved ✓'}},
+	],
+	'extra': [{'action': [{'nested': True}]}],
+}
+
+
+def _feed(stream: JsonArrayStream, pieces: List[str]) -> List[Any]:
+	items = []
+	for piece in pieces:
+		items.extend(stream.feed(piece))
+	return items
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 10_000])
+def test_items_under_fixed_chunking(size: int):
+	text = json.dumps(OUTPUT, ensure_ascii=False)
+	stream = JsonArrayStream('action')
+
+	assert _feed(stream, [text[i : i + size] for i in range(0, len(text), size)]) == OUTPUT['action']
+	assert json.loads(stream.text) == OUTPUT
+
+
+def test_items_under_random_chunking():
+	rng = random.Random(0)
+	text = json.dumps(OUTPUT, indent=rng.choice([None, 2]))
+	for _ in range(200):
+		cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 40)))
+		pieces = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+		assert _feed(JsonArrayStream('action'), pieces) == OUTPUT['action']
+
+
+def test_items_are_returned_as_soon_as_they_close():
+	text = json.dumps(OUTPUT)
+	first_end = text.index('"submit": false}}') + len('"submit": false}}')
+	stream = JsonArrayStream('action')
+
+	assert stream.feed(text[: first_end - 1]) == []
+	assert stream.feed(text[first_end - 1 : first_end]) == [OUTPUT['action'][0]]
+
+
+def test_other_keys_and_nested_arrays_are_ignored():
+	assert _feed(JsonArrayStream('missing'), [json.dumps(OUTPUT)]) == []
+	assert _feed(JsonArrayStream('action'), ['{"action": [[1, 2], {"a": [3]}], "b": {"action": [{"c": 4}]}}']) == [
+		[1, 2],
+		{'a': [3]},
+	]
+
+
+def _output_model() -> type:
+	return AgentOutput.type_with_custom_actions(Controller().registry.create_action_model())
+
+
+def _fake_stream(monkeypatch, arguments: str, piece: int = 9, delay: float = 0.0) -> List[str]:
+	"""Make ChatOpenAI stream a tool call with these arguments; returns a log of chunks sent and the end"""
+	log: List[str] = []
+
+	async def astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+		for i in range(0, len(arguments), piece):
+			await asyncio.sleep(delay)
+			name, call_id = ('AgentOutput', 'call_1') if i == 0 else (None, None)
+			chunk = {'name': name, 'args': arguments[i : i + piece], 'id': call_id, 'index': 0}
+			log.append('chunk')
+			yield ChatGenerationChunk(message=AIMessageChunk(content='', tool_call_chunks=[chunk]))
+		log.append('end')
+
+	monkeypatch.setattr(ChatOpenAI, '_astream', astream)
+	return log
+
+
+async def test_structured_output_streams_items(monkeypatch):
+	log = _fake_stream(monkeypatch, json.dumps(OUTPUT))
+	structured = StructuredOutput(ChatOpenAI(model='gpt-4o', api_key='test'), _output_model(), 'function_calling')
+	items = []
+
+	def on_item(item: Any) -> None:
+		items.append((item, len(log), 'end' in log))
+
+	assert structured.can_stream
+	parsed, _ = await structured.astream([HumanMessage(content='Save the note')], on_item)
+
+	assert [item for item, _, _ in items] == OUTPUT['action']
+	assert not any(ended for _, _, ended in items)
+	# Each item arrives with the chunk that closes it, not at the end
+	assert items[0][1] < items[1][1] < items[2][1] < len(log) - 1
+	assert [action.model_dump(exclude_unset=True) for action in parsed.action] == OUTPUT['action']
+
+
+async def test_empty_tool_call_is_an_error(monkeypatch):
+	_fake_stream(monkeypatch, '')
+	structured = StructuredOutput(ChatOpenAI(model='gpt-4o', api_key='test'), _output_model(), 'function_calling')
+
+	with pytest.raises(ValueError):
+		await structured.astream([HumanMessage(content='Save the note')], lambda item: None)
+	assert not StructuredOutput(ChatOpenAI(model='gpt-4o', api_key='test'), _output_model(), 'json_mode').can_stream
+
+
+@pytest.fixture
+async def builder():
+	backend = InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=200, seed=9))
+	builder = MacUITreeBuilder(backend=backend)
+	await builder.build_tree(PID)
+	yield builder
+	await builder.close()
+
+
+def _clicks(builder: MacUITreeBuilder, n: int) -> List[dict]:
+	nodes = [builder._element_cache[index] for index in sorted(i for i in builder._element_cache if isinstance(i, int))]
+	buttons = [node for node in nodes if node.role == 'AXButton' and node.enabled and 'AXPress' in node.actions]
+	return [{'click_element': {'index': node.highlight_index, 'action': 'AXPress'}} for node in buttons[:n]]
+
+
+async def test_streamed_actions_stop_when_target_is_gone(builder: MacUITreeBuilder):
+	controller = Controller()
+	ActionModel = controller.registry.create_action_model()
+	queue: asyncio.Queue[Optional[Any]] = asyncio.Queue()
+
+	async def streamed() -> AsyncIterator[Any]:
+		while (action := await queue.get()) is not None:
+			yield action
+
+	first, second, third = _clicks(builder, 3)
+	running = asyncio.create_task(controller.multi_act_stream(streamed(), builder))
+	queue.put_nowait(ActionModel.model_validate(first))
+	await asyncio.sleep(0.01)
+	assert len(builder.backend.performed) == 1
+
+	builder.backend.remove_element(builder._element_cache[second['click_element']['index']]._element)
+	queue.put_nowait(ActionModel.model_validate(second))
+	queue.put_nowait(ActionModel.model_validate(third))
+	queue.put_nowait(None)
+
+	assert len(await running) == 1
+	assert len(builder.backend.performed) == 1
+
+
+async def test_agent_step_runs_actions_while_streaming(monkeypatch, builder: MacUITreeBuilder):
+	monkeypatch.setenv('ANONYMIZED_TELEMETRY', 'false')
+	# Count tokens by estimate rather than downloading the tokenizer
+	monkeypatch.setattr(tokens, '_openai_encoding', lambda model: None)
+	actions = _clicks(builder, 2) + [{'done': {'text': 'Saved'}}]
+	arguments = json.dumps({'current_state': OUTPUT['current_state'], 'action': actions})
+	log = _fake_stream(monkeypatch, arguments, delay=0.005)
+	performed_at = []
+	original = builder.backend.perform_action
+
+	def perform_action(element: Any, action: str) -> int:
+		performed_at.append('end' in log)
+		return original(element, action)
+
+	monkeypatch.setattr(builder.backend, 'perform_action', perform_action)
+	agent = Agent(
+		task='Save the note',
+		llm=ChatOpenAI(model='gpt-4o', api_key='test'),
+		mac_tree_builder=builder,
+		stream_actions=True,
+		max_settle_wait=0,
+	)
+	agent._last_result = [ActionResult(current_app_pid=PID)]
+	await agent.step()
+	await agent._drain()
+	item = agent.history.history[-1]
+
+	assert performed_at == [False, False]
+	assert [action.model_dump(exclude_unset=True) for action in item.model_output.action] == actions
+	assert [result.is_done for result in item.result] == [False, False, True]
@@ -0,0 +1,118 @@
+import json
+import statistics
+from pathlib import Path
+
+import pytest
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import AIMessage, HumanMessage
+
+from mlx_use.agent.message_manager import tokens
+from mlx_use.agent.message_manager.tokens import ESTIMATOR_RATIOS, TokenCounter, model_family
+
+DATA = Path(__file__).parent / 'data'
+
+# Bounds on the estimate's relative error over the calibration corpus: any one message (100+ tokens),
+# and the mean over messages and over single element lines
+MAX_RELATIVE_ERROR = 0.35
+MAX_MEAN_RELATIVE_ERROR = 0.15
+
+
+class _WordEncoding:
+	"""Stand-in for a tiktoken encoding: one token per space-separated word"""
+
+	def encode(self, text: str, disallowed_special=()) -> list:
+		return text.split(' ')
+
+
+def test_model_family():
+	llm = ChatAnthropic(model='claude-3-5-sonnet-20241022', api_key='test')
+	counter = TokenCounter.for_llm(llm)
+
+	assert model_family(llm) == 'anthropic'
+	assert (counter.family, counter.model) == ('anthropic', 'claude-3-5-sonnet-20241022')
+	assert not counter.exact
+
+
+# Claude token counts (tokenizer of the anthropic SDK before 0.39) of a task, a verbose and a compact state
+# excerpt, and a tool call
+KNOWN_ANTHROPIC_COUNTS = [
+	('In Notes, create a new note titled "Groceries" with the items milk, eggs and bread, one per line.', 26),
+	(
+		'=== Dialog "Save changes?" (focused, modal) ===\n'
+		'0[:]<AXWindow title="Save changes?" actions="AXRaise"> [interactive]\n'
+		'_[:]<AXStaticText value="Do you want to save the changes you made?"> [context]\n'
+		'1[:]<AXButton title="Don\'t Save" enabled="True" actions="AXPress"> [interactive]\n'
+		'3[:]<AXButton title="Save" enabled="True" actions="AXPress"> [interactive]',
+		101,
+	),
+	(
+		'5:table d="messages" cols="From | Subject | Date" rows=1-20/40\n'
+		'6:row v="sender 0 | subject 0 | 2024-01-01" row=1 sel\n'
+		'7:row v="sender 1 | subject 1 | 2024-01-02" row=2\n'
+		'12:btn "Save"',
+		74,
+	),
+	(
+		'AgentOutput{"current_state":{"evaluation_previous_goal":"Success","memory":"","next_goal":""},'
+		'"action":[{"click_element":{"index":5,"action":"AXPress"}}]}',
+		40,
+	),
+]
+
+
+def test_estimates_are_near_known_counts():
+	counter = TokenCounter('anthropic')
+	errors = [abs(counter.count(text) - known) / known for text, known in KNOWN_ANTHROPIC_COUNTS]
+
+	# Compact lines are the worst case: their short abbreviations and numbers are underestimated
+	assert max(errors) <= 0.35
+	assert sum(counter.count(text) for text, _ in KNOWN_ANTHROPIC_COUNTS) == pytest.approx(241, rel=0.1)
+	assert TokenCounter('unknown', chars_per_token=4).count('abcdefghi') == 3
+	assert counter.count('') == 0
+
+
+def test_ratios_are_fitted_to_the_corpus():
+	"""The ratios are the ones fitted to the recorded counts, and keep within the error recorded with them"""
+	with open(DATA / 'token_corpus.json') as f:
+		corpus = json.load(f)
+	with open(DATA / 'token_calibration.json') as f:
+		calibration = json.load(f)
+	assert calibration, 'no family has been calibrated'
+
+	for family, fitted in calibration.items():
+		assert ESTIMATOR_RATIOS[family] == tuple(fitted['ratios'])
+		counter = TokenCounter(family)
+		counts = [(sample['text'], fitted['counts'][sample['id']]) for sample in corpus]
+		documents = [abs(counter.estimate(text) - n) / n for text, n in counts if n >= 100]
+		lines = [abs(counter.estimate(text) - n) / n for text, n in counts if n < 100]
+
+		assert max(documents) == pytest.approx(fitted['max_relative_error'], abs=1e-4)
+		assert max(documents) <= MAX_RELATIVE_ERROR
+		assert statistics.mean(documents) <= MAX_MEAN_RELATIVE_ERROR
+		assert statistics.mean(lines) <= MAX_MEAN_RELATIVE_ERROR
+
+
+def test_openai_models_use_their_tokenizer(monkeypatch):
+	monkeypatch.setattr(tokens, '_openai_encoding', lambda model: _WordEncoding())
+	counter = TokenCounter('openai', 'gpt-4o')
+
+	assert counter.exact
+	assert counter.count('one two three') == 3
+
+
+def test_counts_are_cached():
+	counter = TokenCounter('anthropic', cache_size=2)
+	for text in ('a', 'b', 'a', 'c', 'b'):
+		counter.count(text)
+
+	# 'b' was evicted by 'c' after 'a' was used again
+	assert (counter.hits, counter.misses) == (1, 4)
+
+
+def test_count_message():
+	counter = TokenCounter('unknown', chars_per_token=1)
+	image = HumanMessage(content=[{'type': 'text', 'text': 'abcd'}, {'type': 'image_url', 'image_url': {'url': 'data:'}}])
+	call = AIMessage(content='', tool_calls=[{'name': 'act', 'args': {'i': 1}, 'id': 'call_1'}])
+
+	assert counter.count_message(image, image_tokens=100) == 104
+	assert counter.count_message(call) == len('act{"i":1}')
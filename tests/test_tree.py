@@ -0,0 +1,209 @@
+import gc
+import weakref
+
+import pytest
+
+from mlx_use.controller.service import Controller
+from mlx_use.mac.observer import kAXCreatedNotification, kAXTitleChangedNotification
+from mlx_use.mac.recorded import InMemoryBackend, RecordedElement, synthetic_application
+from mlx_use.mac.tree import MacUITreeBuilder
+
+PID = 1000
+
+
+@pytest.fixture
+def backend() -> InMemoryBackend:
+	return InMemoryBackend.from_dict(synthetic_application(pid=PID, n_nodes=300, seed=1, table_rows=120))
+
+
+@pytest.fixture
+async def builder(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	yield builder
+	await builder.close()
+
+
+def _window(backend: InMemoryBackend) -> RecordedElement:
+	return backend.applications[PID].children[0]
+
+
+def _indices(builder: MacUITreeBuilder) -> dict:
+	"""highlight index -> AX element of the last build"""
+	return {index: node._element for index, node in builder._element_cache.items() if isinstance(index, int)}
+
+
+def _buttons(builder: MacUITreeBuilder) -> list:
+	nodes = [builder._element_cache[index] for index in sorted(_indices(builder))]
+	return [node for node in nodes if node.role == 'AXButton' and node.enabled and 'AXPress' in node.actions]
+
+
+async def test_builds_tree_from_recording(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	root = await builder.build_tree(PID)
+
+	assert root is not None
+	assert root.children[0].role == 'AXWindow'
+	assert builder._element_cache
+	assert builder.stats.round_trips < builder.stats.unbatched_round_trips
+
+
+async def test_indices_survive_rebuilds(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	await builder.build_tree(PID)
+	before = _indices(builder)
+
+	await builder.build_tree(PID)
+	assert _indices(builder) == before
+
+	# A new element gets a fresh index; the others keep theirs even though document order shifted
+	window = _window(backend)
+	attributes = {'AXRole': 'AXButton', 'AXTitle': 'New', 'AXEnabled': True}
+	button = RecordedElement(id=f'{PID}:new', attributes=attributes, actions=['AXPress'], parent=window)
+	window.children.insert(1, button)
+	await builder.build_tree(PID)
+	after = _indices(builder)
+	assert after[max(before) + 1] is button
+	assert {index: element for index, element in after.items() if element is not button} == before
+
+	# A vanished element's index is not handed to another one
+	gone = next(index for index, element in before.items() if element.attributes.get('AXRole') == 'AXCheckBox')
+	backend.remove_element(before[gone])
+	await builder.build_tree(PID)
+	assert gone not in _indices(builder)
+	assert all(_indices(builder)[index] is element for index, element in before.items() if index != gone)
+
+
+async def test_incremental_patch_matches_full_rebuild(backend: InMemoryBackend):
+	incremental = MacUITreeBuilder(backend=backend, incremental=True)
+	full = MacUITreeBuilder(backend=backend)
+	await incremental.build_tree(PID)
+	await full.build_tree(PID)
+	window = _window(backend)
+
+	def retitle() -> None:
+		element = next(e for e in _indices(full).values() if 'AXTitle' in e.attributes and e is not window)
+		element.attributes['AXTitle'] = 'Renamed'
+		backend.post_notification(element, kAXTitleChangedNotification)
+
+	def add() -> None:
+		group = next(child for child in window.children if child.attributes['AXRole'] == 'AXGroup')
+		field = RecordedElement(
+			id=f'{PID}:field', attributes={'AXRole': 'AXTextField', 'AXValue': 'typed'}, actions=['AXSetValue'], parent=group
+		)
+		group.children.append(field)
+		backend.post_notification(field, kAXCreatedNotification)
+
+	def remove() -> None:
+		backend.remove_element(next(e for e in _indices(full).values() if e.attributes.get('AXRole') == 'AXTextField'))
+
+	for change in (retitle, add, remove):
+		change()
+		backend.reset_stats()
+		patched = await incremental.build_tree(PID)
+		patch_calls = backend.total_calls
+		backend.reset_stats()
+		rebuilt = await full.build_tree(PID)
+
+		assert patched.get_clickable_elements_string() == rebuilt.get_clickable_elements_string()
+		assert patch_calls < backend.total_calls / 10
+	await incremental.close()
+	await full.close()
+
+
+async def test_element_exists_reads_one_attribute(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	await builder.build_tree(PID)
+	index = max(_indices(builder))
+
+	assert await builder.element_exists(index)
+	assert not await builder.element_exists(index + 1000)
+
+	backend.remove_element(builder._element_cache[index]._element)
+	backend.reset_stats()
+	assert not await builder.element_exists(index)
+	assert backend.total_calls == 1
+
+
+async def test_batch_stops_when_next_target_is_gone(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	await builder.build_tree(PID)
+	first, second = _buttons(builder)[:2]
+	controller = Controller()
+	ActionModel = controller.registry.create_action_model()
+	actions = [
+		ActionModel(click_element={'index': node.highlight_index, 'action': 'AXPress'}) for node in (first, second)
+	]
+
+	backend.remove_element(second._element)
+	backend.reset_stats()
+	results = await controller.multi_act(actions, builder)
+
+	assert len(results) == 1 and not results[0].error
+	assert backend.performed == [(first._element.id, 'AXPress')]
+	# One click and one liveness check, no rebuild
+	assert backend.total_calls == 2
+
+
+async def test_timed_out_build_is_discarded(builder: MacUITreeBuilder, backend: InMemoryBackend):
+	await builder.build_tree(PID)
+	cache = builder._element_cache
+
+	backend.latency = 0.001
+	builder.call_timeout = 0.02
+	assert await builder.build_tree(PID) is None
+	# Wait for the abandoned build to finish on the worker
+	await builder.executor.wait_idle()
+
+	assert builder._element_cache is cache
+	assert builder._root is None
+
+	backend.latency = 0
+	builder.call_timeout = 30
+	assert await builder.build_tree(PID) is not None
+	assert _indices(builder) == {index: node._element for index, node in cache.items() if isinstance(index, int)}
+
+
+async def test_close_stops_worker_thread(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend)
+	await builder.build_tree(PID)
+	thread = builder.executor._thread
+
+	await builder.close()
+	thread.join(timeout=1)
+	assert not thread.is_alive()
+	assert builder._root is None
+
+	assert await builder.build_tree(PID) is not None
+	await builder.close()
+
+
+async def test_released_tree_is_freed_without_gc(builder: MacUITreeBuilder):
+	root = await builder.build_tree(PID)
+	alive = weakref.ref(root)
+	gc.disable()
+	try:
+		builder.cleanup()
+		del root
+		await builder.executor.wait_idle()
+		assert alive() is None
+	finally:
+		gc.enable()
+
+
+async def test_paging_rebuilds_only_the_table(backend: InMemoryBackend):
+	builder = MacUITreeBuilder(backend=backend, table_rows=20)
+	await builder.build_tree(PID)
+	table = next(node for node in builder._element_cache.values() if node.is_table)
+	controller = Controller()
+	ActionModel = controller.registry.create_action_model()
+
+	backend.reset_stats()
+	result = await controller.act(
+		ActionModel(page_table={'index': table.highlight_index, 'direction': 'next', 'start_row': None}), builder
+	)
+	paging_calls = backend.total_calls
+	paged = builder._root.get_clickable_elements_string()
+
+	assert result.extracted_content.endswith('rows 21-40 of 120')
+	assert 'row="21"' in paged and 'row="1"' not in paged
+	backend.reset_stats()
+	rebuilt = await builder.build_tree(PID)
+	assert rebuilt.get_clickable_elements_string() == paged
+	assert paging_calls < backend.total_calls / 2
+	await builder.close()